@@ -0,0 +1,124 @@
+# archiv.py — abgeschlossene Jahre in eigenen Datenbanken (verrechnung_<jahr>.db)
+#
+# Der Jahresabschluss (webapp.jahresabschluss, "flask jahresabschluss JAHR")
+# kopiert alle Transaktionen bis zum 31.12. 23:59:59 des Jahres in eine neue
+# Archivdatei neben der Datenbank und löscht sie danach im Hauptbuch. Für jedes
+# Konto mit Stand != 0 bleibt eine Zeile "[Saldovortrag JAHR]" (von
+# '[Saldovortrag]', datiert auf genau diesen Zeitpunkt) mit dem Stand als
+# stand_an_neu – balance_as_of, die Monatsabschlüsse und die stand_*-Kette
+# rechnen damit weiter wie vorher.
+#
+# Die Tabelle 'archive' im Hauptbuch verzeichnet die Dateien. Exporte und
+# Monatsbericht lesen über quellen(): für Zeiträume, die archivierte Jahre
+# berühren, werden die Archive der Reihe nach gelesen, jedes nur währenddessen
+# per ATTACH angehängt (lesen()) – so bleibt es bei höchstens einer
+# angehängten Datenbank, egal wie viele Jahre archiviert sind. Das Hauptbuch
+# folgt nur hinter dem letzten Abschluss (ohne Saldovorträge).
+# Archivdateien ändern sich nach dem Abschluss nie mehr; sie gehören trotzdem
+# in die Sicherung (/admin/download-db?archiv=JAHR).
+
+import contextlib
+import os
+import re
+
+SALDOVORTRAG = "[Saldovortrag]"
+
+class ArchivFehlt(Exception):
+    """Eine eingetragene Archivdatei ist nicht (mehr) vorhanden."""
+
+def datei_name(db_pfad, jahr):
+    """verrechnung.db -> verrechnung_2025.db (nur der Dateiname, liegt neben der DB)."""
+    stamm, endung = os.path.splitext(os.path.basename(db_pfad))
+    return f"{stamm}_{int(jahr)}{endung}"
+
+def datei_pfad(db_pfad, datei):
+    return os.path.join(os.path.dirname(os.path.abspath(db_pfad)), datei)
+
+def eintraege(conn):
+    """[(jahr, datei, bis)] aller Abschlüsse, aufsteigend."""
+    return conn.execute("SELECT jahr, datei, bis FROM archive ORDER BY jahr").fetchall()
+
+def _schema_kopieren(conn, schema):
+    """Tabelle transaktionen samt Indizes wie im Hauptbuch in 'schema' anlegen (ohne Trigger)."""
+    ddl = conn.execute("""
+        SELECT type, sql FROM main.sqlite_master
+        WHERE tbl_name = 'transaktionen' AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type = 'index'
+    """).fetchall()
+    for _, sql in ddl:
+        conn.execute(re.sub(r"^CREATE (TABLE|INDEX) ", rf"CREATE \1 {schema}.", sql))
+
+def schreiben(conn, pfad, bis):
+    """
+    Legt die Archivdatei 'pfad' an (darf nicht existieren) und kopiert alle
+    Transaktionen mit datum <= bis hinein, frühere Saldovorträge ausgenommen.
+    Schreibt nur die neue Datei, das Hauptbuch bleibt unverändert. Liefert
+    (Anzahl, höchste id) der kopierten Zeilen.
+    """
+    if os.path.exists(pfad):
+        raise FileExistsError(f"{pfad} existiert schon, ist aber nicht als Archiv eingetragen "
+                              f"(abgebrochener Abschluss?) – bitte prüfen und entfernen")
+    conn.execute("ATTACH DATABASE ? AS archiv_neu", (pfad,))
+    try:
+        _schema_kopieren(conn, "archiv_neu")
+        conn.execute("""
+            INSERT INTO archiv_neu.transaktionen
+            SELECT * FROM main.transaktionen
+            WHERE datum <= ? AND von IS NOT ?
+            ORDER BY id
+        """, (bis, SALDOVORTRAG))
+        ergebnis = conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM archiv_neu.transaktionen").fetchone()
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("DETACH DATABASE archiv_neu")
+        os.remove(pfad)
+        raise
+    conn.execute("DETACH DATABASE archiv_neu")
+    return ergebnis
+
+def quellen(conn, db_pfad, von=None, bis=None):
+    """
+    Woher die Transaktionen im Zeitraum [von, bis] (None = offen) zu lesen sind:
+    [(tabelle, bedingung, params, archivpfad)] in zeitlicher Reihenfolge, zu
+    lesen mit lesen(). Ohne berührte Archive nur das Hauptbuch wie bisher.
+    Wirft ArchivFehlt, bevor etwas gelesen wird.
+    """
+    abschluesse = eintraege(conn)
+    if not abschluesse or (von is not None and von > abschluesse[-1][2]):
+        return [("transaktionen", "", (), None)]
+    ergebnis = []
+    vorher = None
+    for jahr, datei, ende in abschluesse:
+        beruehrt = (von is None or von <= ende) and (bis is None or vorher is None or bis > vorher)
+        vorher = ende
+        if not beruehrt:
+            continue
+        pfad = datei_pfad(db_pfad, datei)
+        # ATTACH legte eine fehlende Datei stillschweigend leer an
+        if not os.path.exists(pfad):
+            raise ArchivFehlt(f"Archiv {jahr} fehlt: {pfad}")
+        ergebnis.append((f"archiv_{jahr}.transaktionen", "", (), pfad))
+    if bis is None or bis > vorher:
+        # Saldovorträge liegen genau auf dem letzten Abschluss und fallen hier heraus
+        ergebnis.append(("main.transaktionen", "datum > ?", (vorher,), None))
+    return ergebnis
+
+@contextlib.contextmanager
+def lesen(conn, quelle):
+    """
+    Hängt das Archiv einer Quelle für die Dauer des Blocks an conn an und danach
+    wieder ab (auch bei Fehlern oder abgebrochenem Stream). conn darf dabei
+    nicht in einer Transaktion stehen. Liefert den Tabellennamen.
+    """
+    tabelle, _, _, pfad = quelle
+    if pfad is None:
+        yield tabelle
+        return
+    schema = tabelle.split(".", 1)[0]
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (pfad,))
+    try:
+        yield tabelle
+    finally:
+        conn.execute(f"DETACH DATABASE {schema}")
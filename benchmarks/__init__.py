@@ -0,0 +1,7 @@
+# benchmarks — Messungen für die heißen Pfade der App
+#
+#   python -m benchmarks.ledger ziel.db [...]      synthetisches Hauptbuch erzeugen
+#   python -m benchmarks.run [--json datei] [...]  Hauptbuch erzeugen und messen
+#
+# Aufruf aus dem Projektordner. bench_brotpreis.py und bench_login.py laufen
+# weiterhin als einzelne Skripte.
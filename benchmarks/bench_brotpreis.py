@@ -0,0 +1,67 @@
+# bench_brotpreis.py — Preis-Extraktion: BeautifulSoup (bisheriger Weg) gegen brotpreis.PreisExtraktor
+#
+#   python benchmarks/bench_brotpreis.py [--runden 50]
+#
+# Misst je Fixture die Zeit pro Aufruf und die Spitzen-Allokation (tracemalloc)
+# und prüft, dass beide Wege denselben Preis liefern.
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import brotpreis
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def preis_bs4(html):
+    """Der alte Weg aus brotpreis_refresh(): kompletter Baum, get_text(), eine Regex."""
+    text = BeautifulSoup(html, "html.parser").get_text(" ", strip=True)
+    m = re.search(r"(\d+[.,]\d+)\s*€\s*(?:/|pro|je)\s*(?:1\s*)?kg", text, re.IGNORECASE)
+    if not m:
+        return None
+    return float(m.group(1).replace(".", "").replace(",", "."))
+
+def messen(funktion, html, runden):
+    funktion(html)  # Aufwärmen (und beim Extraktor: Selektor merken)
+    start = time.perf_counter()
+    for _ in range(runden):
+        ergebnis = funktion(html)
+    dauer = (time.perf_counter() - start) / runden
+    tracemalloc.start()
+    funktion(html)
+    _, spitze = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ergebnis, dauer, spitze
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runden", type=int, default=50)
+    args = parser.parse_args()
+
+    wege = [
+        ("bs4", preis_bs4),
+        ("extraktor (kalt)", lambda html: brotpreis.PreisExtraktor().preis(html)),
+        ("extraktor (Selektor)", brotpreis.PreisExtraktor().preis),
+    ]
+    print(f"{'Fixture':32} {'Weg':22} {'Preis':>7} {'ms/Aufruf':>10} {'Spitze KiB':>11}")
+    for name in sorted(os.listdir(FIXTURES)):
+        with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+            html = f.read()
+        erwartet = None
+        for i, (weg, funktion) in enumerate(wege):
+            preis, dauer, spitze = messen(funktion, html, args.runden)
+            if i == 0:
+                erwartet = preis
+            elif preis != erwartet:
+                print(f"ABWEICHUNG bei {name}: {weg} liefert {preis}, bs4 {erwartet}")
+                sys.exit(1)
+            print(f"{name:32} {weg:22} {str(preis):>7} {dauer * 1000:10.2f} {spitze / 1024:11.0f}")
+
+if __name__ == "__main__":
+    main()
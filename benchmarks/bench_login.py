@@ -0,0 +1,45 @@
+# bench_login.py — Login-Durchsatz je Worker bei gewählten KDF-Kosten
+#
+#   python benchmarks/bench_login.py [--dauer 3] [--methode scrypt:16384:8:1 ...]
+#
+# Ein gunicorn-Sync-Worker prüft ein Passwort nach dem anderen; gemessen wird
+# daher einfädig. Ohne --methode: PASSWORT_METHODE plus zwei Vergleichswerte.
+# "kalt" = echter KDF-Lauf (erster Login, falsches Passwort, Angreifer),
+# "Cache" = erneuter Login desselben Mitglieds innerhalb der Cache-Lebensdauer.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import passwoerter
+
+def durchsatz(funktion, dauer):
+    anzahl = 0
+    start = time.perf_counter()
+    while True:
+        funktion()
+        anzahl += 1
+        vergangen = time.perf_counter() - start
+        if vergangen >= dauer:
+            return anzahl / vergangen
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dauer", type=float, default=3.0, help="Sekunden je Messung")
+    parser.add_argument("--methode", action="append")
+    args = parser.parse_args()
+    methoden = args.methode or [passwoerter.PASSWORT_METHODE, "scrypt:16384:8:1", "pbkdf2:sha256:600000"]
+
+    print(f"{'Methode':26} {'kalt Logins/s':>14} {'ms/Login':>9} {'Cache Logins/s':>15}")
+    for methode in dict.fromkeys(methoden):
+        gespeichert = passwoerter.hash_erzeugen("geheim", methode)
+        passwoerter.PASSWORT_METHODE = methode
+        kalt = durchsatz(lambda: passwoerter.pruefen("bench", gespeichert, "falsch"), args.dauer)
+        passwoerter.pruefen("bench", gespeichert, "geheim")
+        cache = durchsatz(lambda: passwoerter.pruefen("bench", gespeichert, "geheim"), args.dauer)
+        print(f"{methode:26} {kalt:14.1f} {1000 / kalt:9.1f} {cache:15.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# check_archiv.py — Jahresabschluss über mehr Jahre, als SQLite gleichzeitig anhängen kann
+#
+#   python benchmarks/check_archiv.py [--jahre 12]
+#
+# Erzeugt ein kleines Hauptbuch über --jahre + 1 Jahre (benchmarks/ledger.py),
+# schließt alle vergangenen Jahre einzeln ab und vergleicht danach Export und
+# Monatsbericht über den ganzen Zeitraum mit dem Stand vor den Abschlüssen.
+# Prüft außerdem, dass keine Verbindung im Pool ein Archiv angehängt behält –
+# auch nicht nach einem abgebrochenen Export. Endet mit Status 1 bei Abweichung.
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import webapp
+from benchmarks import ledger
+
+def angehaengt():
+    """Namen angehängter Datenbanken aller Verbindungen im Pool (ohne main/temp)."""
+    return {name for conn in webapp._pool for _, name, _ in conn.execute("PRAGMA database_list")} - {"main", "temp"}
+
+def abrufen(client, pfade):
+    ergebnis = {}
+    for pfad in pfade:
+        resp = client.get(pfad)
+        ergebnis[pfad] = (resp.status_code, resp.get_data(as_text=True))
+    return ergebnis
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jahre", type=int, default=12, help="abzuschließende Jahre (SQLite-Grenze: 10 angehängte)")
+    args = parser.parse_args()
+
+    heute = datetime.now()
+    ende = webapp.previous_month_key(heute)
+    fehler = []
+    with tempfile.TemporaryDirectory(prefix="verrechnung-archiv-") as ordner:
+        pfad = os.path.join(ordner, "verrechnung.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            info = ledger.erzeugen(pfad, seed=1, konten=10, monate=12 * args.jahre + heute.month - 1,
+                                   buchungen=30, ende=ende)
+        print(f"Hauptbuch: {info['transaktionen']} Zeilen, {info['von']} bis {info['ende']}")
+        webapp.DB_PATH = pfad
+
+        admin = webapp.app.test_client()
+        mitglied = webapp.app.test_client()
+        admin.post("/login", data={"benutzer": "admin", "passwort": ledger.PASSWORT})
+        mitglied.post("/login", data={"benutzer": "mitglied001", "passwort": ledger.PASSWORT})
+        zeitraum = f"from={info['von']}-01&to={heute:%Y-%m-%d}"
+        pfade_admin = ["/export", "/export?format=json", f"/export_monatsbericht?{zeitraum}"]
+        pfade_mitglied = ["/export", f"/export_monatsbericht?{zeitraum}"]
+        vorher = abrufen(admin, pfade_admin), abrufen(mitglied, pfade_mitglied)
+
+        conn = webapp.db_connection()
+        erstes = int(info["von"][:4])
+        for jahr in range(erstes, heute.year):
+            with contextlib.redirect_stdout(io.StringIO()):
+                webapp.jahresabschluss(conn, jahr)
+        archive = conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+        conn.close()
+        print(f"{archive} Jahre archiviert")
+        if archive <= 10:
+            fehler.append(f"nur {archive} Archive – die Grenze von 10 wird nicht überschritten")
+
+        nachher = abrufen(admin, pfade_admin), abrufen(mitglied, pfade_mitglied)
+        for rolle, alt, neu in (("admin", vorher[0], nachher[0]), ("mitglied", vorher[1], nachher[1])):
+            for pfad_http in alt:
+                if neu[pfad_http][0] != 200:
+                    fehler.append(f"{rolle} {pfad_http}: Status {neu[pfad_http][0]}")
+                elif alt[pfad_http] != neu[pfad_http]:
+                    fehler.append(f"{rolle} {pfad_http}: Ausgabe weicht ab")
+                else:
+                    print(f"gleich: {rolle} {pfad_http}")
+        if angehaengt():
+            fehler.append(f"nach dem Export noch angehängt: {sorted(angehaengt())}")
+
+        # Abgebrochener Download: der Stream wird mitten im ersten Archiv geschlossen
+        resp = admin.get("/export", buffered=False)
+        next(iter(resp.response))
+        resp.close()
+        if angehaengt():
+            fehler.append(f"nach abgebrochenem Export noch angehängt: {sorted(angehaengt())}")
+
+    for f in fehler:
+        print(f"FEHLER: {f}")
+    if fehler:
+        sys.exit(1)
+    print("ok")
+
+if __name__ == "__main__":
+    main()
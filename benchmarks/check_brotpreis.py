@@ -0,0 +1,148 @@
+# check_brotpreis.py — Aktualisierung des Brotpreises gegen einen lokalen Stub-Server
+#
+#   python benchmarks/check_brotpreis.py
+#
+# Startet einen kleinen HTTP-Server (ETag, If-None-Match -> 304, umschaltbar auf
+# neue Seite, Seite ohne Kilopreis und Fehler 503), lässt BROTPREIS_URL darauf
+# zeigen und führt den echten Weg aus: Aktualisierer -> brotpreis_aktualisieren()
+# -> settings in einer temporären Datenbank. Prüft außerdem einen Preis, der
+# genau auf einer Häppchengrenze des Parsers liegt. Endet mit Status 1 bei Abweichung.
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SEITEN = {
+    "v1": "<html><body><div class='preis'>Bio-Dinkelbrot <b>9,12 € / kg</b></div></body></html>",
+    "v2": "<html><body><div class='preis'>Bio-Dinkelbrot <b>9,57 € pro kg</b></div></body></html>",
+    "ohne": "<html><body><p>Unsere Brote – Preise im Laden</p></body></html>",
+}
+
+class Stub(BaseHTTPRequestHandler):
+    seite = "v1"       # aktuelle Version; "fehler" = 503
+    anfragen = []      # (If-None-Match, Antwortstatus) je Abruf
+
+    def do_GET(self):
+        bedingung = self.headers.get("If-None-Match")
+        if Stub.seite == "fehler":
+            status = 503
+        elif bedingung == f'"{Stub.seite}"':
+            status = 304
+        else:
+            status = 200
+        Stub.anfragen.append((bedingung, status))
+        self.send_response(status)
+        if status == 200:
+            body = SEITEN[Stub.seite].encode("utf-8")
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", f'"{Stub.seite}"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+# brotpreis.py liest die Adresse beim Import
+os.environ["BROTPREIS_URL"] = f"http://127.0.0.1:{server.server_port}/produkt"
+os.environ["NO_PROXY"] = "127.0.0.1"
+
+import brotpreis
+import webapp
+
+fehler = []
+
+def pruefen(bedingung, text):
+    print(("ok:     " if bedingung else "FEHLER: ") + text)
+    if not bedingung:
+        fehler.append(text)
+
+def gespeichert(key):
+    conn = webapp.db_connection()
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def haeppchengrenze():
+    """Seite, bei der brotpreis.HAPPEN direkt hinter "Grundpreis 1" teilt."""
+    kopf = "<html><body><!--"
+    vor = "--><div id='x'><p>Dinkelbrot</p><span class='preis'>Grundpreis 1"
+    html = kopf + "x" * (brotpreis.HAPPEN - len(kopf) - len(vor)) + vor + "2,50 €/kg</span></div></body></html>"
+    assert html[brotpreis.HAPPEN - 1:brotpreis.HAPPEN + 1] == "12"
+    return html
+
+def main():
+    html = haeppchengrenze()
+    extraktor = brotpreis.PreisExtraktor()
+    preis = extraktor.preis(html)
+    pruefen(preis == 12.5, f"Preis über Häppchengrenze: {preis}")
+    preis = extraktor.preis(html)
+    pruefen(preis == 12.5, f"Preis über Häppchengrenze mit gemerktem Selektor {extraktor.selektor}: {preis}")
+
+    with tempfile.TemporaryDirectory(prefix="verrechnung-brotpreis-") as ordner:
+        webapp.DB_PATH = os.path.join(ordner, "verrechnung.db")
+        webapp.erstelle_datenbank()
+
+        status = []
+        aktualisierer = brotpreis.Aktualisierer(lambda: status.append(webapp.brotpreis_aktualisieren()),
+                                                min_abstand=0)
+        def lauf():
+            Stub.anfragen.clear()
+            status.clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                aktualisierer.anstossen()
+                aktualisierer.warten(10)
+            return status[0] if status else None, Stub.anfragen[0] if Stub.anfragen else None
+
+        s, anfrage = lauf()
+        pruefen(s == brotpreis.NEU and anfrage == (None, 200), f"200 ohne Validator: {s}, {anfrage}")
+        pruefen(float(gespeichert(webapp.BROTPREIS_KEY)) == 9.12, "Preis 9,12 gespeichert")
+        pruefen(gespeichert(webapp.BROTPREIS_ETAG_KEY) == '"v1"', "ETag \"v1\" gespeichert")
+
+        s, anfrage = lauf()
+        pruefen(s == brotpreis.UNVERAENDERT and anfrage == ('"v1"', 304), f"304 mit If-None-Match: {s}, {anfrage}")
+        pruefen(float(gespeichert(webapp.BROTPREIS_KEY)) == 9.12, "Preis nach 304 unverändert")
+
+        Stub.seite = "v2"
+        s, anfrage = lauf()
+        pruefen(s == brotpreis.NEU and anfrage == ('"v1"', 200), f"200 nach Änderung: {s}, {anfrage}")
+        pruefen(float(gespeichert(webapp.BROTPREIS_KEY)) == 9.57, "neuer Preis 9,57 gespeichert")
+        pruefen(gespeichert(webapp.BROTPREIS_ETAG_KEY) == '"v2"', "ETag \"v2\" gespeichert")
+
+        Stub.seite = "fehler"
+        s, anfrage = lauf()
+        pruefen(s == brotpreis.FEHLER and anfrage == ('"v2"', 503), f"Fehler 503: {s}, {anfrage}")
+        pruefen(float(gespeichert(webapp.BROTPREIS_KEY)) == 9.57, "Preis nach Fehler unverändert")
+        pruefen(gespeichert(webapp.BROTPREIS_ETAG_KEY) == '"v2"', "ETag nach Fehler behalten")
+
+        Stub.seite = "ohne"
+        s, anfrage = lauf()
+        pruefen(s == brotpreis.KEIN_TREFFER, f"Seite ohne Kilopreis: {s}, {anfrage}")
+        pruefen(float(gespeichert(webapp.BROTPREIS_KEY)) == 9.57, "Preis ohne Treffer unverändert")
+
+        # Mindestabstand: ein zweiter Anstoß direkt danach startet keinen Abruf
+        gebremst = brotpreis.Aktualisierer(lambda: None, min_abstand=60)
+        erster = gebremst.anstossen()
+        gebremst.warten(10)
+        pruefen(erster and not gebremst.anstossen(), "zweiter Anstoß innerhalb min_abstand ignoriert")
+
+    server.shutdown()
+    if fehler:
+        sys.exit(1)
+    print("ok")
+
+if __name__ == "__main__":
+    main()
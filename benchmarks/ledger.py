@@ -0,0 +1,236 @@
+# ledger.py — synthetisches Hauptbuch für die Benchmarks
+#
+#   python -m benchmarks.ledger ziel.db [--seed 1] [--konten 60] [--monate 24]
+#                                       [--buchungen 1500] [--ende 2026-10] [--offene-monate 1]
+#
+# Legt eine neue Datenbank mit dem Schema der App an und füllt sie Monat für
+# Monat nach deren Regeln: Überweisungen mit 5 % Kulturbeitrag-Zeile,
+# fortgeschriebene stand_*-Spalten, Überziehungsgrenze aus dem Jahreseinkommen,
+# Förderungen und Ausgaben des Kulturfonds und die Parkgebühr über apply_parkgebuehr_catchup().
+# Gleicher Seed, gleiche Parameter und gleiches --ende ergeben dasselbe Hauptbuch.
+# Die letzten --offene-monate Monate bleiben ohne Parkgebühr, damit der Nachhol-Lauf
+# etwas zu tun hat.
+
+import argparse
+import calendar
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import passwoerter
+import webapp
+import zehntel
+
+# Alle Benutzer (admin, kulturfonds, mitglied001 …) bekommen dieses Passwort
+PASSWORT = "bench"
+KULTURFONDS = "Kulturfonds"
+
+BESCHREIBUNGEN = ("Brot", "Gemüsekiste", "Milch und Käse", "Eier", "Mittagstisch", "Holz",
+                  "Mithilfe Ernte", "Reparatur", "Kinderbetreuung", "Pflege", "Energie",
+                  "Miete Werkstatt", "Fahrdienst")
+AUSGABEN = ("Konzert", "Lesung", "Theater", "Sommerfest")
+
+# Wer zahlt, wer bekommt: Betriebe nehmen mehr ein, Privatkonten zahlen mehr
+GEWICHT_ZAHLER = {"privat": 3, "betrieb": 2, "verein": 1}
+GEWICHT_EMPFAENGER = {"privat": 1, "betrieb": 5, "verein": 2}
+VERSUCHE_JE_BUCHUNG = 5
+
+def monate_bis(ende, anzahl):
+    monate = [ende]
+    while len(monate) < anzahl:
+        monate.insert(0, webapp.sub_month(monate[0]))
+    return monate
+
+def konten_anlegen(c, anzahl):
+    """anzahl Mitgliedskonten plus Kulturfonds; je Privatkonto ein Benutzer."""
+    typen = ["verein" if i % 25 == 24 else "betrieb" if i % 5 == 4 else "privat" for i in range(anzahl)]
+    privat = typen.count("privat")
+    passwort = passwoerter.hash_erzeugen(PASSWORT)
+    zaehler = {}
+    konten = []
+    for i, typ in enumerate(typen):
+        zaehler[typ] = zaehler.get(typ, 0) + 1
+        nr = zaehler[typ]
+        name = {"privat": "Privatkonto", "betrieb": "Betrieb", "verein": "Verein"}[typ] + f" {nr:03d}"
+        # Betriebe und Vereine gehören reihum den Mitgliedern
+        besitzer = f"mitglied{(nr - 1) % privat + 1 if typ != 'privat' else nr:03d}"
+        konten.append((name, typ, besitzer))
+    konten.append((KULTURFONDS, "fonds", "kulturfonds"))
+
+    for name, typ, besitzer in konten:
+        c.execute("INSERT INTO konten (name, typ, punkte, besitzer) VALUES (?, ?, 0, ?)", (name, typ, besitzer))
+        c.execute("INSERT OR IGNORE INTO konten_benutzer (konto_id, benutzer_login) VALUES (?, ?)",
+                  (c.lastrowid, besitzer))
+    benutzer = sorted({b for _, _, b in konten} | {"admin"})
+    c.executemany("INSERT OR REPLACE INTO benutzer (benutzer, passwort) VALUES (?, ?)",
+                  [(b, passwort) for b in benutzer])
+    return konten
+
+def _zeitpunkte(rng, monat, anzahl):
+    y, m = map(int, monat.split("-"))
+    tage = calendar.monthrange(y, m)[1]
+    # 06:00–22:00, damit die Parkgebühr (00:05 am Ersten) davor liegt
+    return sorted(f"{monat}-{rng.randint(1, tage):02d} {rng.randint(6, 21):02d}:"
+                  f"{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}" for _ in range(anzahl))
+
+def erzeugen(pfad, seed=1, konten=60, monate=24, buchungen=1500, ende=None, offene_monate=1):
+    """
+    Schreibt ein neues Hauptbuch nach 'pfad' (darf nicht existieren).
+    'buchungen' sind Überweisungen je Monat (die Kulturbeitrag-Zeilen kommen dazu),
+    'ende' ist der letzte Monat ('YYYY-MM', Standard: laufender Monat).
+    Liefert eine Zusammenfassung für die Ergebnisdatei.
+    """
+    if os.path.exists(pfad):
+        raise FileExistsError(pfad)
+    rng = random.Random(seed)
+    ende = ende or webapp.month_key(datetime.now())
+    alle_monate = monate_bis(ende, monate)
+    gebuehren_bis = alle_monate[-1]
+    for _ in range(offene_monate + 1):
+        gebuehren_bis = webapp.sub_month(gebuehren_bis)
+
+    alt_pfad = webapp.DB_PATH
+    webapp.DB_PATH = pfad
+    try:
+        webapp.erstelle_datenbank()
+        conn = webapp.db_connection()
+        c = conn.cursor()
+        konto_liste = konten_anlegen(c, konten)
+        c.execute("INSERT OR REPLACE INTO systemstatus (key, value) VALUES ('last_fee_month', ?)",
+                  (webapp.sub_month(alle_monate[0]),))
+        conn.commit()
+
+        kulturfonds = KULTURFONDS
+        mitglieder = [(name, typ) for name, typ, _ in konto_liste if typ != "fonds"]
+        namen = [name for name, _ in mitglieder]
+        gewichte_zahler = [GEWICHT_ZAHLER[typ] for _, typ in mitglieder]
+        gewichte_empfaenger = [GEWICHT_EMPFAENGER[typ] for _, typ in mitglieder]
+        start_rahmen = zehntel.aus_punkten(webapp.get_config_value(conn, "overdraft_start_allowance", 20))
+        prozent = webapp.get_config_value(conn, "overdraft_income_percent", 10)
+
+        punkte = {name: 0 for name, _, _ in konto_liste}
+        einkommen = {}  # (konto, jahr) -> Zehntel, wie einkommen_jahr
+        abgelehnt = 0
+
+        for monat in alle_monate:
+            jahr = monat[:4]
+            zeilen = []
+            aktiv = {}
+            for datum in _zeitpunkte(rng, monat, buchungen):
+                betrag = max(1, min(5000, round(rng.lognormvariate(math.log(40), 0.9))))
+                for _ in range(VERSUCHE_JE_BUCHUNG):
+                    von = rng.choices(namen, gewichte_zahler)[0]
+                    an = rng.choices(namen, gewichte_empfaenger)[0]
+                    einnahmen = einkommen.get((von, jahr), 0)
+                    limit = zehntel.anteil(einnahmen, prozent) if einnahmen > 0 else start_rahmen
+                    if von != an and punkte[von] - betrag >= -limit:
+                        break
+                else:
+                    abgelehnt += 1
+                    continue
+
+                # wie post_transfer(): Überweisung, dann Kulturbeitrag an den Fonds
+                kulturbeitrag = zehntel.anteil(betrag, 5)
+                netto = betrag - kulturbeitrag
+                von_alt, an_alt = punkte[von], punkte[an]
+                punkte[von] -= betrag
+                punkte[an] += netto
+                zeilen.append((von, an, betrag, kulturbeitrag, betrag, netto, rng.choice(BESCHREIBUNGEN),
+                               datum, von_alt, punkte[von], an_alt, punkte[an]))
+                kultur_alt = punkte[kulturfonds]
+                punkte[kulturfonds] += kulturbeitrag
+                zeilen.append((von, kulturfonds, kulturbeitrag, 0, kulturbeitrag, kulturbeitrag,
+                               "[Kulturbeitrag automatisch]", datum,
+                               punkte[von], punkte[von], kultur_alt, punkte[kulturfonds]))
+                einkommen[(an, jahr)] = einkommen.get((an, jahr), 0) + betrag
+                aktiv[von] = aktiv[an] = aktiv[kulturfonds] = datum
+
+            # Monatsende: der Kulturfonds fördert einige Mitglieder ([Kulturfonds…] zählt
+            # nicht als Einkommen) und hat jedes Quartal eine Ausgabe
+            tag = webapp.eom_cutoff(monat)[:11]
+            if punkte[kulturfonds] > 0:
+                rest = punkte[kulturfonds] * 9 // 10
+                anzahl = rng.randint(2, 5)
+                for i in range(anzahl):
+                    if rest <= 0:
+                        break
+                    betrag = rest if i == anzahl - 1 else max(1, rest // 2)
+                    rest -= betrag
+                    an = rng.choices(namen, gewichte_zahler)[0]
+                    datum = f"{tag}22:{i:02d}:00"
+                    kultur_alt, an_alt = punkte[kulturfonds], punkte[an]
+                    punkte[kulturfonds] -= betrag
+                    punkte[an] += betrag
+                    zeilen.append((kulturfonds, an, betrag, 0, betrag, betrag, "[Kulturfonds] Förderung",
+                                   datum, kultur_alt, punkte[kulturfonds], an_alt, punkte[an]))
+                    aktiv[an] = aktiv[kulturfonds] = datum
+            if int(monat[5:]) % 3 == 0:
+                betrag = min(punkte[kulturfonds], rng.randint(50, 300))
+                if betrag > 0:
+                    datum = f"{tag}23:00:00"
+                    alt = punkte[kulturfonds]
+                    punkte[kulturfonds] -= betrag
+                    zeilen.append((kulturfonds, "[Ausgabe]", betrag, 0, betrag, betrag, rng.choice(AUSGABEN),
+                                   datum, alt, punkte[kulturfonds], 0, 0))
+                    aktiv[kulturfonds] = datum
+
+            c.execute("BEGIN IMMEDIATE")
+            c.executemany(webapp.TRANSAKTION_INSERT_SQL, zeilen)
+            c.executemany("UPDATE konten SET punkte = ?, letzte_aktivitaet = ? WHERE name = ?",
+                          [(punkte[name], datum, name) for name, datum in aktiv.items()])
+            conn.commit()
+
+            if monat <= gebuehren_bis:
+                # Parkgebühr wie der nächtliche Job in der ersten Nacht des Folgemonats
+                y, m = map(int, webapp.add_month(monat).split("-"))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    webapp.apply_parkgebuehr_catchup(now=datetime(y, m, 1, 0, 5))
+                c.execute("SELECT name, punkte FROM konten")
+                punkte = dict(c.fetchall())
+
+        webapp.einkommen_neu_aufbauen(conn)
+        c.execute("SELECT COUNT(*) FROM transaktionen")
+        zeilen_gesamt = c.fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+    finally:
+        webapp.DB_PATH = alt_pfad
+
+    return {
+        "seed": seed,
+        "konten": konten,
+        "monate": monate,
+        "buchungen_je_monat": buchungen,
+        "von": alle_monate[0],
+        "ende": ende,
+        "offene_monate": offene_monate,
+        "transaktionen": zeilen_gesamt,
+        "abgelehnt": abgelehnt,
+    }
+
+def parameter_hinzufuegen(parser):
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--konten", type=int, default=60, help="Mitgliedskonten (ohne Kulturfonds)")
+    parser.add_argument("--monate", type=int, default=24)
+    parser.add_argument("--buchungen", type=int, default=1500, help="Überweisungen je Monat")
+    parser.add_argument("--ende", help="letzter Monat YYYY-MM (Standard: laufender Monat)")
+    parser.add_argument("--offene-monate", type=int, default=1,
+                        help="so viele Monate vor --ende bleiben ohne Parkgebühr")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ziel")
+    parameter_hinzufuegen(parser)
+    args = parser.parse_args()
+    info = erzeugen(args.ziel, seed=args.seed, konten=args.konten, monate=args.monate,
+                    buchungen=args.buchungen, ende=args.ende, offene_monate=args.offene_monate)
+    for schluessel, wert in info.items():
+        print(f"{schluessel:20} {wert}")
+
+if __name__ == "__main__":
+    main()
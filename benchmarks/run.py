@@ -0,0 +1,234 @@
+# run.py — Messlauf über die heißen Pfade auf einem synthetischen Hauptbuch
+#
+#   python -m benchmarks.run [--seed 1] [--konten 60] [--monate 24] [--buchungen 1500]
+#                            [--wiederholungen 10] [--json ergebnis.json] [--vergleich alt.json]
+#
+# Erzeugt das Hauptbuch (benchmarks/ledger.py) in einem temporären Ordner und misst
+# direkte Funktionsaufrufe sowie Seiten über den Flask-Testclient. Mit --json
+# werden Parameter, Commit und Messwerte maschinenlesbar geschrieben; --vergleich
+# stellt die Bestzeiten einer früheren Ergebnisdatei daneben (das Minimum schwankt
+# weniger als der Median) und endet mit Status 1, wenn ein Fall um mehr als
+# --schwelle langsamer geworden ist. Verglichen wird nur bei gleichem Hauptbuch
+# sinnvoll, also gleichen Parametern und gleichem --ende.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import webapp
+from benchmarks import ledger
+
+BASIS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def kennzahlen(zeiten):
+    return {
+        "wiederholungen": len(zeiten),
+        "min_ms": round(min(zeiten), 3),
+        "median_ms": round(statistics.median(zeiten), 3),
+        "mittel_ms": round(statistics.fmean(zeiten), 3),
+        "max_ms": round(max(zeiten), 3),
+    }
+
+def messen(funktion, wiederholungen):
+    funktion()  # Aufwärmen (Seiten-Cache, Einstellungs-Cache, Vorlagen)
+    zeiten = []
+    for _ in range(wiederholungen):
+        start = time.perf_counter()
+        funktion()
+        zeiten.append((time.perf_counter() - start) * 1000)
+    return kennzahlen(zeiten)
+
+def commit_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASIS, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        geaendert = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASIS,
+                                   capture_output=True, text=True, check=True).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, geaendert
+
+def anmelden(client, benutzer):
+    resp = client.post("/login", data={"benutzer": benutzer, "passwort": ledger.PASSWORT})
+    if resp.status_code != 302:
+        raise SystemExit(f"Login als {benutzer} fehlgeschlagen ({resp.status_code})")
+
+def abrufen(client, pfad):
+    def aufruf():
+        resp = client.get(pfad)
+        # gestreamte Antworten vollständig lesen, sonst misst man nur den Kopf
+        resp.get_data()
+        if resp.status_code != 200:
+            raise SystemExit(f"GET {pfad}: Status {resp.status_code}")
+    return aufruf
+
+def faelle_direkt(info, mitglied_konten):
+    """Direkte Aufrufe auf einer eigenen Verbindung (ohne Request)."""
+    conn = webapp.db_connection()
+    c = conn.cursor()
+    c.execute("SELECT name FROM konten")
+    alle_konten = [r[0] for r in c.fetchall()]
+    alle_monate = ledger.monate_bis(info["ende"], info["monate"])
+    mitte = webapp.eom_cutoff(alle_monate[len(alle_monate) // 2])
+
+    faelle = [
+        ("balance_as_of (alle Konten)",
+         lambda: [webapp.balance_as_of(conn, k, mitte) for k in alle_konten]),
+        ("berechne_monatsabschluesse (alle Monate)",
+         lambda: webapp.berechne_monatsabschluesse(conn, alle_monate)),
+        ("overdraft_limit (alle Konten)",
+         lambda: [webapp.overdraft_limit(conn, k) for k in alle_konten]),
+        ("has_positive_balance (alle Konten)",
+         lambda: [webapp.has_positive_balance(conn, k) for k in alle_konten]),
+        ("_select_konto_verlauf (Mitglied)",
+         lambda: webapp._select_konto_verlauf(conn.cursor(), mitglied_konten, 10,
+                                              ohne_beschreibung="[Kulturbeitrag automatisch]")),
+        ("_select_konto_verlauf (Kulturfonds)",
+         lambda: webapp._select_konto_verlauf(conn.cursor(), [ledger.KULTURFONDS], 20)),
+    ]
+    # Hin und zurück, damit die Stände (und die Überziehungsgrenze) gleich bleiben
+    richtung = [0]
+    def ueberweisung():
+        von, an = mitglied_konten[richtung[0] % 2], mitglied_konten[(richtung[0] + 1) % 2]
+        richtung[0] += 1
+        webapp.post_transfer(conn, von, an, 1, "Benchmark")
+    if len(mitglied_konten) >= 2:
+        faelle.append(("post_transfer", ueberweisung))
+    return conn, faelle
+
+def parkgebuehr_messen(vorlage, ordner, info, wiederholungen):
+    """Nachhol-Lauf der offenen Monate, jedes Mal auf einer frischen Kopie."""
+    jetzt = datetime.strptime(webapp.eom_cutoff(info["ende"]), "%Y-%m-%d %H:%M:%S")
+    kopie = os.path.join(ordner, "parkgebuehr.db")
+    alt_pfad = webapp.DB_PATH
+    zeiten = []
+    try:
+        webapp.DB_PATH = kopie
+        for _ in range(wiederholungen + 1):
+            shutil.copyfile(vorlage, kopie)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                webapp.apply_parkgebuehr_catchup(now=jetzt)
+            zeiten.append((time.perf_counter() - start) * 1000)
+    finally:
+        webapp.DB_PATH = alt_pfad
+    return kennzahlen(zeiten[1:])  # erster Lauf = Aufwärmen
+
+def faelle_http(client_admin, client_mitglied, info, mitglied_konto):
+    von = ledger.monate_bis(info["ende"], info["monate"])[0] + "-01"
+    bis = webapp.eom_cutoff(info["ende"])[:10]
+    zeitraum = f"from={von}&to={bis}"
+    return [
+        ("GET /start (admin)", client_admin, "/start"),
+        ("GET /start (Mitglied)", client_mitglied, "/start"),
+        ("GET /export (admin, alles CSV)", client_admin, "/export"),
+        ("GET /export (admin, JSON-Seite 500)", client_admin, "/export?format=json&limit=500"),
+        ("GET /export (Mitglied, Konto CSV)", client_mitglied, f"/export?konto={mitglied_konto}"),
+        ("GET /export_monatsbericht (admin)", client_admin, f"/export_monatsbericht?{zeitraum}"),
+        ("GET /export_monatsbericht (Mitglied)", client_mitglied, f"/export_monatsbericht?{zeitraum}"),
+    ]
+
+def vergleichen(ergebnis, alt_pfad, schwelle):
+    with open(alt_pfad, encoding="utf-8") as f:
+        frueher = json.load(f)
+    if frueher["hauptbuch"] != ergebnis["hauptbuch"]:
+        print(f"Achtung: {alt_pfad} wurde mit einem anderen Hauptbuch gemessen")
+    alt = {e["fall"]: e for e in frueher["ergebnisse"]}
+    langsamer = []
+    print()
+    print(f"{'Fall (Minimum)':44} {'alt ms':>9} {'neu ms':>9} {'Faktor':>7}")
+    for e in ergebnis["ergebnisse"]:
+        vorher = alt.get(e["fall"])
+        if vorher is None or not vorher["min_ms"]:
+            continue
+        faktor = e["min_ms"] / vorher["min_ms"]
+        markierung = "  <- langsamer" if faktor > schwelle else ""
+        if faktor > schwelle:
+            langsamer.append(e["fall"])
+        print(f"{e['fall']:44} {vorher['min_ms']:9.2f} {e['min_ms']:9.2f} {faktor:7.2f}{markierung}")
+    return langsamer
+
+def main():
+    parser = argparse.ArgumentParser()
+    ledger.parameter_hinzufuegen(parser)
+    parser.add_argument("--wiederholungen", type=int, default=10)
+    parser.add_argument("--json", help="Ergebnisse als JSON in diese Datei")
+    parser.add_argument("--vergleich", help="frühere Ergebnisdatei (--json) zum Vergleich")
+    parser.add_argument("--schwelle", type=float, default=1.25,
+                        help="ab diesem Faktor (Minimum neu/alt) gilt ein Fall als langsamer")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="verrechnung-bench-") as ordner:
+        pfad = os.path.join(ordner, "verrechnung.db")
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            info = ledger.erzeugen(pfad, seed=args.seed, konten=args.konten, monate=args.monate,
+                                   buchungen=args.buchungen, ende=args.ende,
+                                   offene_monate=args.offene_monate)
+        print(f"Hauptbuch: {info['transaktionen']} Zeilen, {info['konten']} Konten, "
+              f"{info['von']} bis {info['ende']} ({time.perf_counter() - start:.1f} s)")
+        vorlage = os.path.join(ordner, "vorlage.db")
+        shutil.copyfile(pfad, vorlage)
+        webapp.DB_PATH = pfad
+
+        con = sqlite3.connect(pfad)
+        mitglied_konten = [r[0] for r in con.execute("""
+            SELECT k.name FROM konten k JOIN konten_benutzer kb ON kb.konto_id = k.id
+            WHERE kb.benutzer_login = 'mitglied001' ORDER BY k.id""")]
+        con.close()
+
+        ergebnisse = []
+        def eintragen(fall, art, werte):
+            ergebnisse.append({"fall": fall, "art": art, **werte})
+            print(f"{fall:44} {werte['median_ms']:9.2f} ms  (min {werte['min_ms']:.2f}, "
+                  f"max {werte['max_ms']:.2f}, n={werte['wiederholungen']})")
+
+        print(f"{'Fall':44} {'Median':>12}")
+        eintragen("apply_parkgebuehr_catchup (offene Monate)", "direkt",
+                  parkgebuehr_messen(vorlage, ordner, info, args.wiederholungen))
+        conn, faelle = faelle_direkt(info, mitglied_konten)
+        for fall, funktion in faelle:
+            eintragen(fall, "direkt", messen(funktion, args.wiederholungen))
+        conn.close()
+
+        client_admin = webapp.app.test_client()
+        client_mitglied = webapp.app.test_client()
+        anmelden(client_admin, "admin")
+        anmelden(client_mitglied, "mitglied001")
+        for fall, client, pfad_http in faelle_http(client_admin, client_mitglied, info, mitglied_konten[0]):
+            eintragen(fall, "http", messen(abrufen(client, pfad_http), args.wiederholungen))
+
+    commit, geaendert = commit_info()
+    ergebnis = {
+        "zeitpunkt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "arbeitskopie_geaendert": geaendert,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "hauptbuch": info,
+        "ergebnisse": ergebnisse,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(ergebnis, f, ensure_ascii=False, indent=2)
+        print(f"Ergebnisse in {args.json}")
+    if args.vergleich:
+        langsamer = vergleichen(ergebnis, args.vergleich, args.schwelle)
+        if langsamer:
+            print(f"Langsamer als {args.schwelle:.2f}x: {', '.join(langsamer)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# brotpreis.py — holt den €/kg-Preis von der Bäckerei-Seite
+# Abruf und Auswertung laufen außerhalb der Requests (Hintergrund-Thread bzw.
+# "flask brotpreis-aktualisieren"); webapp.py speichert nur das Ergebnis.
+
+import os
+import re
+import threading
+import time
+
+from html.parser import HTMLParser
+
+import requests
+
+BROTPREIS_URL = os.environ.get(
+    "BROTPREIS_URL",
+    "https://xn--bcker-schren-shop-qqb87b.de/produkt/bio-vollwertbrot/bio-vollwert-dinkelbrot/",
+)
+ABRUF_TIMEOUT = 10
+
+# Robusteres Muster: erlaubt "/kg", "pro kg", "je kg", optional "1 kg"
+PREIS_MUSTER = re.compile(r"(\d+[.,]\d+)\s*€\s*(?:/|pro|je)\s*(?:1\s*)?kg", re.IGNORECASE)
+
+# Ergebnis-Status von abrufen()
+NEU = "neu"                     # Preis gefunden
+UNVERAENDERT = "unveraendert"   # 304 – Seite seit dem letzten Treffer unverändert
+KEIN_TREFFER = "kein_treffer"   # Seite geladen, aber kein €/kg-Preis
+FEHLER = "fehler"               # Netzwerk-/HTTP-Fehler
+
+# Inhalte, die BeautifulSoup.get_text() auslässt
+IGNORIERTE_TAGS = {"script", "style"}
+# Elemente ohne End-Tag – kommen nicht auf den Stapel
+LEERE_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input",
+              "link", "meta", "source", "track", "wbr"}
+# So viel Text wird über Elementgrenzen hinweg für das Muster vorgehalten
+TEXT_FENSTER = 200
+
+class _Gefunden(Exception):
+    pass
+
+class _PreisParser(HTMLParser):
+    """
+    Sammelt den sichtbaren Text wie get_text(" ", strip=True), hält aber nur
+    ein kurzes Fenster vor und bricht beim ersten Treffer ab. Merkt sich das
+    innerste Element mit id/class, das den ganzen Treffer umschließt.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._offen = []
+        self._ignorieren = 0
+        self._fenster = []  # (Text, offene Elemente) je Textknoten
+        self._text = []     # Stücke des aktuellen Textknotens (feed() teilt ihn an Häppchengrenzen)
+        self.preis = None
+        self.selektor = None
+
+    def handle_starttag(self, tag, attrs):
+        self._text_abschliessen()
+        if tag in IGNORIERTE_TAGS:
+            self._ignorieren += 1
+        if tag in LEERE_TAGS:
+            return
+        attrs = dict(attrs)
+        if attrs.get("id"):
+            merkmal = ("id", attrs["id"])
+        elif attrs.get("class"):
+            merkmal = ("class", attrs["class"])
+        else:
+            merkmal = None
+        self._offen.append((tag, merkmal))
+
+    def handle_endtag(self, tag):
+        self._text_abschliessen()
+        if tag in IGNORIERTE_TAGS and self._ignorieren:
+            self._ignorieren -= 1
+        # unsauberes HTML: bis zum passenden offenen Element zurückgehen
+        for i in range(len(self._offen) - 1, -1, -1):
+            if self._offen[i][0] == tag:
+                del self._offen[i:]
+                break
+
+    def handle_data(self, data):
+        if not self._ignorieren:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._text_abschliessen()
+
+    def _text_abschliessen(self):
+        text = "".join(self._text).strip()
+        self._text.clear()
+        if not text:
+            return
+        self._fenster.append((text, tuple(self._offen)))
+        while len(self._fenster) > 1 and sum(len(t) + 1 for t, _ in self._fenster[1:]) > TEXT_FENSTER:
+            del self._fenster[0]
+        m = PREIS_MUSTER.search(" ".join(t for t, _ in self._fenster))
+        if m:
+            self.preis = float(m.group(1).replace(".", "").replace(",", "."))  # "8,38" -> "8.38"
+            self.selektor = self._umschliessend(m.start())
+            raise _Gefunden
+
+    def _umschliessend(self, anfang):
+        # Textknoten, in dem der Treffer beginnt, und gemeinsame Vorfahren bis zum Ende
+        pos = 0
+        for text, offen in self._fenster:
+            pos += len(text) + 1
+            if pos > anfang:
+                break
+        gemeinsam = []
+        for a, b in zip(offen, self._offen):
+            if a is not b:
+                break
+            gemeinsam.append(a)
+        for tag, merkmal in reversed(gemeinsam):
+            if merkmal is not None:
+                return (tag,) + merkmal
+        return None
+
+# Häppchengröße beim Einlesen – spart die Kopie des ganzen Seitenrests
+HAPPEN = 16384
+
+def _parsen(html, start=0):
+    parser = _PreisParser()
+    try:
+        for i in range(start, len(html), HAPPEN):
+            parser.feed(html[i:i + HAPPEN])
+        parser.close()
+    except _Gefunden:
+        pass
+    return parser
+
+class PreisExtraktor:
+    """
+    €/kg-Preis aus einer Produktseite ohne vollständigen DOM-Aufbau.
+    Nach einem Treffer wird der Selektor (Tag + id/class) gemerkt; beim
+    nächsten Mal beginnt das Parsen direkt an diesem Element und fällt nur
+    ohne Treffer auf die ganze Seite zurück.
+    """
+
+    def __init__(self):
+        self.selektor = None
+
+    def _startpunkt(self, html):
+        tag, attr, wert = self.selektor
+        m = re.search(r"<%s\b[^>]*\b%s\s*=\s*[\"']%s[\"']" % (tag, attr, re.escape(wert)),
+                      html, re.IGNORECASE)
+        return m.start() if m else None
+
+    def preis(self, html):
+        if self.selektor is not None:
+            start = self._startpunkt(html)
+            if start is not None:
+                parser = _parsen(html, start)
+                if parser.preis is not None:
+                    return parser.preis
+        parser = _parsen(html)
+        if parser.preis is not None:
+            self.selektor = parser.selektor
+        return parser.preis
+
+_extraktor = PreisExtraktor()
+
+def preis_aus_html(html):
+    """€/kg-Preis aus dem Seitentext oder None."""
+    return _extraktor.preis(html)
+
+def abrufen(url=BROTPREIS_URL, etag=None, last_modified=None, timeout=ABRUF_TIMEOUT):
+    """
+    Bedingter GET auf die Produktseite.
+    Liefert (status, preis, etag, last_modified); Validatoren nur bei NEU.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        resp = requests.get(url, headers=headers, timeout=timeout)
+        if resp.status_code == 304:
+            return UNVERAENDERT, None, etag, last_modified
+        resp.raise_for_status()
+        preis = preis_aus_html(resp.text)
+    except Exception as e:
+        print(f"[brotpreis] Abruf fehlgeschlagen: {e}")
+        return FEHLER, None, None, None
+    if preis is None:
+        return KEIN_TREFFER, None, None, None
+    return NEU, preis, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+class Aktualisierer:
+    """
+    Startet den Abruf in einem Hintergrund-Thread. Gleichzeitige Anstöße werden
+    zusammengefasst: läuft schon ein Abruf oder liegt der letzte weniger als
+    min_abstand Sekunden zurück, passiert nichts.
+    """
+
+    def __init__(self, ausfuehren, min_abstand=60):
+        self.ausfuehren = ausfuehren
+        self.min_abstand = min_abstand
+        self._lock = threading.Lock()
+        self._thread = None
+        self._zuletzt = None
+
+    def anstossen(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            if self._zuletzt is not None and time.monotonic() - self._zuletzt < self.min_abstand:
+                return False
+            self._thread = threading.Thread(target=self._lauf, name="brotpreis", daemon=True)
+            self._thread.start()
+            return True
+
+    def _lauf(self):
+        try:
+            self.ausfuehren()
+        except Exception as e:
+            print(f"[brotpreis] Aktualisierung fehlgeschlagen: {e}")
+        finally:
+            with self._lock:
+                self._zuletzt = time.monotonic()
+
+    def warten(self, timeout=None):
+        """Für Jobs/Tests: auf einen laufenden Abruf warten."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
@@ -2,10 +2,15 @@
 # Robust: versucht mehrere mögliche Modulnamen deiner App zu importieren.
 
 import importlib
+import os
 import sys
-import sqlite3
 from datetime import date
 
+# Metriken in den eigenen Ordner des Jobs (siehe metriken.py), vor dem Import der App
+os.environ["METRIKEN_JOB"] = "1"
+
+import sqlprotokoll
+
 CANDIDATES = ["webapp"]
 
 appmod = None
@@ -23,20 +28,24 @@ if appmod is None:
 try:
     erstelle_datenbank = getattr(appmod, "erstelle_datenbank")
     apply_parkgebuehr_catchup = getattr(appmod, "apply_parkgebuehr_catchup")
+    db_connection = getattr(appmod, "db_connection")
+    get_systemstatus = getattr(appmod, "get_systemstatus")
 except AttributeError as e:
     print("Die benötigten Funktionen wurden im App-Modul nicht gefunden:", e)
     print("Stelle sicher, dass in deiner App-Datei folgende Funktionen definiert sind:")
     print(" - erstelle_datenbank()")
     print(" - apply_parkgebuehr_catchup()")
+    print(" - db_connection()")
+    print(" - get_systemstatus(conn, key)")
     sys.exit(1)
 
 def get_last_fee_month():
-    conn = sqlite3.connect("verrechnung.db")
-    c = conn.cursor()
-    c.execute("SELECT value FROM systemstatus WHERE key = 'last_fee_month'")
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else None
+    # gleiche DB wie die App (DB_PATH), unabhängig vom Arbeitsverzeichnis
+    conn = db_connection()
+    try:
+        return get_systemstatus(conn, "last_fee_month")
+    finally:
+        conn.close()
 
 def get_target_month():
     today = date.today()
@@ -53,7 +62,9 @@ if __name__ == "__main__":
     before = get_last_fee_month()
     target = get_target_month()
 
-    apply_parkgebuehr_catchup()
+    # Anweisungen und SQL-Zeit des Laufs; die EoM-Berechnung meldet sich zusätzlich einzeln
+    with sqlprotokoll.phase("fees"):
+        apply_parkgebuehr_catchup()
 
     after = get_last_fee_month()
 
@@ -0,0 +1,23 @@
+# gunicorn.conf.py — gunicorn lädt diese Datei aus dem Arbeitsverzeichnis automatisch
+#
+# Schema und Migrationen einmal im Master, bevor Worker starten; die Worker
+# selbst prüfen das Schema nicht mehr. Dazu die Hooks für die Metriken
+# (metriken.py): alle Worker schreiben in PROMETHEUS_MULTIPROC_DIR, /metrics
+# fasst die Dateien zusammen. Nur hier wird dieser Ordner gewählt – die Worker
+# erben METRIKEN_WEB vom Master, andere Prozesse zählen woanders.
+
+import os
+
+os.environ["METRIKEN_WEB"] = "1"
+
+import metriken
+
+def on_starting(server):
+    # Scheitert eine Migration (z. B. Sperre durch den Gebühren-Job), startet gunicorn nicht
+    import webapp
+    webapp.erstelle_datenbank()
+    # Werte früherer Läufe verwerfen – Zähler beginnen nach einem Neustart bei 0
+    metriken.ordner_leeren()
+
+def child_exit(server, worker):
+    metriken.prozess_beendet(worker.pid)
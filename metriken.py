@@ -0,0 +1,96 @@
+# metriken.py — Prometheus-Metriken über alle gunicorn-Worker
+#
+# prometheus_client im Multiprozess-Modus: jeder Prozess schreibt seine Werte
+# in Dateien unter PROMETHEUS_MULTIPROC_DIR, /metrics fasst sie beim Abruf
+# zusammen. gunicorn.conf.py leert den Ordner beim Start und meldet beendete
+# Worker ab.
+#
+# In diesen Ordner schreiben nur die gunicorn-Worker: gunicorn.conf.py setzt
+# METRIKEN_WEB=1, bevor die App geladen wird. Der Gebühren-Job (fees_job.py,
+# per Cron) setzt METRIKEN_JOB=1 und zählt in einen eigenen Ordner daneben
+# ("<ordner>-job"), den er bei jedem Start leert: dort steht also nur der
+# letzte Lauf, statt dass sich Dateien je Lauf ansammeln. /metrics fasst beide
+# Ordner zusammen. Alle anderen Prozesse, die webapp importieren (flask-CLI,
+# benchmarks, Prüfskripte, "flask run"), zählen in einen Wegwerf-Ordner, der
+# beim Beenden gelöscht wird – sie verfälschen die Zähler der Worker nicht.
+
+import atexit
+import glob
+import os
+import shutil
+import tempfile
+
+WEB_ORDNER = os.environ.get("PROMETHEUS_MULTIPROC_DIR",
+                            os.path.join(tempfile.gettempdir(), "verrechnung-metriken"))
+JOB_ORDNER = WEB_ORDNER.rstrip(os.sep) + "-job"
+
+def _dateien(ordner):
+    return glob.glob(os.path.join(ordner, "*.db"))
+
+def ordner_leeren(ordner=WEB_ORDNER):
+    """Dateien früherer Läufe entfernen (gunicorn-Master beim Start, Gebühren-Job vor dem Lauf)."""
+    for pfad in _dateien(ordner):
+        os.remove(pfad)
+
+if os.environ.get("METRIKEN_JOB") == "1":
+    ORDNER = JOB_ORDNER
+    os.makedirs(ORDNER, exist_ok=True)
+    # vor dem Import von prometheus_client: danach hielte dieser Prozess schon eigene Dateien offen
+    ordner_leeren(ORDNER)
+elif os.environ.get("METRIKEN_WEB") == "1":
+    ORDNER = WEB_ORDNER
+    os.makedirs(ORDNER, exist_ok=True)
+else:
+    ORDNER = tempfile.mkdtemp(prefix="verrechnung-metriken-")
+    atexit.register(shutil.rmtree, ORDNER, ignore_errors=True)
+# Muss vor dem Import von prometheus_client gesetzt sein
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = ORDNER
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+DAUER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SPERRE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5)
+
+request_dauer = Histogram(
+    "verrechnung_request_dauer_sekunden",
+    "Antwortzeit je Route; bei gestreamten Antworten bis zum letzten Block",
+    ["route", "methode"], buckets=DAUER_BUCKETS)
+buchungen = Counter("verrechnung_buchungen", "Gebuchte Überweisungen und Fonds-Ausgaben", ["art"])
+ueberziehungen = Counter("verrechnung_ueberziehung_abgelehnt", "Wegen der Überziehungsgrenze abgelehnte Überweisungen")
+parkgebuehr_buchungen = Counter("verrechnung_parkgebuehr_buchungen", "Gebuchte Parkgebühr-Zeilen")
+parkgebuehr_monate = Counter("verrechnung_parkgebuehr_monate", "Abgeschlossene Parkgebühr-Monate")
+sperre_warten = Histogram(
+    "verrechnung_db_sperre_warten_sekunden",
+    "Wartezeit auf die Schreibsperre (BEGIN IMMEDIATE)",
+    ["ort"], buckets=SPERRE_BUCKETS)
+
+def prozess_beendet(pid):
+    multiprocess.mark_process_dead(pid, ORDNER)
+
+class _Prozesse:
+    """
+    Werte aller Worker plus des letzten Gebühren-Job-Laufs, gleiche Reihen
+    addiert; außerhalb von gunicorn (z. B. "flask run") zusätzlich die eigenen.
+    """
+
+    def collect(self):
+        ordner = {WEB_ORDNER, JOB_ORDNER, ORDNER}
+        return multiprocess.MultiProcessCollector.merge([d for o in sorted(ordner) for d in _dateien(o)])
+
+class _Momentwerte:
+    """Werte, die erst beim Abruf ermittelt werden (z. B. aus der Datenbank)."""
+
+    def __init__(self, werte):
+        self.werte = werte
+
+    def collect(self):
+        for name, hilfe, wert in self.werte:
+            yield GaugeMetricFamily(name, hilfe, value=wert)
+
+def ausgabe(momentwerte=()):
+    """Textformat für /metrics: alle Prozesse zusammengefasst plus momentwerte [(name, hilfe, wert)]."""
+    registry = CollectorRegistry()
+    registry.register(_Prozesse())
+    registry.register(_Momentwerte(momentwerte))
+    return generate_latest(registry)
@@ -0,0 +1,148 @@
+# passwoerter.py — Passwort-Hashes, Prüfung mit Cache und Drosselung für /login
+#
+# Gespeichert wird im Werkzeug-Format "methode$salz$hash". Alte Klartext-Einträge
+# in benutzer.passwort werden beim nächsten erfolgreichen Login ersetzt, ebenso
+# Hashes mit veralteten Kosten (siehe PASSWORT_METHODE).
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Kosten des KDF, z. B. "scrypt:32768:8:1" (N:r:p) oder "pbkdf2:sha256:600000".
+# benchmarks/bench_login.py misst, wie viele Logins je Worker und Sekunde das erlaubt.
+PASSWORT_METHODE = os.environ.get("PASSWORT_METHODE", "scrypt:32768:8:1")
+HASH_PRAEFIXE = ("scrypt:", "pbkdf2:")
+
+def hash_erzeugen(passwort, methode=None):
+    return generate_password_hash(passwort, method=methode or PASSWORT_METHODE)
+
+_methoden_kennung = {}
+_blindwert = []
+
+def methoden_kennung(methode):
+    """Der Teil vor dem ersten '$', so wie Werkzeug ihn für diese Methode schreibt."""
+    if methode not in _methoden_kennung:
+        _methoden_kennung[methode] = hash_erzeugen("", methode).split("$", 1)[0]
+    return _methoden_kennung[methode]
+
+def ist_hash(gespeichert):
+    return gespeichert.startswith(HASH_PRAEFIXE) and gespeichert.count("$") == 2
+
+class PruefCache:
+    """
+    Merkt sich erfolgreiche Prüfungen (Benutzer + gespeicherter Hash), damit
+    wiederholte Logins desselben Mitglieds nicht jedes Mal den KDF bezahlen.
+    Abgelegt wird nur ein HMAC des Passworts mit einem prozesseigenen Schlüssel;
+    Größe und Lebensdauer sind begrenzt.
+    """
+
+    def __init__(self, groesse=256, ttl=600):
+        self.groesse = groesse
+        self.ttl = ttl
+        self._schluessel = secrets.token_bytes(32)
+        self._eintraege = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, passwort):
+        return hmac.new(self._schluessel, passwort.encode("utf-8"), hashlib.sha256).digest()
+
+    def treffer(self, benutzer, gespeichert, passwort):
+        with self._lock:
+            eintrag = self._eintraege.get((benutzer, gespeichert))
+            if eintrag is None:
+                return False
+            digest, bis = eintrag
+            if time.monotonic() > bis:
+                del self._eintraege[(benutzer, gespeichert)]
+                return False
+        return hmac.compare_digest(digest, self._digest(passwort))
+
+    def merken(self, benutzer, gespeichert, passwort):
+        eintrag = (self._digest(passwort), time.monotonic() + self.ttl)
+        with self._lock:
+            self._eintraege[(benutzer, gespeichert)] = eintrag
+            self._eintraege.move_to_end((benutzer, gespeichert))
+            while len(self._eintraege) > self.groesse:
+                self._eintraege.popitem(last=False)
+
+pruef_cache = PruefCache()
+
+def pruefen(benutzer, gespeichert, passwort):
+    """
+    Prüft ein Passwort gegen den gespeicherten Wert.
+    Liefert (ok, neuer_hash); neuer_hash ist gesetzt, wenn der Eintrag ersetzt
+    werden soll (Klartext oder veraltete Kosten).
+    """
+    if gespeichert is None:
+        # Unbekannter Benutzer: gleich teuer prüfen, damit die Antwortzeit nichts verrät
+        if not _blindwert:
+            _blindwert.append(hash_erzeugen(secrets.token_hex(16)))
+        check_password_hash(_blindwert[0], passwort)
+        return False, None
+    if not ist_hash(gespeichert):
+        # Altbestand im Klartext
+        if hmac.compare_digest(gespeichert.encode("utf-8"), passwort.encode("utf-8")):
+            return True, hash_erzeugen(passwort)
+        return False, None
+    if pruef_cache.treffer(benutzer, gespeichert, passwort):
+        return True, None
+    if not check_password_hash(gespeichert, passwort):
+        return False, None
+    if gespeichert.split("$", 1)[0] != methoden_kennung(PASSWORT_METHODE):
+        return True, hash_erzeugen(passwort)
+    pruef_cache.merken(benutzer, gespeichert, passwort)
+    return True, None
+
+class Drossel:
+    """
+    Begrenzung je Worker-Prozess:
+    - je Schlüssel (Client-Adresse) höchstens max_fehlversuche
+      Fehlversuche je fenster Sekunden;
+    - höchstens max_parallel gleichzeitige KDF-Berechnungen, damit Angriffe die
+      CPU des Workers nicht auslasten.
+    """
+
+    def __init__(self, max_fehlversuche=10, fenster=60, max_parallel=2, max_schluessel=10000):
+        self.max_fehlversuche = max_fehlversuche
+        self.fenster = fenster
+        self.max_schluessel = max_schluessel
+        self._fehlversuche = OrderedDict()
+        self._lock = threading.Lock()
+        self._kdf = threading.BoundedSemaphore(max_parallel)
+
+    def gesperrt(self, *schluessel):
+        jetzt = time.monotonic()
+        with self._lock:
+            for s in schluessel:
+                versuche = self._fehlversuche.get(s)
+                if versuche and len([t for t in versuche if jetzt - t < self.fenster]) >= self.max_fehlversuche:
+                    return True
+        return False
+
+    def fehlschlag(self, *schluessel):
+        jetzt = time.monotonic()
+        with self._lock:
+            for s in schluessel:
+                versuche = [t for t in self._fehlversuche.pop(s, ()) if jetzt - t < self.fenster]
+                versuche.append(jetzt)
+                self._fehlversuche[s] = versuche[-self.max_fehlversuche:]
+            while len(self._fehlversuche) > self.max_schluessel:
+                self._fehlversuche.popitem(last=False)
+
+    def erfolg(self, *schluessel):
+        with self._lock:
+            for s in schluessel:
+                self._fehlversuche.pop(s, None)
+
+    def kdf_belegen(self, timeout=2.0):
+        """Platz für eine KDF-Berechnung; False, wenn der Worker ausgelastet ist."""
+        return self._kdf.acquire(timeout=timeout)
+
+    def kdf_freigeben(self):
+        self._kdf.release()
@@ -0,0 +1,182 @@
+# sicherung.py — konsistente Sicherungen für /admin/download-db
+#
+# Vollsicherung: VACUUM INTO schreibt den Stand EINER Lesetransaktion in eine
+# neue Datei. Im WAL-Modus hält das keinen Schreiber auf, und anders als beim
+# Kopieren der Datei fehlt nichts, was noch im -wal steht. Das dauert bei
+# großem Hauptbuch länger als der gunicorn-Timeout (30 s) erlaubt, darum
+# läuft es nicht im Request: "flask backup-erstellen" (per Cron) legt die
+# Datei gzip-komprimiert im Sicherungsordner ab (vollsicherung_schreiben),
+# der Endpunkt liefert nur die neueste fertige Datei aus.
+#
+# Inkrementell: transaktionen wird nur angehängt (AUTOINCREMENT, kein UPDATE/
+# DELETE – außer beim Jahresabschluss, der die Generation erhöht). Ein
+# Inkrement enthält deshalb alle Zeilen hinter der höchsten id der letzten
+# Sicherung und die kleinen Stammdaten-Tabellen vollständig, als SQL-Skript.
+# Das Sicherungs-Token ("v<schema>.g<generation>.t<id>") steht in jeder
+# Antwort im Header X-Backup-Token. Ändert sich das Schema oder wird das
+# Hauptbuch umgebaut (systemstatus 'hauptbuch_generation'), ist wieder eine
+# Vollsicherung nötig.
+#
+# Archivdateien der Jahresabschlüsse (archiv.py) sind nicht enthalten; sie
+# ändern sich nicht mehr und werden einmal mit ?archiv=JAHR geholt.
+#
+# Wiederherstellen: gunzip der Vollsicherung, dann die Inkremente der Reihe
+# nach mit "flask backup-einspielen <datei> <inkrement>..." einspielen. Jedes
+# Inkrement prüft zuerst, dass es auf den Stand passt, und bricht sonst ab.
+
+import glob
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import zlib
+
+GENERATION_KEY = "hauptbuch_generation"
+HAPPEN = 65536
+ZEILEN_JE_STAPEL = 500
+
+# Vollständig übertragen; einkommen_jahr ist abgeleitet, aber klein.
+# konto_buchungen füllen die Trigger beim Einfügen der Transaktionen,
+# monatsabschluss ist ein Zwischenspeicher, sitzungen sind flüchtig.
+STAMMDATEN = ("konten", "konten_benutzer", "benutzer", "systemstatus", "settings", "einkommen_jahr")
+
+# Fertige Vollsicherungen im Sicherungsordner; das Token steht im Namen
+VOLL_MUSTER = re.compile(r"^verrechnung-(\d{8}-\d{6})-(v\d+\.g\d+\.t\d+)\.db\.gz$")
+
+class TokenUngueltig(Exception):
+    """Das Sicherungs-Token passt nicht (mehr) zu dieser Datenbank – Vollsicherung nötig."""
+
+def token_bilden(stand):
+    schema, generation, max_id = stand
+    return f"v{schema}.g{generation}.t{max_id}"
+
+def token_lesen(token):
+    try:
+        v, g, t = token.split(".")
+        if v[0] != "v" or g[0] != "g" or t[0] != "t":
+            raise ValueError
+        return int(v[1:]), int(g[1:]), int(t[1:])
+    except (ValueError, IndexError):
+        raise TokenUngueltig(f"Kein gültiges Sicherungs-Token: {token!r}")
+
+def stand(conn):
+    """(Schema-Version, Hauptbuch-Generation, höchste Transaktions-id) – in der laufenden Lesetransaktion."""
+    werte = dict(conn.execute("SELECT key, value FROM systemstatus WHERE key IN ('schema_version', ?)",
+                              (GENERATION_KEY,)).fetchall())
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM transaktionen").fetchone()[0]
+    return int(werte.get("schema_version", 0)), int(werte.get(GENERATION_KEY, 0)), max_id
+
+def schnappschuss(conn, ziel):
+    """Schreibt einen konsistenten Stand nach 'ziel' (darf nicht existieren); liefert sein Token."""
+    conn.execute("VACUUM INTO ?", (ziel,))
+    kopie = sqlite3.connect(ziel)
+    try:
+        return token_bilden(stand(kopie))
+    finally:
+        kopie.close()
+
+def vollsicherung_schreiben(conn, ordner, zeit):
+    """
+    Schnappschuss per VACUUM INTO, gzip-komprimiert als
+    verrechnung-<zeit>-<token>.db.gz in 'ordner'. Erst die fertige Datei wird
+    umbenannt – ein abgebrochener Lauf hinterlässt nichts, was ausgeliefert würde.
+    Liefert den Pfad.
+    """
+    os.makedirs(ordner, exist_ok=True)
+    arbeit = tempfile.mkdtemp(prefix=".sicherung-", dir=ordner)
+    try:
+        roh = os.path.join(arbeit, "verrechnung.db")
+        token = schnappschuss(conn, roh)
+        gepackt = roh + ".gz"
+        with open(roh, "rb") as quelle, gzip.open(gepackt, "wb", compresslevel=6) as ziel:
+            shutil.copyfileobj(quelle, ziel, HAPPEN)
+        pfad = os.path.join(ordner, f"verrechnung-{zeit}-{token}.db.gz")
+        os.replace(gepackt, pfad)
+        return pfad
+    finally:
+        shutil.rmtree(arbeit, ignore_errors=True)
+
+def vollsicherungen(ordner):
+    """[(pfad, token)] der fertigen Vollsicherungen in 'ordner', älteste zuerst."""
+    ergebnis = []
+    for pfad in sorted(glob.glob(os.path.join(ordner, "verrechnung-*.db.gz"))):
+        m = VOLL_MUSTER.match(os.path.basename(pfad))
+        if m:
+            ergebnis.append((pfad, m.group(2)))
+    return ergebnis
+
+def alte_entfernen(ordner, behalten):
+    """Löscht bis auf die 'behalten' (>= 1) neuesten Vollsicherungen alle; liefert die gelöschten Pfade."""
+    alt = [pfad for pfad, _ in vollsicherungen(ordner)][:-behalten]
+    for pfad in alt:
+        os.remove(pfad)
+    return alt
+
+def datei_bloecke(pfad):
+    with open(pfad, "rb") as f:
+        while block := f.read(HAPPEN):
+            yield block
+
+def gzip_strom(bloecke):
+    """Komprimiert einen Strom von Bytes-Blöcken zu gzip, ohne alles im Speicher zu halten."""
+    packer = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip-Kopf
+    for block in bloecke:
+        daten = packer.compress(block)
+        if daten:
+            yield daten
+    yield packer.flush()
+
+def _literal(wert):
+    if wert is None:
+        return "NULL"
+    if isinstance(wert, (int, float)):
+        return repr(wert)
+    if isinstance(wert, bytes):
+        return f"X'{wert.hex()}'"
+    return "'" + str(wert).replace("'", "''") + "'"
+
+def _inserts(conn, tabelle, rest="", params=()):
+    c = conn.execute(f"SELECT * FROM {tabelle}{rest}", params)
+    spalten = ", ".join(d[0] for d in c.description)
+    while rows := c.fetchmany(ZEILEN_JE_STAPEL):
+        yield "".join(f"INSERT INTO {tabelle} ({spalten}) VALUES ({', '.join(map(_literal, row))});\n"
+                      for row in rows)
+
+def inkrement(conn, seit, aktuell):
+    """
+    SQL-Skript (als Text-Stücke) von Token 'seit' bis zum Stand 'aktuell'.
+    conn muss in einer Lesetransaktion stehen, in der auch 'aktuell' gelesen wurde.
+    Wirft TokenUngueltig, bevor etwas erzeugt wird.
+    """
+    schema, generation, max_id = token_lesen(seit)
+    if (schema, generation) != aktuell[:2] or max_id > aktuell[2]:
+        raise TokenUngueltig(f"Token {seit} passt nicht zum Stand {token_bilden(aktuell)} – Vollsicherung nötig")
+
+    def teile():
+        yield f"-- Inkrement von {seit} bis {token_bilden(aktuell)}\n"
+        yield "BEGIN;\n"
+        # Nur auf den Stand einspielbar, auf dem das Token erstellt wurde
+        yield "CREATE TEMP TABLE _basis_pruefung (passt INTEGER CHECK (passt));\n"
+        yield (f"INSERT INTO _basis_pruefung SELECT (SELECT COALESCE(MAX(id), 0) FROM transaktionen) = {max_id} "
+               f"AND (SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) FROM systemstatus "
+               f"WHERE key = '{GENERATION_KEY}') = {generation};\n")
+        for tabelle in STAMMDATEN:
+            yield f"DELETE FROM {tabelle};\n"
+            yield from _inserts(conn, tabelle)
+        yield from _inserts(conn, "transaktionen", " WHERE id > ? AND id <= ? ORDER BY id", (max_id, aktuell[2]))
+        yield "DROP TABLE _basis_pruefung;\n"
+        yield "COMMIT;\n"
+    return teile()
+
+def einspielen(conn, inkrement_pfad):
+    """Spielt ein gzip-Inkrement in conn ein (alles oder nichts)."""
+    with gzip.open(inkrement_pfad, "rt", encoding="utf-8") as f:
+        skript = f.read()
+    try:
+        conn.executescript(skript)
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
@@ -0,0 +1,199 @@
+# sqlprotokoll.py — zählt und misst SQL-Anweisungen je Request bzw. Job-Phase
+#
+# db_connection() öffnet Verbindungen mit factory=Verbindung. Jede Verbindung
+# meldet per set_trace_callback alle Anweisungen, die SQLite ausführt (auch
+# BEGIN/COMMIT und Trigger-Rümpfe); ihre Cursor messen die Zeit in execute()
+# und beim Abholen der Zeilen (fetch*, Iteration – bei großen Ergebnissen
+# etwa 0,5 µs je Zeile). Beides wird der gerade laufenden Messung
+# zugeschrieben – einem Request (siehe webapp.py) oder einer phase() im
+# Gebühren-Job. Eingeschaltet nur mit SQL_MESSUNG=1 (Diagnose, nicht für den
+# Dauerbetrieb); sonst öffnet db_connection() gewöhnliche Verbindungen.
+#
+# Anweisungen ab SQL_LANGSAM_MS werden mit "[sql] langsam" protokolliert,
+# beim ersten Mal je SQL-Text mit EXPLAIN QUERY PLAN. Parameterwerte werden
+# nie ausgegeben.
+
+import contextlib
+import contextvars
+import os
+import sqlite3
+import time
+from functools import partial
+
+AKTIV = os.environ.get("SQL_MESSUNG", "0") == "1"
+LANGSAM_MS = float(os.environ.get("SQL_LANGSAM_MS", "100"))
+# "1": nach jedem Request eine Zusammenfassung drucken
+PROTOKOLL = os.environ.get("SQL_PROTOKOLL", "0") == "1"
+
+PLAN_PRAEFIX = "EXPLAIN QUERY PLAN "
+PLAN_FAEHIG = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+MAX_GEZEIGTE_PLAENE = 500
+
+class Messung:
+    """Anweisungen, SQL-Zeit und beteiligte Verbindungen eines Requests bzw. einer Phase."""
+
+    def __init__(self, name, eltern=None):
+        self.name = name
+        self.eltern = eltern
+        self.anweisungen = 0
+        self.dauer = 0.0
+        self.langsam = 0
+        self.verbindungen = set()
+
+    def ms(self):
+        return self.dauer * 1000
+
+    def zusammenfassung(self):
+        return (f"{self.name}: {self.anweisungen} Anweisungen, {self.ms():.1f} ms SQL, "
+                f"{len(self.verbindungen)} Verbindung(en), {self.langsam} langsam")
+
+_aktuell = contextvars.ContextVar("sql_messung", default=None)
+_gezeigte_plaene = set()
+
+def aktuell():
+    return _aktuell.get()
+
+def beginnen(name, verschachtelt=True):
+    """
+    Startet eine Messung im aktuellen Kontext; liefert das Token für beenden().
+    Verschachtelt zählt alles auch in der umgebenden Messung mit.
+    """
+    return _aktuell.set(Messung(name, _aktuell.get() if verschachtelt else None))
+
+def beenden(token):
+    messung = _aktuell.get()
+    try:
+        _aktuell.reset(token)
+    except ValueError:
+        # Token aus einem anderen Kontext (z. B. abgebrochener Stream, erst vom GC geschlossen)
+        return None
+    return messung
+
+@contextlib.contextmanager
+def phase(name):
+    """Misst einen Abschnitt (z. B. im Gebühren-Job) und druckt am Ende die Zusammenfassung."""
+    token = beginnen(name)
+    try:
+        yield _aktuell.get()
+    finally:
+        messung = beenden(token)
+        if AKTIV and messung is not None:
+            print(f"[sql] {messung.zusammenfassung()}")
+
+def _trace(kennung, sql):
+    if sql.startswith(PLAN_PRAEFIX):
+        return
+    messung = _aktuell.get()
+    while messung is not None:
+        messung.anweisungen += 1
+        messung.verbindungen.add(kennung)
+        messung = messung.eltern
+
+def _plan(conn, sql, params):
+    try:
+        zeilen = sqlite3.Cursor(conn).execute(PLAN_PRAEFIX + sql, params).fetchall()
+    except sqlite3.Error as e:
+        return [f"(kein Plan: {e})"]
+    return [detail for _, _, _, detail in zeilen]
+
+def _erfassen(dauer):
+    m = _aktuell.get()
+    while m is not None:
+        m.dauer += dauer
+        m = m.eltern
+
+def _langsam_melden(conn, sql, params, dauer):
+    messung = _aktuell.get()
+    m = messung
+    while m is not None:
+        m.langsam += 1
+        m = m.eltern
+    text = " ".join(sql.split())
+    kontext = messung.name if messung is not None else "-"
+    print(f"[sql] langsam ({dauer * 1000:.1f} ms, {kontext}): {text}")
+    if (params is not None and text not in _gezeigte_plaene
+            and text.lstrip("(").upper().startswith(PLAN_FAEHIG)
+            and len(_gezeigte_plaene) < MAX_GEZEIGTE_PLAENE):
+        _gezeigte_plaene.add(text)
+        for zeile in _plan(conn, sql, params):
+            print(f"[sql]   {zeile}")
+
+class Cursor(sqlite3.Cursor):
+    """Misst execute() und das Abholen der Zeilen; gemeldet wird je Ausführung höchstens einmal."""
+
+    _sql = None
+    _params = None
+    _dauer = 0.0
+    _gemeldet = True
+
+    def _zeit(self, start):
+        dauer = time.perf_counter() - start
+        _erfassen(dauer)
+        self._dauer += dauer
+        if not self._gemeldet and self._dauer * 1000 >= LANGSAM_MS:
+            self._gemeldet = True
+            _langsam_melden(self.connection, self._sql, self._params, self._dauer)
+
+    def _neu(self, sql, params):
+        self._sql, self._params, self._dauer, self._gemeldet = sql, params, 0.0, False
+
+    def execute(self, sql, params=()):
+        self._neu(sql, params)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._zeit(start)
+
+    def executemany(self, sql, seq_of_params):
+        self._neu(sql, None)  # Parameterliste ist danach verbraucht – ohne Plan
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self._zeit(start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._zeit(start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._zeit(start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._zeit(start)
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._zeit(start)
+
+class Verbindung(sqlite3.Connection):
+    """sqlite3-Verbindung, deren Anweisungen in die laufende Messung eingehen."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Kennung statt gebundener Methode: kein Referenzzyklus Verbindung <-> Callback
+        self.set_trace_callback(partial(_trace, id(self)))
+
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
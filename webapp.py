@@ -1,21 +1,48 @@
 
-from flask import Flask, render_template_string, request, redirect, session, Response, url_for
+from flask import Flask, render_template, request, redirect, session, Response, url_for, stream_with_context
 import sqlite3
 from datetime import datetime
 from datetime import timedelta
 import csv
 import io
 import time
-import re
+import base64
+import itertools
 from datetime import datetime
-import requests
-from bs4 import BeautifulSoup
 import os
-from flask import send_file, abort
+import click
+from flask import abort, g, send_file
+from jinja2 import FileSystemBytecodeCache
+import threading
+import secrets
+from functools import partial
+import archiv
+import brotpreis as brotpreis_quelle
+import metriken
+import passwoerter
+import sicherung
+import sqlprotokoll
+import zehntel
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-change-me")
 
+# Seitenvorlagen (templates/) einmal beim Import kompilieren. Die Jinja-Umgebung
+# der App hält sie danach im Speicher; der Bytecode-Cache spart das Kompilieren
+# auch beim Neustart der gunicorn-Worker.
+TEMPLATES = (
+    "start.html",
+    "system.html",
+    "startseite.html",
+    "brotpreis_admin.html",
+    "login.html",
+    "fehler_ueberziehung.html",
+    "fehler_buchung.html",
+)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+for _name in TEMPLATES:
+    app.jinja_env.get_template(_name)
+
 def render_banner(status):
     if status and status.get("maintenance"):
         return f'''
@@ -32,12 +59,55 @@ def render_banner(status):
 
 import json
 
+STATUS_PATH = os.environ.get("STATUS_JSON", "/srv/app/Wieshof/static/status.json")
+STATUS_DEFAULT = {"maintenance": False, "message": ""}
+
+class StatusDatei:
+    """
+    status.json samt fertigem Banner-HTML im Speicher. Die Datei wird höchstens
+    einmal je pruef_abstand Sekunden per stat() geprüft und nur bei geänderter
+    mtime/Größe neu eingelesen; fehlt sie, gilt STATUS_DEFAULT.
+    """
+
+    def __init__(self, pfad, pruef_abstand=1.0):
+        self.pfad = pfad
+        self.pruef_abstand = pruef_abstand
+        self._naechste_pruefung = 0.0
+        self._kennung = None
+        self._stand = (STATUS_DEFAULT, render_banner(STATUS_DEFAULT))
+
+    def _aktualisieren(self):
+        jetzt = time.monotonic()
+        if jetzt < self._naechste_pruefung:
+            return self._stand
+        self._naechste_pruefung = jetzt + self.pruef_abstand
+        try:
+            st = os.stat(self.pfad)
+            kennung = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            kennung = None
+        if kennung != self._kennung:
+            status = STATUS_DEFAULT
+            if kennung is not None:
+                try:
+                    with open(self.pfad) as f:
+                        status = json.load(f)
+                except Exception:
+                    pass
+            self._kennung = kennung
+            self._stand = (status, render_banner(status))
+        return self._stand
+
+    def status(self):
+        return self._aktualisieren()[0]
+
+    def banner(self):
+        return self._aktualisieren()[1]
+
+status_datei = StatusDatei(STATUS_PATH)
+
 def load_status():
-    try:
-        with open("/srv/app/Wieshof/static/status.json") as f:
-            return json.load(f)
-    except Exception:
-        return {"maintenance": False, "message": ""}
+    return status_datei.status()
 
 # Basis-Ordner = der Ordner, in dem dieses Skript liegt
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -45,11 +115,312 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # DB-Datei liegt im selben Ordner wie das Skript
 DB_PATH = os.path.join(BASE_DIR, 'verrechnung.db')
 
-def db_connection():
-    return sqlite3.connect(DB_PATH)
+# Einmal je Verbindung gesetzt: WAL, damit Leser nicht auf Schreiber (z. B. den
+# Gebühren-Job) warten, dazu Wartezeit bei Sperren und größere Caches.
+SQLITE_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+)
+
+def db_connection(check_same_thread=True):
+    """Neue, fertig eingestellte Verbindung. Der Aufrufer schließt sie selbst."""
+    if sqlprotokoll.AKTIV:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread, factory=sqlprotokoll.Verbindung)
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=check_same_thread)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def schreibsperre_holen(c, ort):
+    """BEGIN IMMEDIATE; die Wartezeit auf die Sperre geht nach /metrics."""
+    start = time.perf_counter()
+    c.execute("BEGIN IMMEDIATE")
+    metriken.sperre_warten.labels(ort).observe(time.perf_counter() - start)
+
+# Verbindungspool je Prozess (gunicorn-Worker). Ein Request leiht sich beim ersten
+# get_db() eine Verbindung und gibt sie in teardown_appcontext zurück.
+POOL_MAX_IDLE = 4
+_pool = []
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _pool_holen():
+    # Schema und Migrationen laufen beim Start (gunicorn.conf.py bzw.
+    # "flask datenbank-einrichten"), nicht im Request
+    global _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            # nach fork keine Verbindungen des Elternprozesses weiterverwenden
+            _pool.clear()
+            _pool_pid = os.getpid()
+        elif _pool:
+            return _pool.pop()
+    return db_connection(check_same_thread=False)
+
+def _pool_zurueck(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        if _pool_pid == os.getpid() and len(_pool) < POOL_MAX_IDLE:
+            _pool.append(conn)
+            return
+    conn.close()
+
+def get_db():
+    """Verbindung des aktuellen App-Kontexts; nicht selbst schließen."""
+    if "db" not in g:
+        g.db = _pool_holen()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        _pool_zurueck(conn)
+
+# SQL-Messung je Request (sqlprotokoll, nur mit SQL_MESSUNG=1): vor allen
+# anderen before_request-Hooks, damit auch die Sitzungsprüfung mitzählt.
+@app.before_request
+def sql_messung_beginnen():
+    if not sqlprotokoll.AKTIV:
+        return
+    g.sql_token = sqlprotokoll.beginnen(f"{request.method} {request.path}", verschachtelt=False)
+
+def _sql_messung_abschliessen(token):
+    messung = sqlprotokoll.beenden(token)
+    if sqlprotokoll.PROTOKOLL and messung is not None:
+        print(f"[sql] {messung.zusammenfassung()}")
+
+def _am_stream_ende(teile, abschluss):
+    try:
+        yield from teile
+    finally:
+        abschluss()
+
+@app.after_request
+def sql_messung_header(response):
+    messung = sqlprotokoll.aktuell()
+    if messung is None:
+        return response
+    # Interne Zeiten nur für den Admin. Bei gestreamten Antworten (Export) steht
+    # im Kopf nur der Teil bis hierher.
+    if session.get("user") == "admin":
+        response.headers["Server-Timing"] = f'sql;dur={messung.ms():.1f};desc="{messung.anweisungen} Anweisungen"'
+    if response.is_streamed and "sql_token" in g:
+        # Messung erst nach dem letzten Block beenden, sonst fehlt der Export selbst
+        response.response = _am_stream_ende(response.response, partial(_sql_messung_abschliessen, g.pop("sql_token")))
+    return response
+
+@app.teardown_request
+def sql_messung_beenden(exc):
+    token = g.pop("sql_token", None)
+    if token is not None:
+        _sql_messung_abschliessen(token)
+
+# Antwortzeit je Route für /metrics (metriken.request_dauer)
+@app.before_request
+def metrik_start():
+    g.metrik_start = time.perf_counter()
+
+@app.after_request
+def metrik_request_dauer(response):
+    start = g.pop("metrik_start", None)
+    if start is None or request.endpoint == "metrics":
+        return response
+    # Regel statt Pfad, damit die Zahl der Zeitreihen begrenzt bleibt
+    route = request.url_rule.rule if request.url_rule is not None else "-"
+    beobachten = metriken.request_dauer.labels(route, request.method)
+    if response.is_streamed:
+        response.response = _am_stream_ende(
+            response.response, lambda: beobachten.observe(time.perf_counter() - start))
+    else:
+        beobachten.observe(time.perf_counter() - start)
+    return response
+
+# --- Einstellungen ----------------------------------------------------------
+# Brotpreis (settings) und Konfigurationswerte (systemstatus) werden je Prozess
+# im Speicher gehalten. Nach Ablauf der TTL wird nur der Zähler
+# 'settings_version' gelesen; erst wenn ein anderer Worker (oder ein manueller
+# Eingriff, siehe Trigger aus Migration 5) ihn erhöht hat, wird neu geladen.
+BROTPREIS_KEY = "brotpreis_eur_pro_punkt"
+BROTPREIS_DEFAULT = 8.38
+SETTINGS_VERSION_KEY = "settings_version"
+KONFIG_SCHLUESSEL = ("overdraft_start_allowance", "overdraft_income_percent")
+SETTINGS_CACHE_TTL = float(os.environ.get("SETTINGS_CACHE_TTL", "30"))
+
+class EinstellungsCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._werte = None
+        self._version = None
+        self._gueltig_bis = 0.0
+
+    def _version_lesen(self, c):
+        c.execute("SELECT value FROM systemstatus WHERE key = ?", (SETTINGS_VERSION_KEY,))
+        row = c.fetchone()
+        return int(row[0]) if row else 0
+
+    def _laden(self, c):
+        c.execute("SELECT value, updated_at FROM settings WHERE key = ?", (BROTPREIS_KEY,))
+        row = c.fetchone()
+        if row:
+            brotpreis = (float(row[0]), row[1])
+        else:
+            brotpreis = (BROTPREIS_DEFAULT, "")
+        platzhalter = ",".join("?" * len(KONFIG_SCHLUESSEL))
+        c.execute(f"SELECT key, value FROM systemstatus WHERE key IN ({platzhalter})", KONFIG_SCHLUESSEL)
+        return {"brotpreis": brotpreis, "konfig": dict(c.fetchall())}
+
+    def werte(self, conn=None):
+        """Aktuelle Werte; ohne conn über get_db() (nur im App-Kontext)."""
+        jetzt = time.monotonic()
+        werte = self._werte
+        if werte is not None and jetzt < self._gueltig_bis:
+            return werte
+        with self._lock:
+            if self._werte is not None and jetzt < self._gueltig_bis:
+                return self._werte
+            c = (conn if conn is not None else get_db()).cursor()
+            version = self._version_lesen(c)
+            if self._werte is None or version != self._version:
+                self._werte = self._laden(c)
+                self._version = version
+            self._gueltig_bis = time.monotonic() + self.ttl
+            return self._werte
+
+    def invalidieren(self):
+        with self._lock:
+            self._werte = None
+            self._gueltig_bis = 0.0
+
+einstellungen = EinstellungsCache(SETTINGS_CACHE_TTL)
+
+def get_brotpreis_eur_pro_punkt():
+    """(Preis, Zeitstempel) aus dem Einstellungs-Cache."""
+    return einstellungen.werte()["brotpreis"]
 
-def ensure_settings_table(conn):
+def set_brotpreis_eur_pro_punkt(value, source_label="Bäckerei Schüren"):
+    conn = get_db()
     c = conn.cursor()
+    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # Der Trigger auf settings erhöht settings_version für die anderen Worker
+    c.execute("""
+        INSERT INTO settings (key, value, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
+    """, (BROTPREIS_KEY, str(float(value)), ts))
+    conn.commit()
+    einstellungen.invalidieren()
+    return ts
+
+def touch_brotpreis_eur_pro_punkt(source_label="Refresh (unverändert)"):
+    """Nur den Zeitstempel erneuern, der Wert bleibt."""
+    conn = get_db()
+    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("UPDATE settings SET updated_at = ? WHERE key = ?", (ts, BROTPREIS_KEY))
+    conn.commit()
+    einstellungen.invalidieren()
+    return ts
+
+# Validatoren des letzten Treffers für den bedingten GET (If-None-Match / If-Modified-Since)
+BROTPREIS_ETAG_KEY = "brotpreis_etag"
+BROTPREIS_LAST_MODIFIED_KEY = "brotpreis_last_modified"
+
+def brotpreis_aktualisieren():
+    """
+    Ein Abruf der Bäckerei-Seite, ohne Request-Kontext aufrufbar. Ergebnis:
+    - Wenn ein Preis gefunden wird -> Wert + Zeitstempel aktualisieren.
+    - Wenn die Seite unverändert ist (304) oder KEIN Preis gefunden wird -> nur den Zeitstempel.
+    - Wenn es einen Fehler gibt (kein Internet etc.) -> ebenfalls nur den Zeitstempel.
+    """
+    with app.app_context():
+        conn = get_db()
+        c = conn.cursor()
+        c.execute("SELECT key, value FROM settings WHERE key IN (?, ?)",
+                  (BROTPREIS_ETAG_KEY, BROTPREIS_LAST_MODIFIED_KEY))
+        validatoren = dict(c.fetchall())
+        status, preis, etag, last_modified = brotpreis_quelle.abrufen(
+            etag=validatoren.get(BROTPREIS_ETAG_KEY),
+            last_modified=validatoren.get(BROTPREIS_LAST_MODIFIED_KEY),
+        )
+        if status == brotpreis_quelle.NEU:
+            ts = set_brotpreis_eur_pro_punkt(preis, source_label="Bäckerei Schüren (Web)")
+            for key, value in ((BROTPREIS_ETAG_KEY, etag), (BROTPREIS_LAST_MODIFIED_KEY, last_modified)):
+                if value:
+                    c.execute("INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, ?)",
+                              (key, value, ts))
+                else:
+                    c.execute("DELETE FROM settings WHERE key = ?", (key,))
+            conn.commit()
+        elif status == brotpreis_quelle.FEHLER:
+            touch_brotpreis_eur_pro_punkt("Refresh (Fehler, Wert unverändert)")
+        else:
+            touch_brotpreis_eur_pro_punkt("Refresh (unverändert)")
+        print(f"[brotpreis] Abruf: status={status}, preis={preis}")
+        return status
+
+brotpreis_aktualisierer = brotpreis_quelle.Aktualisierer(
+    brotpreis_aktualisieren,
+    min_abstand=float(os.environ.get("BROTPREIS_MIN_ABSTAND", "60")),
+)
+
+# Schema-Versionen: jede Migration bringt die DB von (version - 1) auf version.
+# Die Basistabellen aus erstelle_datenbank() entsprechen Version 0.
+SCHEMA_VERSION_KEY = "schema_version"
+
+def _migration_1_transaktionen_indizes(c):
+    """
+    Indizes für die Zugriffe nach Konto: balance_as_of, has_positive_balance,
+    ytd_income, Verlauf auf /start und /export. Die Zusatzspalten machen die
+    Indizes für Kontostand- und Einkommensabfragen abdeckend (kein Tabellenzugriff).
+    """
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_transaktionen_von_datum
+        ON transaktionen (von, datum, id, stand_von_neu, betrag, beschreibung, an)
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_transaktionen_an_datum
+        ON transaktionen (an, datum, id, stand_an_neu, betrag, beschreibung)
+    """)
+
+def _migration_2_monatsabschluss(c):
+    """EoM-Stände je Monat und Konto, geschrieben von berechne_monatsabschluesse()."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS monatsabschluss (
+            monat TEXT NOT NULL,
+            konto TEXT NOT NULL,
+            stand REAL NOT NULL,
+            PRIMARY KEY (monat, konto)
+        ) WITHOUT ROWID
+    """)
+
+def _migration_3_einkommen_jahr(c):
+    """Laufendes Jahreseinkommen je Konto für overdraft_limit(), aus dem Hauptbuch befüllt."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS einkommen_jahr (
+            konto TEXT NOT NULL,
+            jahr TEXT NOT NULL,
+            summe REAL NOT NULL,
+            PRIMARY KEY (konto, jahr)
+        ) WITHOUT ROWID
+    """)
+    _einkommen_aus_hauptbuch(c)
+
+def _migration_4_transaktionen_datum_index(c):
+    """Index für die chronologischen Exporte (Keyset über (datum, id))."""
+    c.execute("CREATE INDEX IF NOT EXISTS ix_transaktionen_datum ON transaktionen (datum, id)")
+
+def _migration_5_einstellungen(c):
+    """
+    settings-Tabelle samt Startwert (bisher bei jedem Lesen angelegt) und
+    Versionszähler für den Einstellungs-Cache. Die Trigger erhöhen den Zähler
+    bei jeder Änderung – auch bei Eingriffen außerhalb der App.
+    """
     c.execute("""
         CREATE TABLE IF NOT EXISTS settings (
             key TEXT PRIMARY KEY,
@@ -57,35 +428,237 @@ def ensure_settings_table(conn):
             updated_at TEXT NOT NULL
         )
     """)
-    conn.commit()
+    c.execute("INSERT OR IGNORE INTO settings (key, value, updated_at) VALUES (?, ?, ?)",
+              (BROTPREIS_KEY, str(BROTPREIS_DEFAULT), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    c.execute("INSERT OR IGNORE INTO systemstatus (key, value) VALUES (?, '0')", (SETTINGS_VERSION_KEY,))
+    erhoehen = ("UPDATE systemstatus SET value = CAST(value AS INTEGER) + 1 "
+                f"WHERE key = '{SETTINGS_VERSION_KEY}'")
+    konfig = ", ".join(f"'{k}'" for k in KONFIG_SCHLUESSEL)
+    for ereignis in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS tr_settings_{ereignis.lower()}_version
+            AFTER {ereignis} ON settings
+            BEGIN {erhoehen}; END
+        """)
+    for ereignis, zeile in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS tr_systemstatus_{ereignis.lower()}_version
+            AFTER {ereignis} ON systemstatus
+            WHEN {zeile}.key IN ({konfig})
+            BEGIN {erhoehen}; END
+        """)
+
+def _migration_6_sitzungen(c):
+    """Angemeldete Sitzungen für alle Worker; der Index trägt das Aufräumen abgelaufener Zeilen."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS sitzungen (
+            sid TEXT PRIMARY KEY,
+            benutzer TEXT NOT NULL,
+            angelegt REAL NOT NULL,
+            zuletzt REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS ix_sitzungen_zuletzt ON sitzungen (zuletzt)")
 
-def get_brotpreis_eur_pro_punkt(default_value=8.38):
-    conn = db_connection()
-    ensure_settings_table(conn)
-    c = conn.cursor()
-    c.execute("SELECT value, updated_at FROM settings WHERE key = 'brotpreis_eur_pro_punkt'")
+def _migration_7_konto_buchungen(c):
+    """
+    Eine Zeile je (Konto, Transaktion) für den Verlauf auf /start. Gepflegt per
+    Trigger – damit auch von Buchungsdienst, Parkgebühr-Nachholung und allem,
+    was künftig in transaktionen schreibt oder löscht.
+    """
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS konto_buchungen (
+            konto TEXT NOT NULL,
+            tx_id INTEGER NOT NULL,
+            PRIMARY KEY (konto, tx_id)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        INSERT OR IGNORE INTO konto_buchungen (konto, tx_id)
+        SELECT von, id FROM transaktionen WHERE von IS NOT NULL
+        UNION ALL
+        SELECT an, id FROM transaktionen WHERE an IS NOT NULL
+    """)
+    _konto_buchungen_trigger(c)
+
+def _konto_buchungen_trigger(c):
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS tr_transaktionen_konto_buchungen_insert
+        AFTER INSERT ON transaktionen
+        BEGIN
+            INSERT OR IGNORE INTO konto_buchungen (konto, tx_id)
+            SELECT NEW.von, NEW.id WHERE NEW.von IS NOT NULL
+            UNION ALL
+            SELECT NEW.an, NEW.id WHERE NEW.an IS NOT NULL;
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS tr_transaktionen_konto_buchungen_delete
+        AFTER DELETE ON transaktionen
+        BEGIN
+            DELETE FROM konto_buchungen WHERE konto IN (OLD.von, OLD.an) AND tx_id = OLD.id;
+        END
+    """)
+
+def _migration_8_zehntel(c):
+    """
+    Punktwerte als ganze Zehntel (siehe zehntel.py). konten, transaktionen,
+    monatsabschluss und einkommen_jahr werden mit INTEGER-Spalten neu aufgebaut –
+    in den bisher als REAL deklarierten Spalten bliebe auch eine ganze Zahl ein
+    float. Indizes und Trigger auf transaktionen entstehen danach neu, die
+    AUTOINCREMENT-Zähler bleiben erhalten.
+    """
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'")
+    sequenzen = {}
+    if c.fetchone():
+        c.execute("SELECT name, seq FROM sqlite_sequence WHERE name IN ('konten', 'transaktionen')")
+        sequenzen = dict(c.fetchall())
+
+    c.execute("""
+        CREATE TABLE konten_neu (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            typ TEXT,
+            punkte INTEGER NOT NULL DEFAULT 0,
+            letzte_aktivitaet TEXT,
+            besitzer TEXT
+        )
+    """)
+    c.execute("""
+        INSERT INTO konten_neu (id, name, typ, punkte, letzte_aktivitaet, besitzer)
+        SELECT id, name, typ, CAST(ROUND(COALESCE(punkte, 0) * 10) AS INTEGER), letzte_aktivitaet, besitzer
+        FROM konten
+    """)
+    c.execute("DROP TABLE konten")
+    c.execute("ALTER TABLE konten_neu RENAME TO konten")
+
+    c.execute("""
+        CREATE TABLE transaktionen_neu (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            von TEXT,
+            an TEXT,
+            betrag INTEGER,
+            kulturbeitrag INTEGER,
+            brutto INTEGER,
+            netto INTEGER,
+            beschreibung TEXT,
+            datum TEXT,
+            stand_von_alt INTEGER,
+            stand_von_neu INTEGER,
+            stand_an_alt INTEGER,
+            stand_an_neu INTEGER
+        )
+    """)
+    zehntel_sql = {s: f"CAST(ROUND({s} * 10) AS INTEGER)" for s in (
+        "betrag", "kulturbeitrag", "brutto", "netto",
+        "stand_von_alt", "stand_von_neu", "stand_an_alt", "stand_an_neu")}
+    c.execute(f"""
+        INSERT INTO transaktionen_neu
+        SELECT id, von, an, {zehntel_sql["betrag"]}, {zehntel_sql["kulturbeitrag"]},
+               {zehntel_sql["brutto"]}, {zehntel_sql["netto"]}, beschreibung, datum,
+               {zehntel_sql["stand_von_alt"]}, {zehntel_sql["stand_von_neu"]},
+               {zehntel_sql["stand_an_alt"]}, {zehntel_sql["stand_an_neu"]}
+        FROM transaktionen
+    """)
+    c.execute("DROP TABLE transaktionen")
+    c.execute("ALTER TABLE transaktionen_neu RENAME TO transaktionen")
+    _migration_1_transaktionen_indizes(c)
+    _migration_4_transaktionen_datum_index(c)
+    _konto_buchungen_trigger(c)
+
+    for tabelle, seq in sequenzen.items():
+        c.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq, tabelle))
+
+    c.execute("""
+        CREATE TABLE monatsabschluss_neu (
+            monat TEXT NOT NULL,
+            konto TEXT NOT NULL,
+            stand INTEGER NOT NULL,
+            PRIMARY KEY (monat, konto)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        INSERT INTO monatsabschluss_neu
+        SELECT monat, konto, CAST(ROUND(stand * 10) AS INTEGER) FROM monatsabschluss
+    """)
+    c.execute("DROP TABLE monatsabschluss")
+    c.execute("ALTER TABLE monatsabschluss_neu RENAME TO monatsabschluss")
+
+    c.execute("DROP TABLE einkommen_jahr")
+    c.execute("""
+        CREATE TABLE einkommen_jahr (
+            konto TEXT NOT NULL,
+            jahr TEXT NOT NULL,
+            summe INTEGER NOT NULL,
+            PRIMARY KEY (konto, jahr)
+        ) WITHOUT ROWID
+    """)
+    _einkommen_aus_hauptbuch(c)
+
+def _migration_9_transaktionen_monat_index(c):
+    """
+    Index für den Monatsbericht: nach Monat sortiert und für den Admin-Bericht
+    abdeckend – GROUP BY substr(datum, 1, 7) läuft so ohne Sortierung und
+    ohne Tabellenzugriff.
+    """
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_transaktionen_monat
+        ON transaktionen (substr(datum, 1, 7), datum, brutto, netto, kulturbeitrag)
+    """)
+
+def _migration_10_archive(c):
+    """Verzeichnis der per Jahresabschluss ausgelagerten Jahre (archiv.py)."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS archive (
+            jahr INTEGER PRIMARY KEY,
+            datei TEXT NOT NULL,
+            bis TEXT NOT NULL,
+            zeilen INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            erstellt TEXT NOT NULL
+        )
+    """)
+
+MIGRATIONS = [
+    (1, _migration_1_transaktionen_indizes),
+    (2, _migration_2_monatsabschluss),
+    (3, _migration_3_einkommen_jahr),
+    (4, _migration_4_transaktionen_datum_index),
+    (5, _migration_5_einstellungen),
+    (6, _migration_6_sitzungen),
+    (7, _migration_7_konto_buchungen),
+    (8, _migration_8_zehntel),
+    (9, _migration_9_transaktionen_monat_index),
+    (10, _migration_10_archive),
+]
+
+def get_schema_version(c):
+    c.execute("SELECT value FROM systemstatus WHERE key = ?", (SCHEMA_VERSION_KEY,))
     row = c.fetchone()
-    conn.close()
-    if row:
-        return float(row[0]), row[1]
-    else:
-        # default initial eintragen
-        set_brotpreis_eur_pro_punkt(default_value, source_label="Initial (manuell)")
-        return default_value, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return int(row[0]) if row else 0
 
-def set_brotpreis_eur_pro_punkt(value, source_label="Bäckerei Schüren"):
-    conn = db_connection()
-    ensure_settings_table(conn)
+def migriere_datenbank(conn):
+    """
+    Spielt alle noch fehlenden Migrationen ein. Jede Migration läuft in einer
+    eigenen Schreibtransaktion (BEGIN IMMEDIATE), die Version wird innerhalb
+    der Sperre erneut gelesen – parallel startende Prozesse migrieren also
+    nicht doppelt.
+    """
     c = conn.cursor()
-    ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    c.execute("""
-        INSERT INTO settings (key, value, updated_at)
-        VALUES ('brotpreis_eur_pro_punkt', ?, ?)
-        ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at
-    """, (str(float(value)), ts))
-    conn.commit()
-    conn.close()
-    return ts
+    for version, schritt in MIGRATIONS:
+        if get_schema_version(c) >= version:
+            continue
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(c) < version:
+                schritt(c)
+                c.execute("INSERT OR REPLACE INTO systemstatus (key, value) VALUES (?, ?)",
+                          (SCHEMA_VERSION_KEY, str(version)))
+                print(f"[schema] Migration {version} ({schritt.__name__}) eingespielt")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 def erstelle_datenbank():
     conn = db_connection()
@@ -127,8 +700,9 @@ def erstelle_datenbank():
         benutzer_login TEXT NOT NULL,
         UNIQUE(konto_id, benutzer_login)
     )''')
-
     conn.commit()
+
+    migriere_datenbank(conn)
     conn.close()
 
 def month_key(dt):
@@ -144,6 +718,15 @@ def add_month(key_yyyy_mm):
         m = 1
     return f"{y}-{m:02d}"
 
+def sub_month(key_yyyy_mm):
+    """Verringert einen 'YYYY-MM'-Key um 1 Monat."""
+    y, m = map(int, key_yyyy_mm.split('-'))
+    m -= 1
+    if m == 0:
+        y -= 1
+        m = 12
+    return f"{y}-{m:02d}"
+
 def previous_month_key(dt):
     """Gibt den Vormonat als 'YYYY-MM' zurück."""
     y, m = dt.year, dt.month
@@ -166,59 +749,109 @@ def eom_cutoff(month_key: str) -> str:
     return cutoff.strftime('%Y-%m-%d %H:%M:%S')
 
 
-def balance_as_of(conn, konto_name: str, cutoff_str: str) -> float:
+def balance_as_of(conn, konto_name: str, cutoff_str: str) -> int:
     """
-    Kontostand des Kontos zum Zeitpunkt 'cutoff_str' (<= cutoff), basierend
-    auf Transaktionshistorie. Wenn bis dahin keine Transaktion: 0.0.
+    Kontostand des Kontos (in Zehntel) zum Zeitpunkt 'cutoff_str' (<= cutoff),
+    basierend auf Transaktionshistorie. Wenn bis dahin keine Transaktion: 0.
     """
     c = conn.cursor()
+    # Je Seite nur die jüngste Zeile aus dem Index holen, dann die jüngere der beiden nehmen
     c.execute("""
-        WITH tx AS (
-          SELECT id, datum, von AS konto, stand_von_neu AS stand_neu
-          FROM transaktionen
-          WHERE von = ? AND datum <= ?
+        SELECT stand_neu FROM (
+          SELECT * FROM (
+            SELECT id, datum, stand_von_neu AS stand_neu
+            FROM transaktionen
+            WHERE von = ? AND datum <= ?
+            ORDER BY datum DESC, id DESC
+            LIMIT 1
+          )
           UNION ALL
-          SELECT id, datum, an AS konto, stand_an_neu AS stand_neu
-          FROM transaktionen
-          WHERE an = ? AND datum <= ?
+          SELECT * FROM (
+            SELECT id, datum, stand_an_neu AS stand_neu
+            FROM transaktionen
+            WHERE an = ? AND datum <= ?
+            ORDER BY datum DESC, id DESC
+            LIMIT 1
+          )
         )
-        SELECT stand_neu
-        FROM tx
         ORDER BY datum DESC, id DESC
         LIMIT 1
     """, (konto_name, cutoff_str, konto_name, cutoff_str))
     row = c.fetchone()
     if row and row[0] is not None:
-        try:
-            return float(row[0])
-        except Exception:
-            return 0.0
-    return 0.0
+        return row[0]
+    return 0
+
+
+
+def berechne_monatsabschluesse(conn, monate):
+    """
+    Ermittelt die EoM-Stände aller Konten für die aufsteigend sortierten Monate
+    'monate' ('YYYY-MM') in EINEM geordneten Durchlauf über das Hauptbuch und
+    speichert sie in 'monatsabschluss'. Liefert {monat: {konto: stand}}.
+
+    Liegt für den Vormonat des ersten Monats bereits ein Abschluss vor, wird
+    von dort aus weitergerechnet und nur der Rest des Hauptbuchs gelesen.
+    Die Stände entsprechen balance_as_of() (letzte Zeile <= Cutoff, bei
+    von == an zählt die von-Seite); Konten ohne Buchung stehen auf 0.
+    """
+    if not monate:
+        return {}
+    c = conn.cursor()
+
+    c.execute("SELECT name FROM konten")
+    konto_namen = [r[0] for r in c.fetchall()]
 
+    vormonat = sub_month(monate[0])
+    c.execute("SELECT konto, stand FROM monatsabschluss WHERE monat = ?", (vormonat,))
+    stand = dict(c.fetchall())
+    untergrenze = eom_cutoff(vormonat) if stand else ""
 
+    ergebnis = {}
+    i = 0
+    cutoff = eom_cutoff(monate[0])
+    c.execute("""
+        SELECT datum, von, an, stand_von_neu, stand_an_neu
+        FROM transaktionen
+        WHERE datum > ? AND datum <= ?
+        ORDER BY datum, id
+    """, (untergrenze, eom_cutoff(monate[-1])))
+    for datum, von, an, stand_von_neu, stand_an_neu in c:
+        while datum > cutoff:
+            ergebnis[monate[i]] = {name: stand.get(name, 0) for name in konto_namen}
+            i += 1
+            cutoff = eom_cutoff(monate[i])
+        stand[an] = stand_an_neu if stand_an_neu is not None else 0
+        stand[von] = stand_von_neu if stand_von_neu is not None else 0
+    while i < len(monate):
+        ergebnis[monate[i]] = {name: stand.get(name, 0) for name in konto_namen}
+        i += 1
+
+    c.executemany(
+        "INSERT OR REPLACE INTO monatsabschluss (monat, konto, stand) VALUES (?, ?, ?)",
+        [(monat, name, wert) for monat, staende in ergebnis.items() for name, wert in staende.items()])
+    conn.commit()
+    return ergebnis
 
 def apply_parkgebuehr_catchup(now=None):
-    if now is None:
-        now = datetime.now()
     """
     Holt verpasste Monate nach und bucht für jeden ausstehenden Monat 1% auf Basis des
     EoM-Kontostands (Stand am Monatsende 23:59:59) von allen positiven Guthaben
     (Kulturfonds ausgenommen) ab und schreibt sie dem Kulturfonds gut.
     Idempotent pro Monat (merkt 'last_fee_month' in systemstatus).
+    'now' (Standard: jetzt) bestimmt den Zielmonat und das Buchungsdatum.
     """
+    if now is None:
+        now = datetime.now()
     conn = db_connection()
     c = conn.cursor()
 
-    now = datetime.now()
     target_month = previous_month_key(now)  # bis inkl. Vormonat aufholen
 
     # letzten erledigten Monat lesen (falls keiner: so initialisieren,
     # dass NICHT rückwirkend gebucht wird)
-    c.execute("SELECT value FROM systemstatus WHERE key = 'last_fee_month'")
-    row = c.fetchone()
-    if row:
-        last_done = row[0]
-    else:
+    last_done = get_systemstatus(conn, 'last_fee_month')
+    if last_done is None:
         # Erster Lauf: so initialisieren, dass der Vormonat JETZT gebucht wird.
         # Die Schleife unten startet mit: current = add_month(last_done).
         # Deshalb setzen wir last_done auf "zwei Monate zurück", damit current = Vormonat.
@@ -252,59 +885,196 @@ def apply_parkgebuehr_catchup(now=None):
     """)
     konto_namen = [r[0] for r in c.fetchall()]
 
-    # Monat für Monat aufholen
-    current = add_month(last_done)
+    # EoM-Stände aller ausstehenden Monate in einem Durchlauf ermitteln
+    monate = []
+    m = add_month(last_done)
+    while m <= target_month:
+        monate.append(m)
+        m = add_month(m)
+    with sqlprotokoll.phase("fees:monatsabschluesse"):
+        abschluesse = berechne_monatsabschluesse(conn, monate)
+
     jetzt_str = now.strftime('%Y-%m-%d %H:%M:%S')
 
-    while current <= target_month:
-        cutoff = eom_cutoff(current)
+    # Ab hier wird gebucht: Schreibsperre erst jetzt holen und innerhalb der Sperre
+    # prüfen, dass nicht inzwischen ein anderer Lauf dieselben Monate gebucht hat.
+    schreibsperre_holen(c, "parkgebuehr")
+    if get_systemstatus(conn, 'last_fee_month') != last_done:
+        conn.rollback()
+        print(f"[fees] last_fee_month wurde parallel geändert – breche ab (erwartet {last_done})")
+        conn.close()
+        return
+
+    # IST-Stände einmal laden und unter der Sperre in Python fortschreiben
+    c.execute("SELECT name, punkte FROM konten")
+    punkte = dict(c.fetchall())
 
-        # Kulturfonds-Kontostand alt (für Logging)
-        c.execute("SELECT punkte FROM konten WHERE name = ?", (kulturfonds,))
-        kk_alt = c.fetchone()[0]
+    # Monat für Monat aufholen, je Monat ein Stapel
+    gebucht = 0
+    for current in monate:
+        eom_staende = abschluesse[current]
+        beschreibung = f"[Parkgebühr 1% für {current} (EoM-Basis)]"
+        abbuchungen = []
+        buchungen = []
 
         for name in konto_namen:
-            # EoM-Stand für diesen Monat bestimmen
-            eom_stand = balance_as_of(conn, name, cutoff)
+            eom_stand = eom_staende.get(name, 0)
             if eom_stand <= 0:
                 continue
 
-            gebuehr = round(eom_stand * 0.01, 1)  # 1 Nachkommastelle wie bei dir üblich
+            gebuehr = zehntel.anteil(eom_stand, 1)
             if gebuehr <= 0:
                 continue
 
-            # Altstand des Kontos (aktueller IST-Stand, da wir jetzt buchen)
-            c.execute("SELECT punkte FROM konten WHERE name = ?", (name,))
-            alt_von = c.fetchone()[0]
-
-            # Abbuchen / Gutschreiben
-            c.execute("UPDATE konten SET punkte = punkte - ?, letzte_aktivitaet = ? WHERE name = ?", (gebuehr, jetzt_str, name))
-            c.execute("UPDATE konten SET punkte = punkte + ?, letzte_aktivitaet = ? WHERE name = ?", (gebuehr, jetzt_str, kulturfonds))
-
-            # Neue Stände nach Buchung
-            c.execute("SELECT punkte FROM konten WHERE name = ?", (name,))
-            neu_von = c.fetchone()[0]
-            c.execute("SELECT punkte FROM konten WHERE name = ?", (kulturfonds,))
-            neu_an = c.fetchone()[0]
+            # Stände wie bei Einzelbuchung: Konto gegen IST-Stand, Kulturfonds fortlaufend
+            alt_von = punkte[name]
+            neu_von = alt_von - gebuehr
+            kk_alt = punkte[kulturfonds]
+            kk_neu = kk_alt + gebuehr
+            punkte[name] = neu_von
+            punkte[kulturfonds] = kk_neu
 
+            abbuchungen.append((gebuehr, jetzt_str, name))
             # Transaktion erfassen (kein zusätzlicher 5%-Kulturbeitrag)
-            c.execute('''INSERT INTO transaktionen 
+            buchungen.append((name, kulturfonds, gebuehr, gebuehr, gebuehr, beschreibung, jetzt_str,
+                              alt_von, neu_von, kk_alt, kk_neu))
+
+        # Parkgebühren zählen nicht als Einkommen (einkommen_jahr bleibt unberührt)
+        if buchungen:
+            c.executemany("UPDATE konten SET punkte = punkte - ?, letzte_aktivitaet = ? WHERE name = ?", abbuchungen)
+            # Kulturfonds: eine Sammelbuchung auf den fortgeschriebenen Endstand
+            c.execute("UPDATE konten SET punkte = ?, letzte_aktivitaet = ? WHERE name = ?",
+                      (punkte[kulturfonds], jetzt_str, kulturfonds))
+            c.executemany('''INSERT INTO transaktionen
                 (von, an, betrag, kulturbeitrag, brutto, netto, beschreibung, datum,
                  stand_von_alt, stand_von_neu, stand_an_alt, stand_an_neu)
-                VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (name, kulturfonds, gebuehr, gebuehr, gebuehr,
-                 f"[Parkgebühr 1% für {current} (EoM-Basis)]", jetzt_str,
-                 alt_von, neu_von, kk_alt, neu_an))
-
-            kk_alt = neu_an  # fürs nächste Konto fortschreiben
+                VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?, ?, ?, ?)''', buchungen)
 
         # Monat als erledigt markieren, weiter
         c.execute("INSERT OR REPLACE INTO systemstatus (key, value) VALUES ('last_fee_month', ?)", (current,))
-        print(f"[fees] Gebucht: month={current}, new_last_done={current}")
-        current = add_month(current)
+        print(f"[fees] Gebucht: month={current}, new_last_done={current}, buchungen={len(buchungen)}")
+        gebucht += len(buchungen)
 
     conn.commit()
     conn.close()
+    metriken.parkgebuehr_buchungen.inc(gebucht)
+    metriken.parkgebuehr_monate.inc(len(monate))
+
+class BuchungsFehler(Exception):
+    """Buchung abgelehnt, z. B. weil ein Konto nicht existiert."""
+
+class UeberziehungsFehler(BuchungsFehler):
+    """Die Buchung würde den Minusrahmen des Senders überschreiten."""
+
+    def __init__(self, limit, projected):
+        super().__init__(f"Überziehungsgrenze überschritten: erlaubt –{zehntel.text(limit)}, "
+                         f"geplant {zehntel.text(projected)}")
+        self.limit = limit
+        self.projected = projected
+
+TRANSAKTION_INSERT_SQL = '''INSERT INTO transaktionen
+    (von, an, betrag, kulturbeitrag, brutto, netto, beschreibung, datum,
+     stand_von_alt, stand_von_neu, stand_an_alt, stand_an_neu)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+def _buche_konto(c, name, delta, jetzt):
+    """Ändert den Kontostand relativ und liefert den neuen Stand (eine Anweisung)."""
+    c.execute("UPDATE konten SET punkte = punkte + ?, letzte_aktivitaet = ? WHERE name = ? RETURNING punkte",
+              (delta, jetzt, name))
+    row = c.fetchone()
+    if row is None:
+        raise BuchungsFehler(f"Konto nicht gefunden: {name}")
+    return row[0]
+
+def post_transfer(conn, von, an, betrag, beschreibung, jetzt=None):
+    """
+    Bucht eine Überweisung samt automatischem Kulturbeitrag (5 %) in EINER
+    Schreibtransaktion (BEGIN IMMEDIATE): Stände lesen, Überziehung prüfen,
+    Konten relativ buchen und beide Transaktionszeilen einfügen.
+    Wirft UeberziehungsFehler / BuchungsFehler (dann wird nichts gebucht).
+    Beträge und Stände in Zehntel; liefert die neuen Kontostände {konto: punkte}.
+    """
+    if jetzt is None:
+        jetzt = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    kulturbeitrag = zehntel.anteil(betrag, 5)
+    netto = betrag - kulturbeitrag
+    brutto = betrag
+
+    c = conn.cursor()
+    schreibsperre_holen(c, "ueberweisung")
+    try:
+        c.execute("SELECT name FROM konten WHERE typ = 'fonds' ORDER BY id LIMIT 1")
+        row = c.fetchone()
+        kulturfonds = row[0] if row else None
+
+        beteiligte = [k for k in (von, an, kulturfonds) if k]
+        c.execute(f"SELECT name, punkte FROM konten WHERE name IN ({','.join('?' for _ in beteiligte)})",
+                  beteiligte)
+        stand = dict(c.fetchall())
+        for name in (von, an):
+            if name not in stand:
+                raise BuchungsFehler(f"Konto nicht gefunden: {name}")
+
+        # Überziehungsgrenze prüfen – vom Sender geht nur BRUTTO ab
+        limit = overdraft_limit(conn, von)
+        projected = stand[von] - brutto  # NICHT minus kulturbeitrag
+        if projected < -limit:
+            metriken.ueberziehungen.inc()
+            raise UeberziehungsFehler(limit, projected)
+
+        # Stände für die Zeilen der Reihe nach fortschreiben (Überweisung, dann Kulturbeitrag)
+        zeilen = []
+        von_alt = stand[von]
+        stand[von] = von_alt - brutto
+        an_alt = stand[an]
+        stand[an] = an_alt + netto
+        zeilen.append((von, an, betrag, kulturbeitrag, brutto, netto, beschreibung, jetzt,
+                       von_alt, stand[von], an_alt, stand[an]))
+        deltas = {von: -brutto}
+        deltas[an] = deltas.get(an, 0) + netto
+
+        if kulturfonds:
+            von_alt = stand[von]
+            kultur_alt = stand[kulturfonds]
+            stand[kulturfonds] = kultur_alt + kulturbeitrag
+            zeilen.append((von, kulturfonds, kulturbeitrag, 0, kulturbeitrag, kulturbeitrag,
+                           "[Kulturbeitrag automatisch]", jetzt,
+                           von_alt, stand[von], kultur_alt, stand[kulturfonds]))
+            deltas[kulturfonds] = deltas.get(kulturfonds, 0) + kulturbeitrag
+
+        neue_staende = {name: _buche_konto(c, name, delta, jetzt) for name, delta in deltas.items()}
+        c.executemany(TRANSAKTION_INSERT_SQL, zeilen)
+        for zeile in zeilen:
+            buche_einkommen(conn, zeile[1], zeile[2], zeile[6], jetzt)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    metriken.buchungen.labels("ueberweisung").inc()
+    return neue_staende
+
+def post_ausgabe(conn, von, betrag, beschreibung, jetzt=None):
+    """Bucht eine Ausgabe (in Zehntel) aus einem Fonds (ohne Empfängerkonto) in einer Schreibtransaktion."""
+    if jetzt is None:
+        jetzt = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    c = conn.cursor()
+    schreibsperre_holen(c, "ausgabe")
+    try:
+        c.execute("SELECT punkte FROM konten WHERE name = ?", (von,))
+        row = c.fetchone()
+        if row is None:
+            raise BuchungsFehler(f"Konto nicht gefunden: {von}")
+        alt_von = row[0]
+        neu_von = _buche_konto(c, von, -betrag, jetzt)
+        c.execute(TRANSAKTION_INSERT_SQL,
+                  (von, "[Ausgabe]", betrag, 0, betrag, betrag, beschreibung, jetzt, alt_von, neu_von, 0, 0))
+        buche_einkommen(conn, "[Ausgabe]", betrag, beschreibung, jetzt)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    metriken.buchungen.labels("ausgabe").inc()
+    return {von: neu_von}
 
 def _pad_to_11(rows):
     """Sorgt dafür, dass jede Zeile 11 Felder hat (füllt ggf. mit leeren Strings auf)."""
@@ -341,86 +1111,155 @@ def _select_transaktionen(c, where_sql="", params=(), limit=20):
         rows = c.execute(sql, params).fetchall()
         return _pad_to_11(rows)
 
+def _select_konto_verlauf(c, kontonamen, limit, ohne_beschreibung=None):
+    """
+    Letzte Transaktionen der angegebenen Konten (Spalten wie _select_transaktionen).
+    Je Konto ein rückwärts gelesener Bereich über konto_buchungen (konto, tx_id),
+    höchstens limit Zeilen; danach zusammengeführt – Transaktionen zwischen zwei
+    eigenen Konten nur einmal.
+    """
+    if not kontonamen:
+        return []
+    filter_sql = " AND t.beschreibung != ?" if ohne_beschreibung is not None else ""
+    teil = f"""
+        SELECT * FROM (
+            SELECT t.id, t.von, t.an, t.brutto, t.kulturbeitrag, t.netto, t.beschreibung, t.datum,
+                   t.stand_von_alt, t.stand_von_neu, t.stand_an_alt, t.stand_an_neu
+            FROM konto_buchungen kb
+            JOIN transaktionen t ON t.id = kb.tx_id
+            WHERE kb.konto = ?{filter_sql}
+            ORDER BY kb.tx_id DESC
+            LIMIT ?
+        )"""
+    params = []
+    for name in kontonamen:
+        params.append(name)
+        if ohne_beschreibung is not None:
+            params.append(ohne_beschreibung)
+        params.append(int(limit))
+    sql = " UNION ".join(teil for _ in kontonamen) + " ORDER BY 1 DESC LIMIT ?"
+    params.append(int(limit))
+    return [tuple(row[1:]) for row in c.execute(sql, params).fetchall()]
+
+# --- Sitzungen ---------------------------------------------------------------
+# Wer angemeldet ist, steht in der Tabelle sitzungen (eine Zeile je Login), nicht
+# mehr prozesslokal in app.config – damit gilt dasselbe in allen gunicorn-Workern
+# und beliebig viele Mitglieder können gleichzeitig arbeiten. Das Cookie trägt
+# nur die Sitzungs-ID ('sid') und die letzte Aktivität.
+INAKTIV_SEKUNDEN = 120
+# Aktivität wird höchstens so oft in die DB geschrieben …
+SITZUNG_BERUEHREN_ABSTAND = 15
+# … und abgelaufene Sitzungen je Prozess höchstens so oft gelöscht
+SITZUNG_AUFRAEUMEN_ABSTAND = 60
+_naechstes_aufraeumen = 0.0
+
+def sitzung_anlegen(conn, benutzer, jetzt):
+    sid = secrets.token_urlsafe(24)
+    conn.execute("INSERT INTO sitzungen (sid, benutzer, angelegt, zuletzt) VALUES (?, ?, ?, ?)",
+                 (sid, benutzer, jetzt, jetzt))
+    conn.commit()
+    return sid
+
+def sitzung_beenden(conn, sid):
+    conn.execute("DELETE FROM sitzungen WHERE sid = ?", (sid,))
+    conn.commit()
+
+def sitzung_beruehren(conn, sid, jetzt):
+    """Aktivität vermerken; False, wenn die Sitzung nicht mehr existiert."""
+    c = conn.execute("UPDATE sitzungen SET zuletzt = ? WHERE sid = ? AND zuletzt >= ?",
+                     (jetzt, sid, jetzt - INAKTIV_SEKUNDEN))
+    conn.commit()
+    return c.rowcount == 1
+
+def sitzungen_aufraeumen(conn, jetzt):
+    """Abgelaufene Sitzungen löschen (Bereichsscan über ix_sitzungen_zuletzt)."""
+    c = conn.execute("DELETE FROM sitzungen WHERE zuletzt < ?", (jetzt - INAKTIV_SEKUNDEN,))
+    conn.commit()
+    return c.rowcount
+
 @app.before_request
-def check_inactivity_and_single_user():
-    # Wenn niemand eingeloggt ist, gib die Variable frei
+def check_inactivity():
+    global _naechstes_aufraeumen
     if 'user' not in session:
-        app.config['ACTIVE_USER'] = None
         return
 
     # Wenn jemand eingeloggt ist:
     jetzt = time.time()
     letzte_aktivitaet = session.get('last_active', jetzt)
+    sid = session.get('sid')
 
-    # Automatischer Logout nach 2 Minuten Inaktivität
-    if jetzt - letzte_aktivitaet > 120:
+    # Automatischer Logout nach 2 Minuten Inaktivität (Cookies von vor der Umstellung: ohne sid)
+    if sid is None or jetzt - letzte_aktivitaet > INAKTIV_SEKUNDEN:
         session.clear()
-        app.config['ACTIVE_USER'] = None
         return redirect(url_for('login'))
 
+    # DB nur alle paar Sekunden anfassen; dabei fällt auch ein Logout in einem anderen Worker auf
+    if jetzt - session.get('last_seen_db', 0) >= SITZUNG_BERUEHREN_ABSTAND:
+        conn = get_db()
+        if not sitzung_beruehren(conn, sid, jetzt):
+            session.clear()
+            return redirect(url_for('login'))
+        session['last_seen_db'] = jetzt
+        if jetzt >= _naechstes_aufraeumen:
+            _naechstes_aufraeumen = jetzt + SITZUNG_AUFRAEUMEN_ABSTAND
+            sitzungen_aufraeumen(conn, jetzt)
+
     # Aktualisiere Aktivitätszeit
     session['last_active'] = jetzt
 
-    # Wenn bereits jemand anders eingeloggt ist, blockieren
-    active_user = app.config.get('ACTIVE_USER')
-    if active_user is not None and session['user'] != active_user:
-        session.clear()
-        return redirect(url_for('login'))
-
-
+# Je Worker: Fehlversuche je Client-Adresse und gleichzeitige KDF-Berechnungen begrenzen.
+# Bewusst nicht je Benutzername – sonst könnte jeder z. B. "admin" aussperren.
+login_drossel = passwoerter.Drossel(
+    max_fehlversuche=int(os.environ.get("LOGIN_MAX_FEHLVERSUCHE", "10")),
+    max_parallel=int(os.environ.get("LOGIN_MAX_PARALLEL", "2")),
+)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         benutzer = request.form['benutzer']
         passwort = request.form['passwort']
-        conn = db_connection()
+        adresse = request.remote_addr or "-"
+        if login_drossel.gesperrt(adresse):
+            return "Zu viele Anmeldeversuche, bitte später erneut versuchen", 429
+        conn = get_db()
         c = conn.cursor()
-        c.execute("SELECT * FROM benutzer WHERE benutzer = ? AND passwort = ?", (benutzer, passwort))
-        if c.fetchone():
+        c.execute("SELECT passwort FROM benutzer WHERE benutzer = ?", (benutzer,))
+        row = c.fetchone()
+        if not login_drossel.kdf_belegen():
+            return "Anmeldung gerade ausgelastet, bitte gleich erneut versuchen", 503
+        try:
+            ok, neuer_hash = passwoerter.pruefen(benutzer, row[0] if row else None, passwort)
+        finally:
+            login_drossel.kdf_freigeben()
+        if ok:
+            login_drossel.erfolg(adresse)
+            if neuer_hash:
+                # Klartext bzw. veraltete Kosten beim Login ersetzen
+                c.execute("UPDATE benutzer SET passwort = ? WHERE benutzer = ?", (neuer_hash, benutzer))
+                conn.commit()
+                print(f"[login] Passwort-Hash für {benutzer} erneuert")
+            jetzt = time.time()
+            session.clear()
             session['user'] = benutzer
-            session['last_active'] = time.time()
-            app.config['ACTIVE_USER'] = benutzer
+            session['sid'] = sitzung_anlegen(conn, benutzer, jetzt)
+            session['last_active'] = jetzt
+            session['last_seen_db'] = jetzt
             ziel = request.args.get('an')
             if ziel:
               return redirect(url_for('index', an=ziel))
             return redirect('/start')
         else:
+            login_drossel.fehlschlag(adresse)
             return "Login fehlgeschlagen"
-    return '''
-<!doctype html>
-<html lang="de">
-  <head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <title>Login – Wieshof</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-  </head>
-  <body class="container mt-5">
-
-    <div class="card shadow p-4 mx-auto" style="max-width: 400px;">
-      <h2 class="mb-4 text-center">Login</h2>
-      <form method="post">
-        <div class="mb-3">
-          <label for="benutzer" class="form-label">Benutzername:</label>
-          <input type="text" class="form-control" id="benutzer" name="benutzer" required>
-        </div>
-        <div class="mb-3">
-          <label for="passwort" class="form-label">Passwort:</label>
-          <input type="password" class="form-control" id="passwort" name="passwort" required>
-        </div>
-        <button type="submit" class="btn btn-primary w-100">Login</button>
-      </form>
-    </div>
-
-  </body>
-</html>
-'''
+    return render_template("login.html")
 
 @app.route('/logout')
 def logout():
+    sid = session.get('sid')
+    if sid is not None:
+        sitzung_beenden(get_db(), sid)
     session.clear()
-    app.config['ACTIVE_USER'] = None
     return redirect(url_for('system'))
 
 @app.route('/start', methods=['GET', 'POST'])
@@ -430,7 +1269,7 @@ def index():
 
     empfaenger_vorauswahl = request.args.get("an")
 
-    conn = db_connection()
+    conn = get_db()
     c = conn.cursor()
 
     # Konten laden (Admin = alle, sonst über Mapping-Tabelle)
@@ -438,7 +1277,7 @@ def index():
         c.execute("SELECT name, typ, punkte FROM konten ORDER BY name ASC")
         rows = c.fetchall()
         # Admin: 3 Spalten -> hier runden
-        konten = [(name, typ, round(punkte, 1)) for name, typ, punkte in rows]
+        konten = [(name, typ, zehntel.als_punkte(punkte)) for name, typ, punkte in rows]
     else:
         c.execute("""
             SELECT k.name, k.typ, k.punkte, k.letzte_aktivitaet
@@ -448,104 +1287,43 @@ def index():
         """, (session["user"],))
         rows = c.fetchall()
         # Nutzer/Fonds: 4 Spalten -> hier runden
-        konten = [(name, typ, round(punkte, 1), letzte) for name, typ, punkte, letzte in rows]
+        konten = [(name, typ, zehntel.als_punkte(punkte), letzte) for name, typ, punkte, letzte in rows]
 
     eigene_kontonamen = [k[0] for k in konten]
 
     # Kulturfonds-Konto bestimmen
     c.execute("SELECT name FROM konten WHERE typ = 'fonds'")
     alle_fonds_konten = [row[0] for row in c.fetchall()]
-    kulturfonds_name = alle_fonds_konten[0] if alle_fonds_konten else None
 
     jetzt = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     # POST: Überweisung oder Fonds-Ausgabe
     if request.method == 'POST' and session['user'] != 'admin':
-        if 'ausgabe_von' in request.form:
-            # Abzug aus Fonds
-            von = request.form['ausgabe_von'].strip()
-            betrag = float(request.form['ausgabe_betrag'])
-            beschreibung = request.form['ausgabe_beschreibung'].strip()
-            c.execute("SELECT punkte FROM konten WHERE name = ?", (von,))
-            alt_von = c.fetchone()[0]
-            neu_von = alt_von - betrag
-            c.execute("UPDATE konten SET punkte = ?, letzte_aktivitaet = ? WHERE name = ?", (neu_von, jetzt, von))
-            c.execute('''INSERT INTO transaktionen 
-                (von, an, betrag, kulturbeitrag, brutto, netto, beschreibung, datum,
-                 stand_von_alt, stand_von_neu, stand_an_alt, stand_an_neu)
-                VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?, ?, 0, 0)''',
-                (von, "[Ausgabe]", betrag, betrag, betrag, beschreibung, jetzt, alt_von, neu_von))
-            conn.commit()
-            conn.close()
-            return redirect('/start')
-        else:
-            # Normale Transaktion
-            von = request.form['von'].strip()
-            an = request.form['an'].strip()
-            betrag = float(request.form['betrag'])
-            beschreibung = request.form['beschreibung'].strip()
-            kulturbeitrag = round(betrag * 0.05, 1)
-            netto = round(betrag - kulturbeitrag, 1)
-            brutto = betrag
-
-             # aktuellen Stand des Senders laden (brauchen wir für die Limitprüfung)
-            c.execute("SELECT punkte FROM konten WHERE name = ?", (von,))
-            alt_von = c.fetchone()[0]
-
-            # Überziehungsgrenze prüfen – vom Sender geht nur BRUTTO ab
-            limit = overdraft_limit(von)
-            projected = round(alt_von - brutto, 1)  # NICHT minus kulturbeitrag
-            if projected < -limit:
-                conn.close()
-                return render_template_string(
-                "<h2>Fehler: Überziehungsgrenze überschritten</h2>"
-                f"<p>Minusrahmen erreicht: erlaubt –{limit:.1f} Punkte.</p>"
-                f"<p>Geplanter neuer Stand: {projected:.1f} Punkte.</p>"
-                "<p>Buchung nicht möglich.</p>"
-                "<p><a href='/start'>Zurück</a></p>"
-            )
-
-            c.execute("SELECT punkte FROM konten WHERE name = ?", (an,))
-            alt_an = c.fetchone()[0]
-
-            if kulturfonds_name:
-                c.execute("SELECT punkte FROM konten WHERE name = ?", (kulturfonds_name,))
-                alt_kultur = c.fetchone()[0]
-                neu_kultur = alt_kultur + kulturbeitrag
-                c.execute("UPDATE konten SET punkte = ?, letzte_aktivitaet = ? WHERE name = ?", (neu_kultur, jetzt, kulturfonds_name))
+        try:
+            if 'ausgabe_von' in request.form:
+                # Abzug aus Fonds
+                post_ausgabe(conn,
+                             request.form['ausgabe_von'].strip(),
+                             zehntel.aus_punkten(request.form['ausgabe_betrag']),
+                             request.form['ausgabe_beschreibung'].strip(),
+                             jetzt)
             else:
-                alt_kultur = neu_kultur = 0
-
-            c.execute("UPDATE konten SET punkte = punkte - ?, letzte_aktivitaet = ? WHERE name = ?", (brutto, jetzt, von))
-            c.execute("UPDATE konten SET punkte = punkte + ?, letzte_aktivitaet = ? WHERE name = ?", (netto, jetzt, an))
-            neu_von = alt_von - brutto
-            neu_an = alt_an + netto
-
-            c.execute('''INSERT INTO transaktionen 
-                (von, an, betrag, kulturbeitrag, brutto, netto, beschreibung, datum,
-                 stand_von_alt, stand_von_neu, stand_an_alt, stand_an_neu)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (von, an, betrag, kulturbeitrag, brutto, netto, beschreibung, jetzt,
-                 alt_von, neu_von, alt_an, neu_an))
-
-            if kulturfonds_name:
-                c.execute("SELECT punkte FROM konten WHERE name = ?", (von,))
-                kultur_alt_von = c.fetchone()[0]
-                kultur_neu_von = kultur_alt_von
-                c.execute('''INSERT INTO transaktionen
-                    (von, an, betrag, kulturbeitrag, brutto, netto, beschreibung, datum,
-                     stand_von_alt, stand_von_neu, stand_an_alt, stand_an_neu)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (von, kulturfonds_name, kulturbeitrag, 0, kulturbeitrag, kulturbeitrag,
-                     "[Kulturbeitrag automatisch]", jetzt,
-                     kultur_alt_von, kultur_neu_von, alt_kultur, neu_kultur))
-            conn.commit()
-            conn.close()
-            return redirect('/start')
+                # Normale Transaktion
+                post_transfer(conn,
+                              request.form['von'].strip(),
+                              request.form['an'].strip(),
+                              zehntel.aus_punkten(request.form['betrag']),
+                              request.form['beschreibung'].strip(),
+                              jetzt)
+        except UeberziehungsFehler as e:
+            return render_template("fehler_ueberziehung.html",
+                                   limit=zehntel.als_punkte(e.limit),
+                                   projected=zehntel.als_punkte(e.projected))
+        except BuchungsFehler as e:
+            return render_template("fehler_buchung.html", fehler=str(e))
+        return redirect('/start')
 
     # Anzeige (GET)
-    conn = db_connection()
-    c = conn.cursor()
     c.execute("SELECT name, besitzer FROM konten")
     alle_konten = c.fetchall()
     aktives_von = eigene_kontonamen[0] if eigene_kontonamen else None
@@ -581,39 +1359,18 @@ def index():
     admin_kontostand_uebersicht = []
     if session["user"] == "admin":
         c.execute("SELECT name, punkte FROM konten ORDER BY name ASC")
-        admin_kontostand_uebersicht = c.fetchall()
+        admin_kontostand_uebersicht = [(name, zehntel.als_punkte(punkte)) for name, punkte in c.fetchall()]
 
     # Transaktionen je nach Rolle (immer 11 Spalten!)
     if session["user"] == "admin":
         daten = _select_transaktionen(c, limit=20)
 
     elif any(k[0] in alle_fonds_konten for k in konten):
-        placeholder = ",".join("?" for _ in alle_fonds_konten)
-        where_sql = f"(von IN ({placeholder}) OR an IN ({placeholder}))"
-        params = tuple(alle_fonds_konten + alle_fonds_konten)
-        daten = _select_transaktionen(c, where_sql, params, limit=20)
+        daten = _select_konto_verlauf(c, alle_fonds_konten, limit=20)
 
     else:
-        where_sql = """
-            (
-                von IN (
-                    SELECT k.name
-                    FROM konten k
-                    JOIN konten_benutzer kb ON kb.konto_id = k.id
-                    WHERE kb.benutzer_login = ?
-                )
-                OR
-                an IN (
-                    SELECT k.name
-                    FROM konten k
-                    JOIN konten_benutzer kb ON kb.konto_id = k.id
-                    WHERE kb.benutzer_login = ?
-                )
-            )
-            AND beschreibung != '[Kulturbeitrag automatisch]'
-        """
-        params = (session["user"], session["user"])
-        daten = _select_transaktionen(c, where_sql, params, limit=10)
+        daten = _select_konto_verlauf(c, eigene_kontonamen, limit=10,
+                                      ohne_beschreibung='[Kulturbeitrag automatisch]')
 
     def zeichenbetrag(betrag, vorzeichen):
         betrag = round(betrag, 1)
@@ -624,9 +1381,15 @@ def index():
         else:
             return str(betrag)
 
+    def punkte(x):
+        # Zehntel -> Punkte; leere Werte (ältere Zeilen) bleiben wie sie sind
+        return zehntel.als_punkte(x) if isinstance(x, int) else x
+
     transaktionen = []
     for row in daten:
         von, an, brutto, kultur, netto, beschreibung, datum, v_alt, v_neu, a_alt, a_neu = row
+        brutto, kultur, netto, v_alt, v_neu, a_alt, a_neu = map(
+            punkte, (brutto, kultur, netto, v_alt, v_neu, a_alt, a_neu))
 
         if session["user"] == "admin":
             brutto_str = zeichenbetrag(brutto, '-')
@@ -662,328 +1425,150 @@ def index():
 
             transaktionen.append((von, an, brutto_str, kultur, netto_str, beschreibung, datum, eigener_alt, eigener_neu))
 
-    conn.close()
 
     # Brotpreis laden (für Euro-Hilfe im Formular)
     brotpreis, _brotpreis_ts = get_brotpreis_eur_pro_punkt()
 
-    return render_template_string('''
-
-<!doctype html>
-<html lang="de">
-    <style>
-    /* Hauptüberschrift ganz oben */
-    .page-title {
-        font-size: 1.9rem !important;   /* größte */
-        font-weight: 700;
-        margin-top: 1.25rem;
-        margin-bottom: 1rem;
-    }
-
-    /* Abschnitte darunter (Punkte übertragen, Transaktionen) */
-    .section-title,
-    .subsection-title {
-        font-size: 1.6rem !important;  /* zwei bis drei Stufen größer */
-        font-weight: 600;
-        margin-top: 3.3rem;             /* mehr Luft drüber */
-        margin-bottom: 0.8rem;
-    }
-    </style>
-  <head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <title>Wieshof</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-  </head>
-  <body class="container mt-4">
-
-<h2 class="page-title">{{ ueberschrift }}</h2>
-
-{% if session["user"] == "admin" %}
-    <!-- Admin-Kontenübersicht -->
-    <table class="table table-striped table-bordered table-sm">
-        <thead>
-            <tr><th>Name</th><th>Typ</th><th>Punkte</th></tr>
-        </thead>
-        <tbody>
-            {% for name, typ, punkte in konten %}
-            <tr><td>{{name}}</td><td>{{typ}}</td><td>{{punkte}}</td></tr>
-            {% endfor %}
-        </tbody>
-    </table>
-{% else %}
-    <!-- Eigene Kontenübersicht -->
-    <table class="table table-striped table-bordered table-sm">
-        <thead>
-            <tr><th>Name</th><th>Typ</th><th>Punkte</th><th>Letzte Aktivität</th></tr>
-        </thead>
-        <tbody>
-            {% for name, typ, punkte, letzte in konten %}
-            <tr><td>{{name}}</td><td>{{typ}}</td><td>{{punkte}}</td><td>{{letzte}}</td></tr>
-            {% endfor %}
-        </tbody>
-    </table>
-{% endif %}
-{% if konten|length > 0 and session["user"] != "admin" %}
-  {% if konten[0][1] == 'fonds' %}
-    <h3 class="section-title">Punkte an den Kulturverein übertragen</h3>
-    <form method="post" class="mb-4">
-      <!-- Von: Kulturfonds -->
-      <input type="hidden" name="von" value="{{ konten[0][0] }}">
-
-      <!-- An: fest "Kulturverein Wieshof" -->
-      <div class="mb-3">
-        <label class="form-label">An:</label>
-        <input type="hidden" name="an" value="Kulturverein Wieshof">
-        <p><strong>Empfänger:</strong> Kulturverein Wieshof</p>
-      </div>
-
-      <div class="mb-3">
-        <label class="form-label">Betrag (in Punkten):</label>
-        <input type="number" step="0.01" name="betrag" id="fondsBetragInput" class="form-control" required>
-        <div id="fondsEuroHinweis" class="form-text text-muted"></div>
-      </div>
-
-      <div class="mb-3">
-        <label class="form-label">Beschreibung:</label>
-        <input type="text" name="beschreibung" class="form-control">
-      </div>
-
-      <button type="submit" class="btn btn-primary w-100"
-              onclick="this.disabled=true; this.form.submit();">
-        Senden
-      </button>
-    </form>
-  {% else %}
-    <h3 class="section-title">Punkte übertragen</h3>
-    <form method="post" oninput="updateEmpfaenger()" class="mb-4">
-      <div class="mb-3">
-        <label class="form-label">Von:</label>
-        <select name="von" id="vonKonto" class="form-select" onchange="updateEmpfaenger()">
-          {% for name, _, _, _ in konten %}
-          <option value="{{name}}">{{name}}</option>
-          {% endfor %}
-        </select>
-      </div>
-      <div class="mb-3">
-        <label class="form-label">An:</label>
-        {% if empfaenger_vorauswahl %}
-            <input type="hidden" name="an" value="{{ empfaenger_vorauswahl }}">
-            <p><strong>Empfänger:</strong> {{ empfaenger_vorauswahl }}</p>
-        {% else %}
-            <select name="an" id="anKonto" class="form-select">
-                {% for name in empfaenger_konten %}
-                <option value="{{ name }}">{{ name }}</option>
-                {% endfor %}
-            </select>
-        {% endif %}
-
-
-      </div>
-      <div class="mb-3">
-        <div class="mb-3">
-            <label class="form-label">Betrag (in Punkten):</label>
-            <input type="number" step="0.01" name="betrag" id="betragInput" class="form-control" required>
-            <div id="euroHinweis" class="form-text text-muted"></div>
-        </div>
+    return render_template("start.html",
+        konten=konten,
+        empfaenger_konten=empfaenger_konten,
+        empfaenger_vorauswahl=empfaenger_vorauswahl,
+        transaktionen=transaktionen,
+        admin_kontostand_uebersicht=admin_kontostand_uebersicht,
+        besitzername=besitzername,
+        ueberschrift=ueberschrift,
+        brotpreis=brotpreis
+    )
 
-      <div class="mb-3">
-        <label class="form-label">Beschreibung:</label>
-        <input type="text" name="beschreibung" class="form-control">
-      </div>
-      <button type="submit" class="btn btn-primary w-100" onclick="this.disabled=true; this.form.submit();">Senden</button>
-    </form>
-  {% endif %}
-{% endif %}
-
-<h3 class="subsection-title">Letzte Transaktionen</h3>
-{% if session["user"] == "admin" %}
-  <!-- Admin-Transaktionen -->
-  <table class="table table-striped table-bordered table-sm">
-    <thead>
-      <tr><th>Von</th><th>An</th><th>Brutto</th><th>– Kultur</th><th>Netto</th><th>Zweck</th><th>Datum</th></tr>
-    </thead>
-    <tbody>
-      {% for von, an, brutto, kultur, netto, beschreibung, datum, v_alt, v_neu, a_alt, a_neu in transaktionen %}
-      <tr>
-        <td>{{von}}</td><td>{{an}}</td><td>{{brutto}}</td><td>{{kultur}}</td><td>{{netto}}</td>
-        <td>{{beschreibung}}</td><td>{{datum}}</td>
-      </tr>
-      {% endfor %}
-    </tbody>
-  </table>
-{% elif konten[0][1] == 'fonds' %}
-  <!-- Kulturfonds-Transaktionen -->
-  <table class="table table-striped table-bordered table-sm">
-    <thead>
-      <tr><th>Von</th><th>An</th><th>Betrag</th><th>Zweck</th><th>Datum</th><th>Kontostand vorher</th><th>Kontostand nachher</th></tr>
-    </thead>
-    <tbody>
-      {% for von, an, betrag, beschreibung, datum, alt, neu in transaktionen %}
-      <tr>
-        <td>{{von}}</td><td>{{an}}</td><td>{{betrag}}</td><td>{{beschreibung}}</td><td>{{datum}}</td><td>{{alt}}</td><td>{{neu}}</td>
-      </tr>
-      {% endfor %}
-    </tbody>
-  </table>
-{% else %}
-  <!-- Normale Nutzer-Transaktionen -->
-  <table class="table table-striped table-bordered table-sm">
-    <thead>
-      <tr><th>Von</th><th>An</th><th>Brutto</th><th>– Kultur</th><th>Netto</th><th>Zweck</th><th>Datum</th><th>Kontostand vorher</th><th>Kontostand nachher</th></tr>
-    </thead>
-    <tbody>
-      {% for von, an, brutto, kultur, netto, beschreibung, datum, alt, neu in transaktionen %}
-      <tr>
-        <td>{{von}}</td><td>{{an}}</td><td>{{brutto}}</td><td>{{kultur}}</td><td>{{netto}}</td>
-        <td>{{beschreibung}}</td><td>{{datum}}</td><td>{{alt}}</td><td>{{neu}}</td>
-      </tr>
-      {% endfor %}
-    </tbody>
-  </table>
-{% endif %}
-<p class="mt-4">
-  <a href="/export" class="btn btn-outline-secondary w-100">📥 Alle Transaktionen als CSV herunterladen</a>
-</p>
-
-<script>
-  function updateEmpfaenger() {
-    const von = document.getElementById(\"vonKonto\").value;
-    const anSelect = document.getElementById(\"anKonto\");
-    for (const option of anSelect.options) {
-      option.disabled = (option.value === von);
-    }
-  }
-  window.onload = updateEmpfaenger;
-</script>
-
-<p class="mt-4 text-center">
-  <a href="/logout" class="btn btn-link">Logout</a>
-</p>
-                                  
-<script>
-  // Brotpreis robust parsen (Fallback 8.38)
-  const BP = (function() {
-    try { return parseFloat({{ brotpreis|tojson }}); } catch(e) { return 8.38; }
-  })();
-
-  // kleine Helfer
-  const $ = (id) => document.getElementById(id);
-  const toNum = (val) => parseFloat(String(val || "").replace(",", ".").trim());
-
-  function liveCalc(inputId, outputId, toText) {
-    const inp = $(inputId), out = $(outputId);
-    if (!inp || !out) return; // Feld existiert auf dieser Seite nicht -> ok
-    const render = () => {
-      const n = toNum(inp.value);
-      if (!isNaN(n) && n > 0) { out.textContent = toText(n); }
-      else { out.textContent = ""; }
-    };
-    inp.addEventListener("input", render);
-    // sofort initial rechnen, falls schon ein Wert drin steht
-    render();
-  }
-
-  // Startseite (Überweisung)
-  liveCalc("betragInput",       "euroHinweis",       (p) => `≈ ${(p*BP).toFixed(2)} €`);
-  // Startseite (Fonds)
-  liveCalc("fondsBetragInput",  "fondsEuroHinweis",  (p) => `≈ ${(p*BP).toFixed(2)} €`);
-  // Infoseite (Punkte-Rechner rechts)
-  liveCalc("punkteInput",       "punkteZuEuro",      (p) => `≈ ${(p*BP).toFixed(2)} €`);
-  liveCalc("euroInput",         "euroZuPunkte",      (e) => `≈ ${(e/BP).toFixed(2)} Punkte`);
-</script>
-
-</body>
-</html>
-
-
-''', konten=konten,
-    empfaenger_konten=empfaenger_konten,
-    empfaenger_vorauswahl=empfaenger_vorauswahl,
-    transaktionen=transaktionen,
-    admin_kontostand_uebersicht=admin_kontostand_uebersicht,
-    besitzername=besitzername,
-    ueberschrift=ueberschrift,
-    brotpreis=brotpreis
-)
 
+EXPORT_BATCH_SIZE = 500
+EXPORT_SPALTEN = "von, an, brutto, kulturbeitrag, netto, beschreibung, datum"
+EXPORT_SPALTEN_STAND = EXPORT_SPALTEN + ", stand_von_alt, stand_von_neu, stand_an_alt, stand_an_neu"
 
-@app.route('/export')
-def export_csv():
-    if 'user' not in session:
-        return redirect('/')
+HAUPTBUCH = [("transaktionen", "", (), None)]
 
-    def format_zahl(x):
-        return str(int(x)) if x == int(x) else str(round(x, 1)).replace('.', ',')
+def iter_transaktionen(conn, where_sql="", params=(), spalten=EXPORT_SPALTEN, batch_size=EXPORT_BATCH_SIZE, nach=None,
+                       quellen=HAUPTBUCH):
+    """
+    Liefert Transaktionen als (id, datum, <spalten>...) in (datum, id)-Reihenfolge,
+    stapelweise per Keyset: jeder Stapel setzt hinter dem letzten (datum, id) fort,
+    der erste hinter 'nach' (falls angegeben). Zwischen den Stapeln bleibt keine
+    Lesetransaktion offen, der Speicherbedarf hängt nur von batch_size ab.
+    'quellen' (siehe transaktions_quellen) werden nacheinander gelesen.
+    """
+    letzter = nach
+    for quelle in quellen:
+        _, quelle_sql, quelle_params, _ = quelle
+        bedingungen = [f"({b})" for b in (where_sql, quelle_sql) if b.strip()]
+        with archiv.lesen(conn, quelle) as tabelle:
+            while True:
+                where = list(bedingungen)
+                p = [*params, *quelle_params]
+                if letzter is not None:
+                    where.append("(datum, id) > (?, ?)")
+                    p.extend(letzter)
+                where_clause = f" WHERE {' AND '.join(where)}" if where else ""
+                rows = conn.execute(
+                    f"SELECT id, datum, {spalten} FROM {tabelle}{where_clause} ORDER BY datum, id LIMIT ?",
+                    (*p, batch_size)).fetchall()
+                yield from rows
+                if rows:
+                    letzter = (rows[-1][1], rows[-1][0])
+                if len(rows) < batch_size:
+                    break
+
+def _csv_zeilen(rows):
+    si = io.StringIO()
+    csv.writer(si, quoting=csv.QUOTE_ALL).writerows(rows)
+    return si.getvalue()
 
-    conn = db_connection()
-    c = conn.cursor()
+def encode_export_cursor(datum, tx_id):
+    """Opaque Position (datum, id) für die Folgeseite eines Exports."""
+    return base64.urlsafe_b64encode(f"{datum}|{tx_id}".encode()).decode().rstrip("=")
 
-    if session["user"] == "admin":
-        c.execute("SELECT DISTINCT name FROM konten")
-        eigene_konten = [row[0] for row in c.fetchall()]
+def decode_export_cursor(cursor):
+    try:
+        roh = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        datum, tx_id = roh.rsplit("|", 1)
+        return datum, int(tx_id)
+    except (ValueError, UnicodeDecodeError):
+        abort(400, description="Ungültiger Cursor")
+
+def _parse_zeitpunkt(wert, ende_des_tages=False):
+    """'YYYY-MM-DD' oder 'YYYY-MM-DD HH:MM:SS' -> Vergleichswert für transaktionen.datum."""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            dt = datetime.strptime(wert, fmt)
+        except ValueError:
+            continue
+        if fmt == '%Y-%m-%d' and ende_des_tages:
+            dt = dt.replace(hour=23, minute=59, second=59)
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+    abort(400, description=f"Ungültiges Datum: {wert}")
+
+def export_zeitraum(args):
+    """Liest die Query-Parameter from/to (jeweils inklusive) als SQL-Bedingung auf datum."""
+    bedingungen, params = [], []
+    if args.get("from"):
+        bedingungen.append("datum >= ?")
+        params.append(_parse_zeitpunkt(args["from"]))
+    if args.get("to"):
+        bedingungen.append("datum <= ?")
+        params.append(_parse_zeitpunkt(args["to"], ende_des_tages=True))
+    return bedingungen, params
+
+def transaktions_quellen(conn, von=None, bis=None):
+    """Quellen für iter_transaktionen im Zeitraum [von, bis], einschließlich berührter Jahresarchive."""
+    try:
+        return archiv.quellen(conn, DB_PATH, von, bis)
+    except archiv.ArchivFehlt as e:
+        abort(503, description=str(e))
 
-        c.execute('''
-            SELECT von, an, brutto, kulturbeitrag, netto, beschreibung, datum
-            FROM transaktionen
-            ORDER BY datum ASC
-        ''')
-        rows = c.fetchall()
+EXPORT_MAX_SEITE = 5000
 
-        konten_ueberschrift = "Alle Konten"
+@app.route('/export')
+def export_csv():
+    """
+    Transaktionsexport. Ohne Parameter: alles, als CSV gestreamt.
+    Optionale Query-Parameter:
+      from, to  – Zeitraum (YYYY-MM-DD oder YYYY-MM-DD HH:MM:SS, inklusive)
+      konto     – nur dieses Konto (Nutzer: nur eigene Konten)
+      format    – csv (Standard) oder json
+      limit     – Seitengröße; die Folgeseite steht dann im Header X-Next-Cursor
+      cursor    – Folgeseite ab dieser Position (aus X-Next-Cursor)
+    """
+    if 'user' not in session:
+        return redirect('/')
+    user = session["user"]
+    ist_admin = user == "admin"
 
-    else:
-        c.execute("""
-            SELECT k.name
-            FROM konten k
-            JOIN konten_benutzer kb ON kb.konto_id = k.id
-            WHERE kb.benutzer_login = ?
-        """, (session["user"],))
-        eigene_konten = [row[0] for row in c.fetchall()]
-
-        if eigene_konten == ["Kulturfonds"]:
-            query = '''
-                SELECT von, an, brutto, kulturbeitrag, netto, beschreibung, datum
-                FROM transaktionen
-                WHERE von = ? OR an = ?
-                ORDER BY datum ASC
-            '''
-            c.execute(query, (eigene_konten[0], eigene_konten[0]))
-        else:
-            # ... (dein bisheriger Normalfall bleibt)
+    format_ = request.args.get("format", "csv")
+    if format_ not in ("csv", "json"):
+        abort(400, description="format muss csv oder json sein")
+    limit = request.args.get("limit", type=int)
+    if limit is not None:
+        limit = max(1, min(limit, EXPORT_MAX_SEITE))
+    nach = decode_export_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+    konto = request.args.get("konto")
 
-            query = '''
-            SELECT von, an, brutto, kulturbeitrag, netto, beschreibung, datum
-            FROM transaktionen
-            WHERE (
-                von IN (
-                    SELECT k.name
-                    FROM konten k
-                    JOIN konten_benutzer kb ON kb.konto_id = k.id
-                    WHERE kb.benutzer_login = ?
-                )
-                OR
-                an IN (
-                    SELECT k.name
-                    FROM konten k
-                    JOIN konten_benutzer kb ON kb.konto_id = k.id
-                    WHERE kb.benutzer_login = ?
-                )
-            )
-            AND beschreibung != '[Kulturbeitrag automatisch]'
-            ORDER BY datum ASC
-            '''
-            c.execute(query, (session["user"], session["user"]))
+    format_zahl = zehntel.text
 
+    def format_stand(x):
+        # ältere Zeilen ohne stand_*-Werte bleiben leer
+        return "" if x is None else format_zahl(x)
 
-        rows = c.fetchall()
+    def punkte(x):
+        return None if x is None else zehntel.als_punkte(x)
+
+    conn = get_db()
+    c = conn.cursor()
 
     c.execute("""
         SELECT k.name, k.typ
         FROM konten k
         JOIN konten_benutzer kb ON kb.konto_id = k.id
         WHERE kb.benutzer_login = ?
-    """, (session["user"],))
+    """, (user,))
     eigene_konten_info = c.fetchall()
     eigene_konten = [name for name, _ in eigene_konten_info]
     eigene_konto_typen = [typ for _, typ in eigene_konten_info]
@@ -992,142 +1577,177 @@ def export_csv():
     is_fonds_only = (len(eigene_konten) == 1 and eigene_konto_typen[0] == 'fonds')
     fonds_name = eigene_konten[0] if is_fonds_only else None
 
-    konto_stand = { konto: 0.0 for konto in eigene_konten }
-
-    output_rows = []
-
-    for row in rows:
-        von, an, brutto, kultur, netto, beschreibung, datum = row
-
-        symbol_abgang = "⬇"
-        symbol_zugang = "⬆"
-        symbol_neutral = "⇄"
-
-    for row in rows:
-        von, an, brutto, kultur, netto, beschreibung, datum = row
+    if ist_admin:
+        bedingungen, params = [], []
+    elif eigene_konten == ["Kulturfonds"]:
+        bedingungen, params = ["(von = ? OR an = ?)"], [eigene_konten[0], eigene_konten[0]]
+    else:
+        ph = ",".join("?" for _ in eigene_konten) or "NULL"
+        bedingungen = [f"(von IN ({ph}) OR an IN ({ph}))",
+                       "beschreibung != '[Kulturbeitrag automatisch]'"]
+        params = [*eigene_konten, *eigene_konten]
+
+    if konto:
+        if not ist_admin and konto not in eigene_konten:
+            abort(403)
+        bedingungen.append("(von = ? OR an = ?)")
+        params.extend([konto, konto])
+
+    zeit_bedingungen, zeit_params = export_zeitraum(request.args)
+    bedingungen += zeit_bedingungen
+    params += zeit_params
+    where_sql = " AND ".join(bedingungen)
+    quellen = transaktions_quellen(
+        conn,
+        _parse_zeitpunkt(request.args["from"]) if request.args.get("from") else None,
+        _parse_zeitpunkt(request.args["to"], ende_des_tages=True) if request.args.get("to") else None)
+
+    # Kopfzeilen: aktuelle Kontostände direkt aus konten.punkte
+    kopf_konten = [konto] if konto and not ist_admin else eigene_konten
+    end_stand = {}
+    if not ist_admin and kopf_konten:
+        ph = ",".join("?" for _ in kopf_konten)
+        c.execute(f"SELECT name, punkte FROM konten WHERE name IN ({ph})", kopf_konten)
+        end_stand = {name: stand or 0 for name, stand in c.fetchall()}
+
+    symbol_abgang = "⬇"
+    symbol_zugang = "⬆"
+    symbol_neutral = "⇄"
+
+    def eigener_stand(von, an, v_alt, v_neu, a_alt, a_neu):
+        """Kontostand alt/neu aus Sicht des Nutzers (gespeicherte stand_*-Spalten)."""
+        if ist_admin:
+            return None, None
+        if is_fonds_only:
+            return (a_alt, a_neu) if an == fonds_name else (v_alt, v_neu)
+        if von in eigene_konten:
+            return v_alt, v_neu
+        if an in eigene_konten:
+            return a_alt, a_neu
+        return None, None
+
+    def csv_kopf():
+        kopf = []
+        if not ist_admin:
+            for name in kopf_konten:
+                kopf.append(["Kontostand", f"{name}:", format_zahl(end_stand.get(name, 0))])
+            kopf.append([])
+
+        # Tabellenkopf
+        if ist_admin:
+            # Admin: ohne Kontostand-Spalten
+            kopf.append(["Von", "An", "Brutto", "", "Netto", "", "Zweck", "Datum"])
+        elif is_fonds_only:
+            kopf.append(["Von", "An", "Betrag", "", "Zweck", "Datum", "Kontostand alt", "Kontostand neu"])
+        else:
+            kopf.append(["Von", "An", "Brutto", "", "Netto", "", "Zweck", "Datum", "Kontostand alt", "Kontostand neu"])
+        return _csv_zeilen(kopf)
 
-        symbol_abgang = "⬇"
-        symbol_zugang = "⬆"
-        symbol_neutral = "⇄"
+    def csv_zeile(row):
+        (_id, _key, von, an, brutto, kultur, netto, beschreibung, datum,
+         v_alt, v_neu, a_alt, a_neu) = row
+        konto_alt, konto_neu = (format_stand(x) for x in eigener_stand(von, an, v_alt, v_neu, a_alt, a_neu))
 
         # === Kulturfonds Spezialfall ===
         if is_fonds_only:
             betrag = abs(netto)
             richtung = symbol_zugang if an == fonds_name else symbol_abgang
-
-            konto_alt = format_zahl(konto_stand[fonds_name])
-            if an == fonds_name:
-                konto_stand[fonds_name] += betrag
-            else:
-                konto_stand[fonds_name] -= betrag
-            konto_neu = format_zahl(konto_stand[fonds_name])
-
-            output_rows.append([
-                von, an, format_zahl(betrag), richtung, beschreibung, datum, konto_alt, konto_neu
-            ])
+            return [von, an, format_zahl(betrag), richtung, beschreibung, datum, konto_alt, konto_neu]
+
+        # === Normalfall (Nicht-Kulturfonds oder Admin)
+        richtung_brutto = ""
+        richtung_netto = ""
+        interne_umbuchung = von in eigene_konten and an in eigene_konten
+        if interne_umbuchung:
+            richtung_brutto = symbol_neutral
+            richtung_netto = symbol_neutral
+            if not ist_admin:
+                beschreibung = "Interne Überweisung"
         else:
-            # === Normalfall (Nicht-Kulturfonds oder Admin)
-            richtung_brutto = ""
-            richtung_netto = ""
-            interne_umbuchung = von in eigene_konten and an in eigene_konten
-            if interne_umbuchung:
-                richtung_brutto = symbol_neutral
-                richtung_netto = symbol_neutral
-                if session["user"] != "admin":
-                    beschreibung = "Interne Überweisung"
-            else:
-                if von in eigene_konten:
-                    richtung_brutto = symbol_abgang
-                if an in eigene_konten:
-                    richtung_netto = symbol_zugang
-
-            if session["user"] == "admin":
-                konto_alt = ""
-                konto_neu = ""
-            elif von in eigene_konten:
-                konto_alt = format_zahl(konto_stand[von])
-                konto_stand[von] -= abs(brutto)
-                konto_neu = format_zahl(konto_stand[von])
-            elif an in eigene_konten:
-                konto_alt = format_zahl(konto_stand[an])
-                konto_stand[an] += abs(netto)
-                konto_neu = format_zahl(konto_stand[an])
-            else:
-                konto_alt = ""
-                konto_neu = ""
-
-            if session["user"] == "admin":
-                # Admin: ohne Kontostand-Spalten
-                output_rows.append([
-                    von,
-                    an,
-                    format_zahl(abs(brutto)),
-                    richtung_brutto,
-                    format_zahl(abs(netto)),
-                    richtung_netto,
-                    beschreibung,
-                    datum
-                ])
-            else:
-                # Nutzer/Fonds: mit Kontostand alt/neu
-                output_rows.append([
-                    von,
-                    an,
-                    format_zahl(abs(brutto)),
-                    richtung_brutto,
-                    format_zahl(abs(netto)),
-                    richtung_netto,
-                    beschreibung,
-                    datum,
-                    konto_alt,
-                    konto_neu
-                ])
-
-    # === CSV-Export erstellen ===
-    si = io.StringIO()
-    cw = csv.writer(si, quoting=csv.QUOTE_ALL)
-
-    if session["user"] != "admin":
-        for konto in eigene_konten:
-            cw.writerow(["Kontostand", f"{konto}:", format_zahl(konto_stand[konto])])
-        cw.writerow([])
-
-    # Tabellenkopf
-    if session["user"] == "admin":
-        # Admin: ohne Kontostand-Spalten
-        cw.writerow(["Von", "An", "Brutto", "", "Netto", "", "Zweck", "Datum"])
+            if von in eigene_konten:
+                richtung_brutto = symbol_abgang
+            if an in eigene_konten:
+                richtung_netto = symbol_zugang
+
+        zeile = [von, an, format_zahl(abs(brutto)), richtung_brutto,
+                 format_zahl(abs(netto)), richtung_netto, beschreibung, datum]
+        if ist_admin:
+            # Admin: ohne Kontostand-Spalten
+            return zeile
+        # Nutzer/Fonds: mit Kontostand alt/neu
+        return zeile + [konto_alt, konto_neu]
+
+    def json_objekt(row):
+        (tx_id, _key, von, an, brutto, kultur, netto, beschreibung, datum,
+         v_alt, v_neu, a_alt, a_neu) = row
+        stand_alt, stand_neu = eigener_stand(von, an, v_alt, v_neu, a_alt, a_neu)
+        return {"id": tx_id, "von": von, "an": an, "brutto": punkte(brutto), "kulturbeitrag": punkte(kultur),
+                "netto": punkte(netto), "beschreibung": beschreibung, "datum": datum,
+                "stand_alt": punkte(stand_alt), "stand_neu": punkte(stand_neu)}
+
+    def ausgabe(rows, next_cursor=None):
+        if format_ == "json":
+            yield '{"transaktionen": ['
+            for i, row in enumerate(rows):
+                yield ("," if i else "") + json.dumps(json_objekt(row), ensure_ascii=False)
+            yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+            return
+        yield csv_kopf()
+        output_rows = []
+        for row in rows:
+            output_rows.append(csv_zeile(row))
+            if len(output_rows) >= EXPORT_BATCH_SIZE:
+                yield _csv_zeilen(output_rows)
+                output_rows = []
+        if output_rows:
+            yield _csv_zeilen(output_rows)
+
+    if format_ == "json":
+        mimetype, headers = "application/json", {}
     else:
-        # Nutzer/Kulturfonds wie bisher
-        if is_fonds_only:
-            cw.writerow(["Von", "An", "Betrag", "", "Zweck", "Datum", "Kontostand alt", "Kontostand neu"])
-        else:
-            cw.writerow(["Von", "An", "Brutto", "", "Netto", "", "Zweck", "Datum", "Kontostand alt", "Kontostand neu"])
-
-    cw.writerows(output_rows)
-    conn.close()
-
-    return Response(si.getvalue(), mimetype='text/csv',
-                    headers={"Content-Disposition": "attachment; filename=transaktionen.csv"})
+        mimetype = "text/csv"
+        headers = {"Content-Disposition": "attachment; filename=transaktionen.csv"}
+
+    if limit is None:
+        # Alles: direkt aus dem Cursor streamen
+        rows = iter_transaktionen(conn, where_sql, params, EXPORT_SPALTEN_STAND, nach=nach, quellen=quellen)
+        return Response(stream_with_context(ausgabe(rows)), mimetype=mimetype, headers=headers)
+
+    # Eine Seite: begrenzt, daher vorab lesen, um den Folge-Cursor in den Header zu schreiben
+    seite = list(itertools.islice(
+        iter_transaktionen(conn, where_sql, params, EXPORT_SPALTEN_STAND,
+                           batch_size=min(limit + 1, EXPORT_BATCH_SIZE), nach=nach, quellen=quellen),
+        limit + 1))
+    next_cursor = None
+    if len(seite) > limit:
+        seite = seite[:limit]
+        next_cursor = encode_export_cursor(seite[-1][1], seite[-1][0])
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(ausgabe(seite, next_cursor), mimetype=mimetype, headers=headers)
 
 @app.route('/export_monatsbericht')
 def export_monatsbericht():
     if 'user' not in session:
         return redirect('/')
 
-    conn = db_connection()
+    conn = get_db()
     c = conn.cursor()
 
-    # Zeitraum: laufendes Jahr
+    # Zeitraum: laufendes Jahr, oder from/to wie bei /export
     now = datetime.now()
-    year_start = f"{now.year}-01-01 00:00:00"
-    year_end   = f"{now.year}-12-31 23:59:59"
+    year_start = _parse_zeitpunkt(request.args["from"]) if request.args.get("from") else f"{now.year}-01-01 00:00:00"
+    year_end   = _parse_zeitpunkt(request.args["to"], ende_des_tages=True) if request.args.get("to") else f"{now.year}-12-31 23:59:59"
 
     # Welche Konten gehören dem Nutzer?
+    # Gruppiert und summiert wird in SQL (Zehntel, exakt); nach Python kommt je Monat eine Zeile.
     if session["user"] == "admin":
-        c.execute("SELECT name FROM konten")
-        eigene_konten = [r[0] for r in c.fetchall()]
-        scope_sql = "datum BETWEEN ? AND ?"
-        scope_params = (year_start, year_end)
+        eigene_konten = []
+        # Admin = neutral beide Seiten summieren:
+        # Brutto ist "Abgang" beim Sender, Netto ist "Zugang" beim Empfänger
+        summen_sql = "SUM(ABS(COALESCE(netto, 0))), SUM(ABS(COALESCE(brutto, 0)))"
+        summen_params = ()
+        scope_sql = "substr(datum, 1, 7) BETWEEN ? AND ? AND datum BETWEEN ? AND ?"
+        scope_params = (year_start[:7], year_end[:7], year_start, year_end)
     else:
         c.execute("""
             SELECT k.name
@@ -1138,52 +1758,34 @@ def export_monatsbericht():
         eigene_konten = [r[0] for r in c.fetchall()]
 
         placeholders = ",".join("?" for _ in eigene_konten)
+        # Nutzer = nur eigene Perspektive
+        summen_sql = f"""
+            SUM(CASE WHEN an IN ({placeholders}) THEN ABS(COALESCE(netto, 0)) ELSE 0 END),
+            SUM(CASE WHEN von IN ({placeholders}) THEN ABS(COALESCE(brutto, 0)) ELSE 0 END)
+        """
+        summen_params = (*eigene_konten, *eigene_konten)
         # Kultur-Autobuchungen für Nicht-Admin ausklammern wie in /start
         scope_sql = f"""
-            datum BETWEEN ? AND ? AND beschreibung != '[Kulturbeitrag automatisch]'
+            substr(datum, 1, 7) BETWEEN ? AND ? AND datum BETWEEN ? AND ?
+            AND beschreibung != '[Kulturbeitrag automatisch]'
             AND (von IN ({placeholders}) OR an IN ({placeholders}))
         """
-        scope_params = (year_start, year_end, *eigene_konten, *eigene_konten)
-
-    # Monats-Aggregation initialisieren
-    from collections import defaultdict
-    agg = defaultdict(lambda: {"einnahmen": 0.0, "ausgaben": 0.0, "kultur": 0.0})
-
-    # Relevante Transaktionen holen (immer die 11-Spalten-Variante, Fallback via Helper)
-    rows = _select_transaktionen(c, scope_sql, scope_params, limit=10_000)
-
-    # Helper: Monats-Key
-    def month_key_from_ts(ts):
-        try:
-            return datetime.strptime(ts, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m")
-        except:
-            # Falls Format mal anders ist
-            return ts[:7]
-
-    # Durchgehen und klassifizieren
-    for (von, an, brutto, kulturbeitrag, netto, beschreibung, datum,
-         v_alt, v_neu, a_alt, a_neu) in rows:
-
-        mk = month_key_from_ts(datum)
-
-        # Kulturbeiträge zählen wir separat (die "5 %")
-        if kulturbeitrag and kulturbeitrag != 0:
-            agg[mk]["kultur"] += float(kulturbeitrag)
-
-        # Aus Sicht: Admin = neutral beide Seiten summieren
-        # Nutzer = nur eigene Perspektive
-        if session["user"] == "admin":
-            # Brutto ist "Abgang" beim Sender, Netto ist "Zugang" beim Empfänger
-            if brutto:
-                agg[mk]["ausgaben"] += abs(float(brutto))
-            if netto:
-                agg[mk]["einnahmen"] += abs(float(netto))
-        else:
-            # Nur Bewegungen, die eigene Konten betreffen
-            if von in eigene_konten and brutto:
-                agg[mk]["ausgaben"] += abs(float(brutto))
-            if an in eigene_konten and netto:
-                agg[mk]["einnahmen"] += abs(float(netto))
+        scope_params = (year_start[:7], year_end[:7], year_start, year_end, *eigene_konten, *eigene_konten)
+
+    # Kulturbeiträge zählen wir separat (die "5 %"). Archive enden am Jahresende,
+    # ein Monat liegt also immer ganz in einer Quelle.
+    monate = []
+    for quelle in transaktions_quellen(conn, year_start, year_end):
+        _, quelle_sql, quelle_params, _ = quelle
+        with archiv.lesen(conn, quelle) as tabelle:
+            c.execute(f"""
+                SELECT substr(datum, 1, 7) AS monat, {summen_sql}, SUM(COALESCE(kulturbeitrag, 0))
+                FROM {tabelle}
+                WHERE {scope_sql}{f" AND {quelle_sql}" if quelle_sql else ""}
+                GROUP BY substr(datum, 1, 7)
+                ORDER BY monat
+            """, (*summen_params, *scope_params, *quelle_params))
+            monate += c.fetchall()
 
     # CSV bauen
     import csv, io
@@ -1194,229 +1796,35 @@ def export_monatsbericht():
     cw.writerow([])
     cw.writerow(["Monat", "Einnahmen (Netto)", "Ausgaben (Brutto)", "Kulturbeiträge", "Saldo (Einnahmen - Ausgaben)"])
 
-    for mk in sorted(agg.keys()):
-        e = round(agg[mk]["einnahmen"], 1)
-        a = round(agg[mk]["ausgaben"], 1)
-        k = round(agg[mk]["kultur"], 1)
-        s = round(e - a, 1)
-        cw.writerow([mk, e, a, k, s])
+    for mk, e, a, k in monate:
+        cw.writerow([mk] + [zehntel.als_punkte(x) for x in (e, a, k, e - a)])
 
-    conn.close()
     return Response(si.getvalue(), mimetype='text/csv',
                     headers={"Content-Disposition": "attachment; filename=monatsbericht.csv"})
 
 @app.route("/system")
 def system():
-    conn = db_connection()
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT name, typ FROM konten WHERE typ IN ('betrieb', 'verein') ORDER BY name ASC")
     empfaenger = c.fetchall()
-    conn.close()
 
     # Brotpreis für den Punkte-Rechner laden
     brotpreis, _ts = get_brotpreis_eur_pro_punkt()
     
-    return render_template_string('''
-    <!doctype html>
-    <html lang="de">
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <title>Wieshof – Verrechnungssystem</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-        <style>
-            body { color:#333; }
-
-            /* Obere Empfänger-Buttons */
-            .btn-rostbraun {
-                background-color: #f9ece4;
-                color: #333;
-                border: 1px solid #e7d5c9;
-                width: 100%;
-            }
-            .btn-col { margin-bottom: 1rem; }
-
-            /* Untere Info-Boxen */
-            .cta-card{
-              border: none;
-              background: #f9f9f9;
-              border-radius: 12px;
-              box-shadow: 0 1px 2px rgba(0,0,0,.05);
-              padding: 16px;
-              min-height: 220px;          /* gleiche Höhe */
-              display: flex;
-              flex-direction: column;
-            }
-            .cta-card h4{ margin-bottom: .5rem; }
-            .cta-card p{  margin-bottom: .75rem; }
-
-            /* Buttons in den Boxen */
-            .btn-cta{
-              width: 100%;
-              border-radius: 12px;
-              padding: .75rem 1rem;
-              font-weight: 600;
-            }
-
-            .btn-link-clean {
-                background: none;
-                border: none;
-                color: #333;
-                text-decoration: none;
-                font-size: 1.05rem;
-                padding: 0;
-            }
-            .btn-link-clean:hover {
-                text-decoration: underline;
-                color: #000;
-            }
-        </style>
-    </head>
-    <body class="container py-5">
-
-    {{ banner|safe }}
-
-    <h2 class="mb-4">Hier kannst du loslegen</h2>
-    <hr class="mb-5">
-    
-    <!-- Zahlung starten -->
-    <div class="mt-2 mb-5">
-        <h4>Zahlung starten</h4>
-        <p class="mb-3">Wähle einen Empfänger (Betrieb oder Verein):</p>
-        <div class="row">
-            {% for name, typ in empfaenger %}
-              <div class="col-12 col-sm-6 col-md-4 btn-col">
-                <a href="/start?an={{ name | urlencode }}" class="btn btn-rostbraun btn-lg">
-                  {{ name }}
-                </a>
-              </div>
-            {% endfor %}
-        </div>
-    </div>
-
-    <hr class="mb-5">
-
-    <!-- Drei Boxen unten -->
-    <div class="row mt-5">
-      <div class="col-md-4 mb-4">
-        <div class="cta-card">
-          <h4>Unterstütze die Gemeinschaft</h4>
-          <p>Hier kannst du freiwillig Punkte an den Kulturfonds überweisen.</p>
-          <div class="mt-auto">
-            <a href="/fonds" class="btn btn-success btn-cta">Kulturfonds</a>
-          </div>
-        </div>
-      </div>
-
-      <div class="col-md-4 mb-4">
-        <div class="cta-card">
-            <h4>Zu meinen Konten</h4>
-            <p>Hier kannst du Überweisungen tätigen, deinen Kontostand einsehen und deine Transaktionen verwalten.</p>
-
-            <!-- Login-Formular direkt hier -->
-            <form method="post" action="/login" class="mt-auto">
-            <div class="mb-3">
-                <label for="benutzer" class="form-label">Benutzername:</label>
-                <input type="text" class="form-control" id="benutzer" name="benutzer" required>
-            </div>
-            <div class="mb-3">
-                <label for="passwort" class="form-label">Passwort:</label>
-                <input type="password" class="form-control" id="passwort" name="passwort" required>
-            </div>
-            <button type="submit" class="btn btn-primary w-100">Login</button>
-            </form>
-        </div>
-      </div>
-
-      <div class="col-md-4 mb-4">
-        <div class="cta-card">
-          <h4>Punkte-Rechner</h4>
-          <p>Rechne Punkte in Euro – oder Euro in Punkte.</p>
-
-          <div class="mb-2">
-            <label class="form-label">Punkte → Euro</label>
-            <input type="number" step="0.01" id="punkteInput" class="form-control">
-            <div id="punkteZuEuro" class="form-text text-muted"></div>
-          </div>
-
-          <div class="mb-2">
-            <label class="form-label">Euro → Punkte</label>
-            <input type="number" step="0.01" id="euroInput" class="form-control">
-            <div id="euroZuPunkte" class="form-text text-muted"></div>
-          </div>
-        </div>
-      </div>
-    </div>
-
-    <!-- Zurück-Button -->
-    <hr class="mb-4">
-    <div class="text-center">
-      <a href="/" class="btn-link-clean">← Zurück zur Infoseite</a>
-    </div>
-    
-    <script>
-        const BP = (function(){
-            try { return parseFloat({{ brotpreis|tojson }}); } catch(e) { return 8.38; }
-        })();
-
-        const $ = (id) => document.getElementById(id);
-        const toNum = (v) => parseFloat(String(v || "").replace(",", ".").trim());
-
-        function liveCalc(inputId, outputId, calc) {
-            const inp = $(inputId), out = $(outputId);
-            if (!inp || !out) return;
-            const render = () => {
-              const n = toNum(inp.value);
-              out.textContent = (!isNaN(n) && n > 0) ? calc(n) : "";
-            };
-            inp.addEventListener("input", render);
-            render();
-        }
-
-        liveCalc("punkteInput", "punkteZuEuro", (p) => `≈ ${(p * BP).toFixed(2)} €`);
-        liveCalc("euroInput",   "euroZuPunkte", (e) => `≈ ${(e / BP).toFixed(2)} Punkte`);
-    </script>
-
-    </body>
-    </html>
-    ''', empfaenger=empfaenger, brotpreis=brotpreis, banner=render_banner(load_status()))
+    return render_template("system.html", empfaenger=empfaenger, brotpreis=brotpreis, banner=status_datei.banner())
 
 @app.route("/brotpreis/refresh")
 def brotpreis_refresh():
     """
-    Holt manuell den €/kg-Preis. Ergebnis:
-    - Wenn ein Preis gefunden wird -> Wert + Zeitstempel aktualisieren.
-    - Wenn KEIN Preis gefunden wird -> nur den Zeitstempel aktualisieren (Wert bleibt).
-    - Wenn es einen Fehler gibt (kein Internet etc.) -> ebenfalls nur Zeitstempel aktualisieren.
+    Stößt den Abruf des €/kg-Preises im Hintergrund an (siehe brotpreis_aktualisieren)
+    und kehrt sofort zurück. Mehrfache Klicks werden zusammengefasst.
     """
-    url = "https://xn--bcker-schren-shop-qqb87b.de/produkt/bio-vollwertbrot/bio-vollwert-dinkelbrot/"
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        text = soup.get_text(" ", strip=True)
-
-        # Robusteres Muster: erlaubt "/kg", "pro kg", "je kg", optional "1 kg"
-        m = re.search(r"(\d+[.,]\d+)\s*€\s*(?:/|pro|je)\s*(?:1\s*)?kg", text, re.IGNORECASE)
-
-        if m:
-            raw = m.group(1).replace(".", "").replace(",", ".")  # "8,38" -> "8.38"
-            eur_pro_kg = float(raw)
-            set_brotpreis_eur_pro_punkt(eur_pro_kg, source_label="Bäckerei Schüren (Web)")
-        else:
-            # Kein Treffer -> Zeitstempel trotzdem erneuern (Wert unverändert)
-            current, _ = get_brotpreis_eur_pro_punkt()
-            set_brotpreis_eur_pro_punkt(current, source_label="Refresh (unverändert)")
-
-    except Exception:
-        # Fehler (z. B. kein Internet) -> Zeitstempel trotzdem erneuern
-        current, _ = get_brotpreis_eur_pro_punkt()
-        set_brotpreis_eur_pro_punkt(current, source_label="Refresh (Fehler, Wert unverändert)")
+    brotpreis_aktualisierer.anstossen()
 
     # Zurück zur Systemseite
     return redirect(request.args.get("back") or request.referrer or url_for("system"))
-    
+
 @app.route("/brotpreis/admin", methods=["GET", "POST"])
 def brotpreis_admin():
     # nur Admin
@@ -1438,261 +1846,357 @@ def brotpreis_admin():
             pass
 
     # Formular anzeigen
-    return render_template_string("""
-    <!doctype html>
-    <html lang="de">
-    <head>
-      <meta charset="utf-8">
-      <meta name="viewport" content="width=device-width, initial-scale=1">
-      <title>Brotpreis (Admin)</title>
-      <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    </head>
-    <body class="container py-4" style="max-width:720px;">
-      <h2 class="mb-3">Brotpreis manuell setzen</h2>
-      <p class="text-muted">
-        Aktuell: <strong>{{ '%.2f' % aktueller_preis }} €</strong> pro kg (Stand: {{ ts }})
-      </p>
-
-      <form method="post" class="mt-3">
-        <div class="mb-3">
-          <label class="form-label">Neuer Preis in € pro kg</label>
-          <input type="text" name="eur_pro_kg" class="form-control" placeholder="z. B. 8,40" required>
-          <div class="form-text">Komma oder Punkt sind ok.</div>
-        </div>
-        <button class="btn btn-primary w-100" type="submit">Speichern</button>
-      </form>
+    return render_template("brotpreis_admin.html", aktueller_preis=aktueller_preis, ts=ts)
+
+# Nur für den lokalen Prometheus: mit METRICS_TOKEN per "Authorization: Bearer …",
+# sonst nur von localhost.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+def _monate_zwischen(von, bis):
+    y1, m1 = map(int, von.split('-'))
+    y2, m2 = map(int, bis.split('-'))
+    return (y2 * 12 + m2) - (y1 * 12 + m1)
+
+@app.route("/metrics")
+def metrics():
+    # Ohne METRICS_TOKEN gesperrt: hinter einem Reverse-Proxy kommt jede Anfrage von 127.0.0.1
+    if not METRICS_TOKEN or not secrets.compare_digest(request.headers.get("Authorization", ""),
+                                                       f"Bearer {METRICS_TOKEN}"):
+        abort(403)
 
-      <p class="mt-4 text-center">
-        <a class="btn btn-link" href="{{ url_for('system') }}">← Zur Systemseite</a>
-      </p>
-    </body>
-    </html>
-    """, aktueller_preis=aktueller_preis, ts=ts)
+    # Rückstand der Parkgebühr: erledigte Monate bis zum Vormonat (0 = aktuell)
+    letzter = get_systemstatus(get_db(), 'last_fee_month')
+    ziel = previous_month_key(datetime.now())
+    rueckstand = max(0, _monate_zwischen(letzter, ziel)) if letzter else float("nan")
+    text = metriken.ausgabe([
+        ("verrechnung_parkgebuehr_rueckstand_monate",
+         "Monate zwischen last_fee_month und dem Vormonat (NaN: noch nie gelaufen)", rueckstand),
+    ])
+    return Response(text, content_type=metriken.CONTENT_TYPE_LATEST)
 
 @app.route("/")
 def startseite():
     # Brotpreis + Zeitstempel für das Template bereitstellen
     brotpreis, brotpreis_ts = get_brotpreis_eur_pro_punkt()
 
-    return render_template_string("""
-    <!doctype html>
-    <html lang="de">
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <title>Wieshof – Verrechnungssystem</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-        <style>
-        /* Grundfarbe etwas weicher */
-        body { background:#fff; color:#3f3f3f; }
-
-        .content{
-            max-width:880px;
-            margin:40px auto 52px auto;
-            padding:0 24px;
-        }
-
-        /* Globale Überschriften (Abschnittstitel) */
-        h1, h2 { font-weight:600; }
-        h1{
-            font-size:1.9rem;
-            margin-top:3rem;
-            margin-bottom:.6rem;
-            color:#2f2f2f; /* kräftig, aber nicht tiefschwarz */
-        }
-        h2{
-            font-size:1.28rem;
-            margin:2rem 0 1rem 0;
-            color:#2f2f2f; /* wie Haupttitel */
-        }
-
-        /* Fließtext */
-        p{
-            font-size:1.12rem;
-            line-height:1.75;
-            margin-bottom:.9rem;
-            text-align:justify;
-        }
-
-        /* Brotpreis-Hinweis */
-        .hint{
-            background:#f8f9fa;
-            border-left:4px solid #e2e6ea;
-            padding:.55rem .8rem;
-            color:#6c757d;
-            font-size:.96rem;
-            font-style:italic;
-            border-radius:.25rem;
-            margin:.35rem 0 1rem 0;
-        }
-
-        /* Links im Fließtext */
-        .link-plain{
-            background:none; border:none; padding:0;
-            color:#0d47a1; text-decoration:none; font:inherit;
-        }
-        .link-plain:hover{ text-decoration:underline; color:#08306b; }
-
-        /* Begrüßung (kleiner, dezenter) */
-        .page-title{
-            font-size:1.6rem;
-            font-weight:600;
-            margin-top:3rem;
-            margin-bottom:.9rem;
-            text-align:left;
-            color:#2f2f2f; /* bewusst heller als Text/H2 */
-        }
-
-        /* Hauptfokus: "Unser Verrechnungssystem" */
-        .page-subtitle{
-            font-size:1.9rem;
-            font-weight:700;
-            text-align:left;          /* linksbündig */
-            margin:.4rem 0 1.6rem 0;
-            color:#0d47a1 !important;    /* gleiche Farbe wie Fließtext – wirkt harmonisch */
-        }
-        </style>
-    </head>
-    <body>
-        <main class="content">
-
-            <h1 class="page-title">Willkommen am Wieshof</h1>
-            <div class="page-subtitle">Unser Verrechnungssystem</div>
-            <p>
-                Der Wieshof ist mehr als nur ein landwirtschaftlicher Betrieb – 
-                er ist ein Ort, an dem persönliche Freiheit, gemeinsames Gestalten und gegenseitige Unterstützung zusammenfinden.
-            </p>
-
-            <p>
-                Damit unsere Gemeinschaft lebendig bleibt, haben wir ein eigenes Verrechnungssystem geschaffen. 
-                Es ermöglicht uns, unsere Zusammenarbeit eigenständig zu organisieren und Produkte, Dienstleistungen, Schenkungen und Leihgaben fair und transparent miteinander auszutauschen – unabhängig vom Euro.
-            </p>
-            </p>
-
-            <h2>So funktioniert es</h2>
-            <p>Die Verrechnungseinheit ist einfach: 1 Punkt entspricht dem Wert von 1&nbsp;kg Bio-Dinkelbrot.</p>
-
-            <!-- Brotpreis-Hinweis als dezente Box -->
-            <div class="hint">
-              1&nbsp;Punkt ≈ {{ '%.2f' % brotpreis }}&nbsp;€
-              <span class="text-muted"> (Stand: {{ brotpreis_ts[:16] }}, Quelle: Bäcker Schüren)</span>
-              &nbsp;·&nbsp;
-              <a href="/brotpreis/refresh?back=/" class="link-plain">Preis aktualisieren</a>
-            </div>
-
-            <p>
-                Bei jeder Transaktion – ob Kauf, Verleih oder Schenkung – fließen 5&nbsp;% in unseren Kulturfonds.
-                Diese werden dem Empfänger abgezogen und unterstützen so direkt Bildung, Kultur und gemeinschaftliche Projekte am Hof.
-            </p>
-            <p>
-                Zum Beispiel bezahlt derjenige, der eine Dienstleistung in Anspruch nimmt, 100 Punkte.
-                Derjenige, der die Dienstleistung erbringt, erhält 95 Punkte, und 5 Punkte gehen automatisch an den Kulturfonds.
-            </p>
-            <p>
-                Alle Konten zusammengerechnet ergeben immer 0 Punkte
-                <em>(anhand unseres Beispiels würde das so aussehen: –100, +95 und +5 = 0)</em>.
-            </p>
-
-            <h2>Warum das System lebendig bleibt</h2>
-            <p>
-                Für alle Konten, die im Plus stehen, wird am Monatsende 1&nbsp;% Parkgebühr abgezogen und dem Kulturfonds gutgeschrieben.
-                So entsteht ein Anreiz, die Punkte im Umlauf zu halten – entweder durch Ausgeben, Verleihen oder Verschenken.
-            </p>
-
-            <h2>Punkte verleihen</h2>
-            <p>
-                Mitglieder mit vielen Punkten können diese an andere verleihen, die sie für Projekte oder Investitionen benötigen.
-                Auch hier werden 5&nbsp;% an den Kulturfonds abgeführt, Zinsen fallen dabei nicht an.
-            </p>
-
-            <h2>Unsere Vision</h2>
-            <p>
-                Dieses System kann wachsen: Mehrere Höfe oder Regionen können sich zusammenschließen und gemeinsam eine
-                nachhaltige Wirtschaftsregion aufbauen – am besten in Form einer Genossenschaft.
-            </p>
-
-            <hr class="my-4">
-            <div class="text-center">
-                <a href="/system" class="link-plain" style="font-size:1.25rem;">→ Zum Verrechnungssystem</a>
-            </div>
-
-        </main>
-    </body>
-    </html>
-    """, brotpreis=brotpreis, brotpreis_ts=brotpreis_ts)
-
-def get_config_value(key, default=None):
-    conn = sqlite3.connect("verrechnung.db")
+    return render_template("startseite.html", brotpreis=brotpreis, brotpreis_ts=brotpreis_ts)
+
+# --- Datenzugriff -----------------------------------------------------------
+# Alle Helfer arbeiten auf einer übergebenen Verbindung (im Request: get_db()),
+# damit eine Buchung auf einer Verbindung und in einer Transaktion läuft.
+
+def get_systemstatus(conn, key, default=None):
     c = conn.cursor()
     c.execute("SELECT value FROM systemstatus WHERE key = ?", (key,))
     row = c.fetchone()
-    conn.close()
-    return float(row[0]) if row else default
+    return row[0] if row else default
+
+def get_config_value(conn, key, default=None):
+    if key in KONFIG_SCHLUESSEL:
+        value = einstellungen.werte(conn)["konfig"].get(key)
+    else:
+        value = get_systemstatus(conn, key)
+    return float(value) if value is not None else default
 
-def has_positive_balance(name):
+def has_positive_balance(conn, name):
     """Check if account is currently >= 0"""
-    conn = sqlite3.connect("verrechnung.db")
+    # Stand aus der stand_*-Kette wie überall sonst – eine eigene Summenformel
+    # verlor Zeilen ohne Empfänger (an IS NULL) und zählte Brutto statt Netto
+    jetzt = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return balance_as_of(conn, name, jetzt) >= 0
+
+# Einkommen im Sinne der Überziehungsregel: alle Eingänge außer Parkgebühr-,
+# Kulturfonds- und Saldovortrag-Buchungen. Die Bedingung steht hier und in
+# zaehlt_als_einkommen().
+EINKOMMEN_SQL = ("beschreibung NOT LIKE '[Parkgebühr%' AND beschreibung NOT LIKE '[Kulturfonds%' "
+                 "AND beschreibung NOT LIKE '[Saldovortrag%'")
+
+def zaehlt_als_einkommen(beschreibung):
+    if beschreibung is None:
+        return False  # wie NOT LIKE auf NULL in SQL
+    kopf = beschreibung.lower()
+    return not kopf.startswith(("[parkgebühr", "[kulturfonds", "[saldovortrag"))
+
+def buche_einkommen(conn, an, betrag, beschreibung, datum):
+    """Schreibt eine neue Buchung ins Jahreseinkommen fort (gleiche Transaktion wie die Buchung)."""
+    if not an or not zaehlt_als_einkommen(beschreibung):
+        return
+    conn.execute("""
+        INSERT INTO einkommen_jahr (konto, jahr, summe) VALUES (?, ?, ?)
+        ON CONFLICT(konto, jahr) DO UPDATE SET summe = summe + excluded.summe
+    """, (an, datum[:4], betrag))
+
+def _einkommen_aus_hauptbuch(c):
+    c.execute("DELETE FROM einkommen_jahr")
+    c.execute(f"""
+        INSERT INTO einkommen_jahr (konto, jahr, summe)
+        SELECT an, substr(datum, 1, 4), SUM(betrag)
+        FROM transaktionen
+        WHERE an IS NOT NULL AND {EINKOMMEN_SQL}
+        GROUP BY an, substr(datum, 1, 4)
+    """)
+
+def einkommen_neu_aufbauen(conn):
+    """Baut einkommen_jahr komplett aus dem Hauptbuch neu auf."""
     c = conn.cursor()
-    c.execute("""
-        SELECT ROUND(
-            SUM(
-                CASE
-                    WHEN t.an = ? THEN t.betrag
-                    WHEN t.von = ? THEN -t.betrag
-                    ELSE 0
-                END
-            ), 1
-        )
-        FROM transaktionen t
-    """, (name, name))
-    saldo = c.fetchone()[0] or 0
-    conn.close()
-    return saldo >= 0
+    schreibsperre_holen(c, "einkommen")
+    try:
+        _einkommen_aus_hauptbuch(c)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
-def ytd_income(name, year=None):
-    """Sum of incoming transactions this year (excl. Parkgebühr/Kulturfonds)"""
+def ytd_income(conn, name, year=None):
+    """Sum of incoming transactions this year in tenths (excl. Parkgebühr/Kulturfonds/Saldovortrag)"""
     if year is None:
         from datetime import date
         year = date.today().year
-    conn = sqlite3.connect("verrechnung.db")
     c = conn.cursor()
-    c.execute("""
-        SELECT ROUND(COALESCE(SUM(betrag),0),1)
-        FROM transaktionen
-        WHERE an = ?
-          AND strftime('%Y', datum) = ?
-          AND beschreibung NOT LIKE '[Parkgebühr%'
-          AND beschreibung NOT LIKE '[Kulturfonds%'
-    """, (name, str(year)))
-    total = c.fetchone()[0] or 0
-    conn.close()
-    return total
+    c.execute("SELECT summe FROM einkommen_jahr WHERE konto = ? AND jahr = ?",
+              (name, f"{int(year):04d}"))
+    row = c.fetchone()
+    return (row[0] or 0) if row else 0
 
-def overdraft_limit(name):
-    """Calculate current overdraft allowance for account"""
-    start_allowance = get_config_value("overdraft_start_allowance", 20)
-    percent = get_config_value("overdraft_income_percent", 10)
+def overdraft_limit(conn, name):
+    """Calculate current overdraft allowance for account (in tenths; config values are in points)"""
+    start_allowance = get_config_value(conn, "overdraft_start_allowance", 20)
+    percent = get_config_value(conn, "overdraft_income_percent", 10)
 
     # Einkommen im laufenden Jahr
-    income = ytd_income(name)
+    income = ytd_income(conn, name)
 
     # Start-Regel: solange Einkommen = 0 (noch keine Einnahme)
     if income <= 0:
-        return start_allowance
+        return zehntel.aus_punkten(start_allowance)
 
     # Ab hier gilt die 10%-Regel, sobald es mal Einnahmen gab
-    return round(income * (percent/100.0), 1)
+    return zehntel.anteil(income, percent)
+
+@app.cli.command("datenbank-einrichten")
+def datenbank_einrichten_command():
+    """Legt das Schema an und spielt fehlende Migrationen ein (vor dem Start der App)."""
+    erstelle_datenbank()
+    conn = db_connection()
+    print(f"[schema] Version {get_schema_version(conn.cursor())}")
+    conn.close()
+
+@app.cli.command("einkommen-neu-aufbauen")
+def einkommen_neu_aufbauen_command():
+    """Baut die Tabelle einkommen_jahr aus allen Transaktionen neu auf."""
+    erstelle_datenbank()
+    conn = db_connection()
+    einkommen_neu_aufbauen(conn)
+    anzahl = conn.execute("SELECT COUNT(*) FROM einkommen_jahr").fetchone()[0]
+    conn.close()
+    print(f"[einkommen] neu aufgebaut: {anzahl} Einträge (Konto, Jahr)")
+
+@app.cli.command("passwoerter-hashen")
+def passwoerter_hashen_command():
+    """Ersetzt alle noch im Klartext gespeicherten Passwörter durch Hashes."""
+    erstelle_datenbank()
+    conn = db_connection()
+    c = conn.cursor()
+    c.execute("SELECT benutzer, passwort FROM benutzer")
+    offen = [(b, p) for b, p in c.fetchall() if p is not None and not passwoerter.ist_hash(p)]
+    c.executemany("UPDATE benutzer SET passwort = ? WHERE benutzer = ?",
+                  [(passwoerter.hash_erzeugen(p), b) for b, p in offen])
+    conn.commit()
+    conn.close()
+    print(f"[login] {len(offen)} Klartext-Passwörter gehasht")
+
+@app.cli.command("brotpreis-aktualisieren")
+def brotpreis_aktualisieren_command():
+    """Holt den Brotpreis einmal synchron (z. B. per Cron statt über /brotpreis/refresh)."""
+    erstelle_datenbank()
+    brotpreis_aktualisieren()
+
+class JahresabschlussFehler(Exception):
+    """Das Jahr kann (noch) nicht abgeschlossen werden."""
+
+def jahresabschluss(conn, jahr, jetzt=None):
+    """
+    Lagert alle Transaktionen bis Ende 'jahr' nach verrechnung_<jahr>.db aus
+    (archiv.py) und ersetzt sie im Hauptbuch durch je einen Saldovortrag pro
+    Konto mit Stand != 0. Das Jahr muss vorbei und seine Dezember-Parkgebühr
+    gebucht sein. Erhöht die Hauptbuch-Generation (nächste Sicherung voll).
+    Liefert (archivierte Zeilen, Saldovorträge, Archivdatei).
+    """
+    if jetzt is None:
+        jetzt = datetime.now()
+    jahr = int(jahr)
+    bis = eom_cutoff(f"{jahr}-12")
+    if jahr >= jetzt.year:
+        raise JahresabschlussFehler(f"{jahr} ist noch nicht vorbei")
+    abschluesse = archiv.eintraege(conn)
+    if abschluesse and abschluesse[-1][0] >= jahr:
+        raise JahresabschlussFehler(f"{jahr} ist bereits archiviert (letzter Abschluss: {abschluesse[-1][0]})")
+    last_done = get_systemstatus(conn, 'last_fee_month')
+    if last_done is None or last_done < f"{jahr}-12":
+        # sonst fehlte dem Gebühren-Job der Dezember-Stand aus dem Hauptbuch
+        raise JahresabschlussFehler(f"Parkgebühr für {jahr}-12 ist noch nicht gebucht (last_fee_month={last_done})")
+    offen = conn.execute("SELECT COUNT(*) FROM transaktionen WHERE datum <= ? AND von IS NOT ?",
+                         (bis, archiv.SALDOVORTRAG)).fetchone()[0]
+    if not offen:
+        raise JahresabschlussFehler(f"Keine Transaktionen bis Ende {jahr} im Hauptbuch")
+
+    # Stände am Jahresende aller Konten (ein Durchlauf, ab dem Novemberabschluss falls vorhanden)
+    staende = berechne_monatsabschluesse(conn, [f"{jahr}-12"])[f"{jahr}-12"]
+
+    datei = archiv.datei_name(DB_PATH, jahr)
+    pfad = archiv.datei_pfad(DB_PATH, datei)
+    zeilen, max_id = archiv.schreiben(conn, pfad, bis)
+
+    beschreibung = f"[Saldovortrag {jahr}]"
+    vortraege = [(archiv.SALDOVORTRAG, name, stand, 0, stand, stand, beschreibung, bis, 0, 0, 0, stand)
+                 for name, stand in staende.items() if stand]
+    c = conn.cursor()
+    schreibsperre_holen(c, "jahresabschluss")
+    try:
+        # bis 'bis' wird nicht mehr gebucht – sicherheitshalber prüfen, dass das Archiv vollständig ist
+        c.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM transaktionen WHERE datum <= ? AND von IS NOT ?",
+                  (bis, archiv.SALDOVORTRAG))
+        if c.fetchone() != (zeilen, max_id):
+            raise JahresabschlussFehler(f"Hauptbuch bis {bis} hat sich beim Archivieren geändert")
+        # auch die Saldovorträge eines früheren Abschlusses: ersetzt durch die neuen
+        c.execute("DELETE FROM transaktionen WHERE datum <= ?", (bis,))
+        c.executemany(TRANSAKTION_INSERT_SQL, vortraege)
+        c.execute("INSERT INTO archive (jahr, datei, bis, zeilen, max_id, erstellt) VALUES (?, ?, ?, ?, ?, ?)",
+                  (jahr, datei, bis, zeilen, max_id, jetzt.strftime('%Y-%m-%d %H:%M:%S')))
+        c.execute("""
+            INSERT INTO systemstatus (key, value) VALUES (?, '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """, (sicherung.GENERATION_KEY,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        # Hauptbuch unverändert – die Kopie wieder verwerfen
+        os.remove(pfad)
+        raise
+    return zeilen, len(vortraege), datei
+
+@app.cli.command("jahresabschluss")
+@click.argument("jahr", type=int)
+@click.option("--vacuum", is_flag=True, help="Datei danach verkleinern (sperrt Schreiber für die Dauer).")
+def jahresabschluss_command(jahr, vacuum):
+    """Lagert JAHR (und ältere, noch nicht archivierte Jahre) nach verrechnung_<JAHR>.db aus."""
+    erstelle_datenbank()
+    conn = db_connection()
+    try:
+        try:
+            zeilen, vortraege, datei = jahresabschluss(conn, jahr)
+        except (JahresabschlussFehler, FileExistsError) as e:
+            raise click.ClickException(str(e))
+        print(f"[archiv] {jahr}: {zeilen} Transaktionen nach {datei}, {vortraege} Saldovorträge")
+        if vacuum:
+            # Ohne VACUUM werden die frei gewordenen Seiten nur wiederverwendet
+            vorher = os.path.getsize(DB_PATH)
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            print(f"[archiv] VACUUM: {vorher // 1024} KiB -> {os.path.getsize(DB_PATH) // 1024} KiB")
+    finally:
+        conn.close()
+
+# Fertige Vollsicherungen von "flask backup-erstellen"; Standard: sicherungen/ neben der DB
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "sicherungen")
+
+@app.cli.command("backup-erstellen")
+@click.option("--behalten", type=click.IntRange(min=1), default=3, show_default=True,
+              help="So viele Vollsicherungen im Ordner lassen, ältere löschen.")
+def backup_erstellen_command(behalten):
+    """Schreibt eine Vollsicherung nach BACKUP_DIR (per Cron, z. B. nachts) für /admin/download-db."""
+    conn = db_connection()
+    try:
+        pfad = sicherung.vollsicherung_schreiben(conn, BACKUP_DIR, datetime.now().strftime('%Y%m%d-%H%M%S'))
+    finally:
+        conn.close()
+    print(f"[sicherung] {pfad} ({os.path.getsize(pfad) // 1024} KiB)")
+    for alt in sicherung.alte_entfernen(BACKUP_DIR, behalten):
+        print(f"[sicherung] {alt} gelöscht")
 
 @app.route("/admin/download-db")
 def download_db():
+    """
+    Sicherung der Datenbank, gzip-komprimiert (siehe sicherung.py).
+      token – BACKUP_TOKEN
+      (ohne) – die neueste Vollsicherung von "flask backup-erstellen"
+      seit  – Sicherungs-Token einer früheren Sicherung: nur das Inkrement als SQL-Skript
+      archiv – Jahr: die Archivdatei dieses Jahresabschlusses (ändert sich nicht mehr)
+    Das Token für die nächste Sicherung steht im Header X-Backup-Token.
+    """
     token = request.args.get("token", "")
     expected = os.getenv("BACKUP_TOKEN", "")
-    if not expected or token != expected:
+    if not expected or not secrets.compare_digest(token, expected):
         abort(403)
-    db_path = os.path.join(os.path.dirname(__file__), "verrechnung.db")
-    if not os.path.exists(db_path):
-        abort(404)
-    return send_file(db_path, as_attachment=True, download_name="verrechnung.db")
+
+    if request.args.get("archiv"):
+        row = get_db().execute("SELECT datei FROM archive WHERE jahr = ?",
+                               (request.args.get("archiv", type=int),)).fetchone()
+        pfad = archiv.datei_pfad(DB_PATH, row[0]) if row else None
+        if pfad is None or not os.path.exists(pfad):
+            abort(404)
+        return Response(sicherung.gzip_strom(sicherung.datei_bloecke(pfad)), mimetype="application/gzip",
+                        headers={"Content-Disposition": f"attachment; filename={row[0]}.gz"})
+
+    seit = request.args.get("seit")
+    if not seit:
+        # Schnappschuss im Request würde bei großem Hauptbuch den Worker-Timeout reißen
+        fertig = sicherung.vollsicherungen(BACKUP_DIR)
+        if not fertig:
+            abort(503, description="Noch keine Vollsicherung – zuerst \"flask backup-erstellen\" ausführen (Cron)")
+        pfad, neues_token = fertig[-1]
+        resp = send_file(pfad, mimetype="application/gzip", as_attachment=True,
+                         download_name=os.path.basename(pfad))
+        resp.headers["X-Backup-Token"] = neues_token
+        return resp
+
+    zeit = datetime.now().strftime('%Y%m%d-%H%M%S')
+    conn = db_connection(check_same_thread=False)
+    # Stand und Inkrement aus derselben Lesetransaktion
+    try:
+        conn.execute("BEGIN")
+        aktuell = sicherung.stand(conn)
+        teile = sicherung.inkrement(conn, seit, aktuell)
+    except sicherung.TokenUngueltig as e:
+        conn.close()
+        abort(409, description=str(e))
+    except Exception:
+        conn.close()
+        raise
+
+    def bloecke_lesen():
+        try:
+            for teil in teile:
+                yield teil.encode("utf-8")
+        finally:
+            conn.close()
+
+    resp = Response(sicherung.gzip_strom(bloecke_lesen()), mimetype="application/gzip",
+                    headers={"Content-Disposition": f"attachment; filename=verrechnung-{zeit}-inkrement.sql.gz",
+                             "X-Backup-Token": sicherung.token_bilden(aktuell)})
+    # auch wenn der Download abbricht oder der Strom nie startet (dann läuft kein finally);
+    # doppeltes close() schadet nicht
+    resp.call_on_close(conn.close)
+    return resp
+
+@app.cli.command("backup-einspielen")
+@click.argument("datei")
+@click.argument("inkremente", nargs=-1)
+def backup_einspielen_command(datei, inkremente):
+    """Spielt Inkremente (…-inkrement.sql.gz) der Reihe nach in eine entpackte Vollsicherung ein."""
+    if not os.path.exists(datei):
+        raise click.ClickException(f"{datei} gibt es nicht")
+    conn = sqlite3.connect(datei)
+    try:
+        for pfad in inkremente:
+            try:
+                sicherung.einspielen(conn, pfad)
+            except sqlite3.IntegrityError as e:
+                raise click.ClickException(f"{pfad} passt nicht auf den Stand "
+                                           f"{sicherung.token_bilden(sicherung.stand(conn))} ({e})")
+            print(f"[sicherung] {pfad} eingespielt, Stand {sicherung.token_bilden(sicherung.stand(conn))}")
+    finally:
+        conn.close()
 
 
 if __name__ == '__main__':
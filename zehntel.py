@@ -0,0 +1,37 @@
+# zehntel.py — Punktbeträge als ganze Zehntel
+#
+# konten.punkte, alle Beträge und stand_*-Spalten in transaktionen sowie die
+# abgeleiteten Tabellen speichern ganze Zahlen: 1,5 Punkte = 15. Umgerechnet
+# wird nur an den Rändern – Formulareingabe, Anzeige, Export.
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+FAKTOR = 10
+
+def _runden(d):
+    return int(d.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def aus_punkten(wert):
+    """Punkte (Formularwert "1,5"/"1.5", float, int) -> Zehntel, kaufmännisch gerundet."""
+    if isinstance(wert, str):
+        wert = wert.strip().replace(",", ".")
+    elif isinstance(wert, float):
+        wert = repr(wert)  # kürzeste Darstellung: 0.1 bleibt 0.1
+    try:
+        return _runden(Decimal(wert) * FAKTOR)
+    except InvalidOperation:
+        raise ValueError(f"Kein gültiger Punktbetrag: {wert!r}")
+
+def als_punkte(zehntel):
+    """Zehntel -> Punkte als float (Anzeige in Vorlagen, JSON)."""
+    return zehntel / FAKTOR
+
+def anteil(zehntel, prozent):
+    """prozent % eines Betrags, auf ganze Zehntel gerundet (halbe Zehntel aufrunden)."""
+    return _runden(Decimal(zehntel) * Decimal(str(prozent)) / 100)
+
+def text(zehntel):
+    """Deutsche Schreibweise ohne überflüssige Nachkommastelle: 12, 12,5, -0,3."""
+    vorzeichen = "-" if zehntel < 0 else ""
+    ganz, rest = divmod(abs(zehntel), FAKTOR)
+    return f"{vorzeichen}{ganz}" if rest == 0 else f"{vorzeichen}{ganz},{rest}"